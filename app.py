@@ -12,7 +12,10 @@ from dotenv import load_dotenv
 
 # 导入 Sprint 1 和 Sprint 2 的核心模块
 from src.tiktok_fetcher import TikTokFetcher
-from src.video_analyzer import VideoAnalyzer
+from src.video_analyzer import VideoAnalyzer, GEMINI_MODEL_NAME
+from src.result_cache import AnalysisCache
+from src.analysis_store import get_analysis_store
+from src.json_stream import JSONStreamError
 
 # 加载环境变量
 load_dotenv()
@@ -132,12 +135,30 @@ st.markdown("""
 # ---------------------------------------------------------
 # 3. Session State 初始化
 # ---------------------------------------------------------
-if 'analysis_history' not in st.session_state:
-    st.session_state.analysis_history = []
-
 if 'current_result' not in st.session_state:
     st.session_state.current_result = None
 
+@st.cache_resource
+def get_analysis_cache():
+    """进程内共享的分析结果缓存（所有会话共用；本页面总是上传完整视频，按 video 模式计算指纹）"""
+    return AnalysisCache(model_name=GEMINI_MODEL_NAME, analysis_mode='video')
+
+analysis_cache = get_analysis_cache()
+
+# 分析历史持久化到本地 SQLite（所有会话共用，刷新页面或重启后保留；ANALYSIS_STORE=off 时不保存）
+analysis_store = get_analysis_store()
+
+def load_history_report(record_id: int):
+    """从分析历史中加载一份报告作为当前结果"""
+    record = analysis_store.get(record_id=record_id)
+    if record:
+        st.session_state.current_result = {
+            'video_data': record['metadata'],
+            'analysis': record['analysis'],
+            'transcript': record['transcript'] or [],
+            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record['created_at']))
+        }
+
 # ---------------------------------------------------------
 # 4. Sidebar (侧边栏 - 历史记录)
 # ---------------------------------------------------------
@@ -152,10 +173,17 @@ with st.sidebar:
     
     st.divider()
     
-    # 历史记录
-    if st.session_state.analysis_history:
-        for i, item in enumerate(reversed(st.session_state.analysis_history[-5:])):
-            st.text(f"• {item['author']} - {item['timestamp']}")
+    # 历史记录（点击加载报告）
+    history = analysis_store.recent(5) if analysis_store else []
+    if history:
+        for item in history:
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item['created_at']))
+            st.button(
+                f"• {item['author'] or 'unknown'} - {timestamp}",
+                key=f"history_{item['id']}",
+                on_click=load_history_report,
+                args=(item['id'],)
+            )
     else:
         st.text("No analysis yet")
 
@@ -188,6 +216,10 @@ if analyze_btn:
         st.error("❌ 请在侧边栏配置 Apify API Token")
     elif not gemini_key and not gemini_base:
         st.error("❌ 请至少配置 Gemini API Key 或 API Base URL 之一")
+    elif (cached_report := analysis_cache.get(video_url, kind='report')) is not None:
+        # 命中缓存：跳过元数据获取、下载、转录和 AI 分析
+        st.session_state.current_result = cached_report
+        st.success("⚡ 已从缓存加载该视频的分析报告")
     else:
         try:
             # 创建统一进度条
@@ -222,12 +254,11 @@ if analyze_btn:
             time.sleep(0.3)
             
             # 提取音频并转录
-            status_text.info("🎵 分析中... 正在提取音频")
+            status_text.info("🎵 分析中... 正在提取音频并转录语音")
             progress_bar.progress(55)
             try:
-                audio_path = analyzer.extract_audio(video_path)
-                status_text.info("🎬 分析中... 正在转录语音")
-                transcript = analyzer.transcribe_audio(audio_path)
+                # 流式转录：边解码音频边上传，不生成中间 MP3 文件
+                transcript = analyzer.transcribe_video(video_path)
             except Exception as e:
                 print(f"⚠️ 转录失败: {str(e)}")
                 transcript = []
@@ -259,38 +290,20 @@ Then analyze it according to the framework provided.
 
 Return your analysis in valid JSON format ONLY (no markdown, no explanations).
 """
-            response = analyzer.model.generate_content([video_file, combined_prompt])
+            # 流式生成：每个顶层字段生成完毕即解析，实时显示进度
+            # 解析器兼容纯 JSON、Markdown 代码块和带说明文字的响应
+            def on_section(key, value):
+                status_text.info(f"🤖 分析中... 已完成 {key}")
             
-            # 解析 JSON 响应
-            # Gemini 可能返回的格式:
-            # 1. 纯 JSON: {"video_structure": ...}
-            # 2. Markdown 代码块: ```json\n{...}\n```
-            # 3. 带文字说明: Here is the analysis:\n{...}
-            
-            response_text = response.text.strip()
-            
-            # 尝试提取 JSON
             try:
-                # 方法 1: 直接解析
-                analysis_result = json.loads(response_text)
-            except json.JSONDecodeError:
-                # 方法 2: 提取 Markdown 代码块中的 JSON
-                import re
-                json_match = re.search(r'```(?:json)?\s*({.*?})\s*```', response_text, re.DOTALL)
-                if json_match:
-                    analysis_result = json.loads(json_match.group(1))
-                else:
-                    # 方法 3: 查找第一个 { 和最后一个 }
-                    start_idx = response_text.find('{')
-                    end_idx = response_text.rfind('}')
-                    if start_idx != -1 and end_idx != -1:
-                        json_str = response_text[start_idx:end_idx+1]
-                        analysis_result = json.loads(json_str)
-                    else:
-                        # 如果都失败，显示原始响应
-                        st.error("❌ AI 返回的内容不是有效的 JSON 格式")
-                        st.text_area("原始响应", response_text, height=300)
-                        st.stop()
+                analysis_result = analyzer.generate_analysis(
+                    video_file, combined_prompt, on_section=on_section
+                )
+            except JSONStreamError as e:
+                # 如果都失败，显示原始响应
+                st.error("❌ AI 返回的内容不是有效的 JSON 格式")
+                st.text_area("原始响应", e.text, height=300)
+                st.stop()
             
             progress_bar.progress(90)
             status_text.success("✅ AI 分析完成")
@@ -308,12 +321,18 @@ Return your analysis in valid JSON format ONLY (no markdown, no explanations).
                 'timestamp': time.strftime("%Y-%m-%d %H:%M:%S")
             }
             
+            # 写入缓存，下次分析同一视频时直接复用
+            analysis_cache.set(video_url, full_report, kind='report')
+            
+            # 写入检索索引（SEARCH_INDEX 开启时）
+            analyzer.index_analysis(video_url, analysis_result, transcript)
+            
+            # 写入分析历史
+            if analysis_store:
+                analysis_store.append(video_url, analysis_result, video_data, transcript, source='streamlit')
+            
             # 保存到 session state
             st.session_state.current_result = full_report
-            st.session_state.analysis_history.append({
-                'author': video_data['author'],
-                'timestamp': full_report['timestamp']
-            })
             
             progress_bar.progress(100)
             status_text.success("✅ 分析完成！报告已生成")
@@ -108,7 +108,130 @@ with st.sidebar:
         st.text("No analysis yet")
 
 # ---------------------------------------------------------
-# 6. Main Content
+# 6. 辅助函数
+# ---------------------------------------------------------
+
+# 流水线阶段的显示名称
+STAGE_LABELS = {
+    'metadata': '📥 Fetching video data',
+    'download': '⬇️ Downloading video',
+    'upload': '☁️ Uploading to Gemini',
+    'transcribe': '🎤 Transcribing speech',
+    'generate': '🤖 AI analyzing',
+}
+
+def iter_sse_events(response):
+    """
+    解析后端返回的 Server-Sent Events，逐条产出 (event, data)
+    """
+    event, data_lines = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            # 空行表示一条事件结束
+            if data_lines:
+                yield event or 'message', json.loads('\n'.join(data_lines))
+            event, data_lines = None, []
+        elif line.startswith(':'):
+            continue  # 心跳注释
+        elif line.startswith('event:'):
+            event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            data_lines.append(line[len('data:'):].lstrip())
+
+def render_partial(metadata, transcript, sections):
+    """渲染分析过程中已收到的部分结果"""
+    if metadata:
+        st.markdown(f"**👤 {metadata.get('author', 'N/A')}** — {metadata.get('description', 'N/A')[:100]}")
+    if transcript:
+        with st.expander(f"🎤 Transcript ({len(transcript)})", expanded=False):
+            for item in sorted(transcript, key=lambda t: t.get('timestamp', '')):
+                st.markdown(f"**[{item.get('timestamp', '00:00')}]** {item.get('text', '')}")
+    for key, value in sections.items():
+        with st.expander(f"✅ {key}", expanded=False):
+            if isinstance(value, str):
+                st.markdown(value)
+            else:
+                st.json(value)
+
+def render_result(result):
+    """渲染完整的分析结果"""
+    st.divider()
+    
+    # 左右两栏
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        st.subheader("📊 Video Metadata")
+        metadata = result['metadata']
+        
+        st.markdown(f"""
+        <div class="metric-card">
+            <h4>👤 {metadata.get('author', 'N/A')}</h4>
+            <p><strong>Description:</strong> {metadata.get('description', 'N/A')[:100]}...</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # 互动数据
+        col_a, col_b = st.columns(2)
+        with col_a:
+            st.metric("👍 Likes", f"{metadata.get('likes', 0):,}")
+            st.metric("💬 Comments", f"{metadata.get('comments', 0):,}")
+        with col_b:
+            st.metric("👁️ Views", f"{metadata.get('views', 0):,}")
+            st.metric("🔄 Shares", f"{metadata.get('shares', 0):,}")
+    
+    with col2:
+        st.subheader("🤖 AI Analysis")
+        
+        analysis = result['analysis']
+        
+        # Tab 页面
+        tab1, tab2, tab3, tab4 = st.tabs(["翻拍脚本", "逻辑拆解", "口播文稿", "原始数据"])
+        
+        with tab1:
+            if 'lazada_adaptation_brief' in analysis:
+                st.markdown(analysis['lazada_adaptation_brief'])
+        
+        with tab2:
+            if 'structure_breakdown' in analysis:
+                st.json(analysis['structure_breakdown'])
+        
+        with tab3:
+            transcript = result.get('transcript') or []
+            if transcript:
+                for item in transcript:
+                    st.markdown(f"**[{item.get('timestamp', '00:00')}]** {item.get('text', '')}")
+            else:
+                st.text("未检测到语音内容")
+        
+        with tab4:
+            st.json(analysis)
+    
+    # 下载按钮
+    st.divider()
+    col_d1, col_d2 = st.columns(2)
+    
+    with col_d1:
+        st.download_button(
+            label="📥 Download JSON Report",
+            data=json.dumps(result, indent=2, ensure_ascii=False),
+            file_name=f"analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+    
+    with col_d2:
+        if 'lazada_adaptation_brief' in analysis:
+            st.download_button(
+                label="📄 Download Script (Markdown)",
+                data=analysis['lazada_adaptation_brief'],
+                file_name=f"script_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                mime="text/markdown"
+            )
+
+# ---------------------------------------------------------
+# 7. Main Content
 # ---------------------------------------------------------
 
 st.markdown("<h1 style='text-align: center;'>🛍️ E-Com Video Insider</h1>", unsafe_allow_html=True)
@@ -130,96 +253,80 @@ if st.button("🚀 Analyze Now"):
         st.error("❌ 请输入视频 URL")
     else:
         try:
-            # 调用后端 API
-            headers = {"Authorization": f"Bearer {user_token}"}
-            payload = {"video_url": video_url}
+            # 调用后端流式 API（SSE），边分析边显示进度和部分结果
+            headers = {"Authorization": f"Bearer {user_token}", "Accept": "text/event-stream"}
+            payload = {"video_url": video_url, "include_transcript": True}
             
-            # 阶段 1: 发送请求
-            with st.spinner("📥 Step 1/3: Fetching video data..."):
-                response = requests.post(
-                    f"{BACKEND_API_URL}/api/analyze",
-                    json=payload,
-                    headers=headers,
-                    timeout=180  # 3 分钟超时
-                )
+            response = requests.post(
+                f"{BACKEND_API_URL}/api/analyze/stream",
+                json=payload,
+                headers=headers,
+                stream=True,
+                timeout=(10, 60)  # 连接超时 10 秒；后端每 15 秒发送心跳，60 秒无数据视为超时
+            )
             
             if response.status_code == 200:
-                result = response.json()
+                response.encoding = 'utf-8'
+                status = st.status("🚀 Analyzing...", expanded=True)
+                progress_placeholder = st.empty()
+                partial_placeholder = st.empty()
                 
-                st.success("✅ Analysis complete!")
+                metadata, transcript, sections = None, [], {}
+                result, error = None, None
                 
-                # 保存结果
-                st.session_state.current_result = result
-                st.session_state.analysis_history.append({
-                    'author': result['metadata'].get('author', 'Unknown'),
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M")
-                })
+                with response:
+                    for event, data in iter_sse_events(response):
+                        if event == 'stage':
+                            label = STAGE_LABELS.get(data['stage'], data['stage'])
+                            if data['status'] == 'started':
+                                status.update(label=f"{label}...")
+                            else:
+                                status.write(f"{label} ✅")
+                                if data['stage'] == 'download':
+                                    progress_placeholder.empty()
+                        elif event == 'download':
+                            downloaded = data.get('downloaded_bytes') or 0
+                            total = data.get('total_bytes')
+                            if total:
+                                progress_placeholder.progress(
+                                    min(downloaded / total, 1.0),
+                                    text=f"⬇️ {downloaded / 1024 ** 2:.1f} / {total / 1024 ** 2:.1f} MB"
+                                )
+                        elif event == 'upload':
+                            status.write(f"☁️ Gemini file state: {data['state']}")
+                        elif event == 'metadata':
+                            metadata = data
+                        elif event == 'transcript':
+                            transcript.extend(data['segments'])
+                        elif event == 'analysis_section':
+                            sections[data['key']] = data['value']
+                        elif event == 'result':
+                            result = data
+                        elif event == 'error':
+                            error = data.get('detail', '未知错误')
+                        
+                        if event in ('metadata', 'transcript', 'analysis_section'):
+                            with partial_placeholder.container():
+                                render_partial(metadata, transcript, sections)
                 
-                # 显示结果
-                st.divider()
-                
-                # 左右两栏
-                col1, col2 = st.columns([1, 1])
-                
-                with col1:
-                    st.subheader("📊 Video Metadata")
-                    metadata = result['metadata']
-                    
-                    st.markdown(f"""
-                    <div class="metric-card">
-                        <h4>👤 {metadata.get('author', 'N/A')}</h4>
-                        <p><strong>Description:</strong> {metadata.get('description', 'N/A')[:100]}...</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # 互动数据
-                    col_a, col_b = st.columns(2)
-                    with col_a:
-                        st.metric("👍 Likes", f"{metadata.get('likes', 0):,}")
-                        st.metric("💬 Comments", f"{metadata.get('comments', 0):,}")
-                    with col_b:
-                        st.metric("👁️ Views", f"{metadata.get('views', 0):,}")
-                        st.metric("🔄 Shares", f"{metadata.get('shares', 0):,}")
+                progress_placeholder.empty()
+                partial_placeholder.empty()
                 
-                with col2:
-                    st.subheader("🤖 AI Analysis")
-                    
-                    analysis = result['analysis']
-                    
-                    # Tab 页面
-                    tab1, tab2, tab3 = st.tabs(["翻拍脚本", "逻辑拆解", "原始数据"])
-                    
-                    with tab1:
-                        if 'lazada_adaptation_brief' in analysis:
-                            st.markdown(analysis['lazada_adaptation_brief'])
+                if result:
+                    status.update(label="✅ Analysis complete!", state="complete", expanded=False)
                     
-                    with tab2:
-                        if 'structure_breakdown' in analysis:
-                            st.json(analysis['structure_breakdown'])
+                    # 保存结果
+                    st.session_state.current_result = result
+                    st.session_state.analysis_history.append({
+                        'author': result['metadata'].get('author', 'Unknown'),
+                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M")
+                    })
                     
-                    with tab3:
-                        st.json(analysis)
-                
-                # 下载按钮
-                st.divider()
-                col_d1, col_d2 = st.columns(2)
-                
-                with col_d1:
-                    st.download_button(
-                        label="📥 Download JSON Report",
-                        data=json.dumps(result, indent=2, ensure_ascii=False),
-                        file_name=f"analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                        mime="application/json"
-                    )
-                
-                with col_d2:
-                    if 'lazada_adaptation_brief' in analysis:
-                        st.download_button(
-                            label="📄 Download Script (Markdown)",
-                            data=analysis['lazada_adaptation_brief'],
-                            file_name=f"script_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
-                            mime="text/markdown"
-                        )
+                    # 显示结果
+                    render_result(result)
+                else:
+                    status.update(label="❌ Analysis failed", state="error")
+                    st.error(f"❌ {error or '连接中断，未收到分析结果'}")
             
             elif response.status_code == 401:
                 st.error("❌ 无效的访问令牌，请检查你的 Access Token")
@@ -236,7 +343,7 @@ if st.button("🚀 Analyze Now"):
             st.error(f"❌ 发生错误: {str(e)}")
 
 # ---------------------------------------------------------
-# 7. Footer
+# 8. Footer
 # ---------------------------------------------------------
 st.divider()
 st.markdown(
@@ -3,20 +3,38 @@ E-Com Video Insider - 后端 API
 使用 FastAPI 封装第三方 API 调用，保护 API Keys
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl
 import os
 import sys
-from typing import Optional
+import uuid
+import asyncio
+from typing import Optional, List
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import json
+import math
 
 # 添加父目录到路径以导入 src 模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.tiktok_fetcher import TikTokFetcher
 from src.video_analyzer import VideoAnalyzer
+from src.result_cache import AnalysisCache
+from src.pipeline import AsyncVideoPipeline
+from src.batch_runner import BatchRunner, stage_limits_from_env
+from src.paths import get_data_dir
+from src.file_waiter import get_file_waiter
+from src.remote_file_registry import get_remote_file_registry
+from src.download_cache import get_download_cache
+from src.format_policy import get_format_stats
+from src.job_queue import JobQueue, JobWorkerPool, JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED
+from src.rate_limiter import RateLimiter, QuotaStore, get_upstream_limiter
+from src.upstream_governor import governor_stats
+from src.search_index import FIELD_NAMES, SEARCH_MODES
 
 # ---------------------------------------------------------
 # 1. FastAPI 应用初始化
@@ -46,6 +64,26 @@ GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "")
 if not APIFY_API_TOKEN or not GEMINI_API_KEY:
     raise ValueError("必须设置 APIFY_API_TOKEN 和 GEMINI_API_KEY 环境变量")
 
+# 流水线中阻塞调用（Apify / yt-dlp / Gemini 上传）使用的共享线程池
+pipeline_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_MAX_WORKERS", "64")),
+    thread_name_prefix="video-pipeline"
+)
+
+# 进程级共享的 Fetcher / Analyzer / 流水线（底层客户端由 src.clients 复用，不再每个请求重建）
+fetcher = TikTokFetcher(api_token=APIFY_API_TOKEN)
+analyzer = VideoAnalyzer(
+    api_key=GEMINI_API_KEY,
+    api_base=GEMINI_API_BASE if GEMINI_API_BASE else None
+)
+# 各阶段并发名额由所有请求和批量任务共享（PIPELINE_*_CONCURRENCY，默认同批量分析）
+pipeline = AsyncVideoPipeline(
+    fetcher, analyzer, executor=pipeline_executor, stage_limits=stage_limits_from_env()
+)
+
+# 分析结果缓存（进程内共享，持久化到本地 SQLite；指纹包含分析器的分析模式）
+analysis_cache = AnalysisCache.for_analyzer(analyzer)
+
 # ---------------------------------------------------------
 # 3. 用户认证与配额管理
 # ---------------------------------------------------------
@@ -56,21 +94,40 @@ API_USERS = {
         "username": "demo_user",
         "email": "demo@example.com",
         "quota_monthly": 100,
-        "quota_used": 0,
         "rate_limit_per_minute": 10
     },
     "premium_token_456": {
         "username": "premium_user",
         "email": "premium@example.com",
         "quota_monthly": 1000,
-        "quota_used": 0,
         "rate_limit_per_minute": 30
     }
 }
 
+# 每个 Token 一个令牌桶（按 rate_limit_per_minute 限流）
+rate_limiter = RateLimiter()
+
+# 月度配额计数（内存计数，后台批量写入 SQLite，重启后恢复）
+quota_store = QuotaStore()
+
+def quota_remaining(user: dict) -> int:
+    """用户本月剩余配额"""
+    return max(user["quota_monthly"] - quota_store.used(user["username"]), 0)
+
+def consume_quota(user: dict, amount: int = 1):
+    """
+    预扣配额（检查与扣除是原子的），不足时返回 429
+    """
+    if not quota_store.try_consume(user["username"], user["quota_monthly"], amount):
+        remaining = quota_remaining(user)
+        raise HTTPException(
+            status_code=429,
+            detail=f"剩余配额不足（剩余 {remaining} 次，本次需要 {amount} 次）"
+        )
+
 def get_current_user(authorization: Optional[str] = Header(None)):
     """
-    验证用户的 API Token
+    验证用户的 API Token，并按 rate_limit_per_minute 限流
     """
     if not authorization:
         raise HTTPException(status_code=401, detail="缺少 Authorization header")
@@ -83,13 +140,27 @@ def get_current_user(authorization: Optional[str] = Header(None)):
     
     user = API_USERS[token]
     
-    # 检查配额
-    if user["quota_used"] >= user["quota_monthly"]:
+    # 检查请求频率
+    allowed, retry_after = rate_limiter.check(token, user["rate_limit_per_minute"])
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"请求过于频繁（每分钟最多 {user['rate_limit_per_minute']} 次）",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+    
+    return user
+
+def get_quota_user(user: dict = Depends(get_current_user)):
+    """
+    提交分析的接口使用：在 get_current_user 的基础上检查月度配额
+    （查询状态、获取结果、取消任务等接口不受配额限制）
+    """
+    if quota_store.used(user["username"]) >= user["quota_monthly"]:
         raise HTTPException(
             status_code=429, 
             detail=f"已达到月度配额限制 ({user['quota_monthly']} 次)"
         )
-    
     return user
 
 # ---------------------------------------------------------
@@ -106,6 +177,21 @@ class AnalyzeRequest(BaseModel):
             }
         }
 
+class StreamAnalyzeRequest(AnalyzeRequest):
+    include_transcript: bool = True
+
+class BatchAnalyzeRequest(BaseModel):
+    video_urls: List[HttpUrl]
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "video_urls": [
+                    "https://www.tiktok.com/@5.minute.recipes/video/7588608011745250591"
+                ]
+            }
+        }
+
 class AnalyzeResponse(BaseModel):
     success: bool
     metadata: dict
@@ -128,6 +214,10 @@ def root():
         "status": "running",
         "endpoints": {
             "analyze": "/api/analyze",
+            "analyze_stream": "/api/analyze/stream",
+            "analyze_batch": "/api/analyze/batch",
+            "jobs": "/api/jobs",
+            "search": "/api/search",
             "health": "/health",
             "user_info": "/api/user"
         }
@@ -141,7 +231,24 @@ def health_check():
     return {
         "status": "healthy",
         "apify_configured": bool(APIFY_API_TOKEN),
-        "gemini_configured": bool(GEMINI_API_KEY)
+        "gemini_configured": bool(GEMINI_API_KEY),
+        "analysis_cache": analysis_cache.stats(),
+        "gemini_file_waiter": get_file_waiter().stats(),
+        "gemini_file_registry": get_remote_file_registry().stats(),
+        "download_cache": get_download_cache().stats() if get_download_cache() else None,
+        "request_coalescing": pipeline.coalescing_stats(),
+        "jobs": job_queue.stats(),
+        "job_workers": job_workers.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "upstream_limits": get_upstream_limiter().stats(),
+        "gemini_governor": governor_stats(),
+        "gemini_pool": analyzer.gemini_pool.stats(),
+        "video_preprocess": analyzer.preprocessor.stats() if analyzer.preprocessor else None,
+        "ytdlp_formats": get_format_stats().stats(),
+        "local_features": analyzer.feature_extractor.stats() if analyzer.feature_extractor else None,
+        "near_duplicates": analyzer.duplicate_index.stats() if analyzer.duplicate_index else None,
+        "search_index": analyzer.search_index.stats() if analyzer.search_index else None,
+        "analysis_store": pipeline.store.stats() if pipeline.store else None
     }
 
 @app.get("/api/user")
@@ -153,15 +260,15 @@ def get_user_info(user: dict = Depends(get_current_user)):
         "username": user["username"],
         "email": user["email"],
         "quota_monthly": user["quota_monthly"],
-        "quota_used": user["quota_used"],
-        "quota_remaining": user["quota_monthly"] - user["quota_used"],
+        "quota_used": quota_store.used(user["username"]),
+        "quota_remaining": quota_remaining(user),
         "rate_limit_per_minute": user["rate_limit_per_minute"]
     }
 
 @app.post("/api/analyze", response_model=AnalyzeResponse)
-def analyze_video(
+async def analyze_video(
     request: AnalyzeRequest,
-    user: dict = Depends(get_current_user)
+    user: dict = Depends(get_quota_user)
 ):
     """
     分析 TikTok/Instagram/YouTube Shorts 视频
@@ -171,52 +278,451 @@ def analyze_video(
     try:
         print(f"📊 用户 {user['username']} 请求分析视频: {request.video_url}")
         
-        # 1. 获取视频元数据（使用 Apify）
-        print("📥 Step 1: 获取视频元数据...")
-        fetcher = TikTokFetcher(api_token=APIFY_API_TOKEN)
-        video_data = fetcher.fetch_video_data(str(request.video_url))
+        # 0. 优先查询分析结果缓存（命中时不消耗配额，也不访问任何外部 API）
+        cached = await run_in_threadpool(analysis_cache.get, str(request.video_url), kind='api_report')
+        if cached is not None:
+            return AnalyzeResponse(
+                success=True,
+                metadata=cached['metadata'],
+                analysis=cached['analysis'],
+                timestamp=datetime.now().isoformat(),
+                quota_remaining=quota_remaining(user)
+            )
         
-        # 2. 下载视频并分析（使用 Gemini）
-        print("🤖 Step 2: 下载视频并分析...")
-        analyzer = VideoAnalyzer(
-            api_key=GEMINI_API_KEY,
-            api_base=GEMINI_API_BASE if GEMINI_API_BASE else None
-        )
-        
-        # 使用 yt-dlp 下载视频
-        video_path = analyzer.download_video_with_ytdlp(str(request.video_url))
-        
-        # 上传到 Gemini 并分析
-        video_file = analyzer.upload_to_gemini(video_path)
-        prompt = "Please analyze this video according to the framework provided in your system instructions."
-        response = analyzer.model.generate_content([video_file, prompt])
-        
-        # 解析 JSON 响应
-        analysis_result = json.loads(response.text)
+        # 1. 预扣配额（并发请求不会超出月度配额），分析失败时退还
+        consume_quota(user)
+        try:
+            # 2. 获取元数据（Apify）与下载视频（yt-dlp）并发执行，然后上传到 Gemini 并分析
+            result = await pipeline.run(str(request.video_url))
+        except BaseException:
+            quota_store.refund(user["username"])
+            raise
         
-        # 清理临时文件
-        analyzer.cleanup_temp_file(video_path)
-        
-        # 3. 更新用户配额
-        user["quota_used"] += 1
-        quota_remaining = user["quota_monthly"] - user["quota_used"]
+        # 3. 写入缓存
+        await run_in_threadpool(
+            analysis_cache.set, str(request.video_url), result, kind='api_report'
+        )
         
-        print(f"✅ 分析完成！剩余配额: {quota_remaining}")
+        remaining = quota_remaining(user)
+        print(f"✅ 分析完成！剩余配额: {remaining}")
         
         return AnalyzeResponse(
             success=True,
-            metadata=video_data,
-            analysis=analysis_result,
+            metadata=result['metadata'],
+            analysis=result['analysis'],
             timestamp=datetime.now().isoformat(),
-            quota_remaining=quota_remaining
+            quota_remaining=remaining
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ 分析失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
+# SSE 心跳间隔（秒）：长时间没有事件时发送注释行，避免代理或客户端读超时
+SSE_KEEPALIVE_SECONDS = 15
+
+def _sse_event(event: str, data) -> str:
+    """格式化一条 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/api/analyze/stream")
+async def analyze_video_stream(
+    request: StreamAnalyzeRequest,
+    user: dict = Depends(get_quota_user)
+):
+    """
+    流式分析视频（Server-Sent Events）
+    
+    事件依次为：stage（阶段开始 / 完成）、metadata、download（下载字节数）、upload（上传状态）、
+    transcript（转录片段）、analysis_section（分析结果的顶层字段），最后是 result 或 error
+    """
+    video_url = str(request.video_url)
+    print(f"📊 用户 {user['username']} 请求流式分析视频: {video_url}")
+    
+    # 不需要转录时与 /api/analyze 共用缓存
+    cache_kind = 'stream_report' if request.include_transcript else 'api_report'
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def on_event(event: str, data):
+        # 流水线事件可能来自线程池，统一投递到事件循环
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+    
+    async def run_analysis():
+        try:
+            cached = await run_in_threadpool(analysis_cache.get, video_url, kind=cache_kind)
+            if cached is not None:
+                # 命中缓存：直接回放结果，不消耗配额
+                on_event('metadata', cached['metadata'])
+                for segment in cached.get('transcript') or []:
+                    on_event('transcript', {'segments': [segment]})
+                for key, value in cached['analysis'].items():
+                    on_event('analysis_section', {'key': key, 'value': value})
+                result, cached_hit = cached, True
+            else:
+                consume_quota(user)
+                try:
+                    result = await pipeline.run(
+                        video_url, on_event=on_event, transcribe=request.include_transcript
+                    )
+                except BaseException:
+                    quota_store.refund(user["username"])
+                    raise
+                await run_in_threadpool(analysis_cache.set, video_url, result, kind=cache_kind)
+                cached_hit = False
+            
+            on_event('result', {
+                "success": True,
+                "metadata": result['metadata'],
+                "analysis": result['analysis'],
+                "transcript": result.get('transcript'),
+                "cached": cached_hit,
+                "timestamp": datetime.now().isoformat(),
+                "quota_remaining": quota_remaining(user)
+            })
+            print(f"✅ 流式分析完成！剩余配额: {quota_remaining(user)}")
+        except HTTPException as e:
+            on_event('error', {"detail": e.detail})
+        except Exception as e:
+            print(f"❌ 流式分析失败: {str(e)}")
+            on_event('error', {"detail": f"分析失败: {str(e)}"})
+        finally:
+            on_event(None, None)
+    
+    async def event_stream():
+        task = asyncio.create_task(run_analysis())
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield _sse_event(event, data)
+        finally:
+            # 客户端断开时停止分析
+            if not task.done():
+                task.cancel()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ---------------------------------------------------------
+# 6. 批量分析
+# ---------------------------------------------------------
+
+# 单个批量任务最多包含的 URL 数
+MAX_BATCH_SIZE = 1000
+
+# 批量任务状态（进程内存储）
+BATCH_JOBS = {}
+
+async def _run_batch_job(job: dict, urls: List[str], user: dict):
+    """后台执行批量任务，逐条更新进度；提交时已预扣全部配额，命中缓存或失败的条目退还"""
+    def on_result(record: dict):
+        if record["status"] == "ok":
+            job["completed"] += 1
+            if record.get("cached"):
+                quota_store.refund(user["username"])
+        else:
+            job["failed"] += 1
+            quota_store.refund(user["username"])
+    
+    # 复用进程级流水线：共用线程池、请求合并、各阶段并发名额和分析结果存储，并发的批量任务不会叠加上游压力
+    runner = BatchRunner(
+        fetcher=fetcher,
+        analyzer=analyzer,
+        output_path=job["output_path"],
+        cache=analysis_cache,
+        on_result=on_result,
+        pipeline=pipeline
+    )
+    try:
+        await runner.run(urls)
+        job["status"] = "completed"
+    except Exception as e:
+        print(f"❌ 批量任务 {job['job_id']} 失败: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        runner.close()
+        if pipeline.store:
+            await run_in_threadpool(pipeline.store.flush)
+        # 任务中途失败时退还未处理条目的配额
+        unprocessed = job["total"] - job["completed"] - job["failed"]
+        if unprocessed > 0:
+            quota_store.refund(user["username"], unprocessed)
+        job["finished_at"] = datetime.now().isoformat()
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(
+    request: BatchAnalyzeRequest,
+    user: dict = Depends(get_quota_user)
+):
+    """
+    提交批量分析任务，立即返回 job_id
+    
+    使用 GET /api/analyze/batch/{job_id} 查询进度和结果
+    """
+    urls = list(dict.fromkeys(str(url) for url in request.video_urls))
+    if not urls:
+        raise HTTPException(status_code=400, detail="video_urls 不能为空")
+    if len(urls) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"单个批量任务最多 {MAX_BATCH_SIZE} 个 URL")
+    
+    consume_quota(user, len(urls))
+    
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "username": user["username"],
+        "status": "running",
+        "total": len(urls),
+        "completed": 0,
+        "failed": 0,
+        "created_at": datetime.now().isoformat(),
+        "finished_at": None,
+        "output_path": str(get_data_dir("batches") / f"{job_id}.jsonl"),
+    }
+    BATCH_JOBS[job_id] = job
+    # 保存任务引用，避免后台任务被垃圾回收
+    job["_task"] = asyncio.create_task(_run_batch_job(job, urls, user))
+    
+    print(f"📦 用户 {user['username']} 提交批量任务 {job_id}，共 {len(urls)} 个 URL")
+    return {"job_id": job_id, "status": job["status"], "total": job["total"]}
+
+@app.get("/api/analyze/batch/{job_id}")
+def get_batch_job(
+    job_id: str,
+    include_results: bool = False,
+    user: dict = Depends(get_current_user)
+):
+    """
+    查询批量任务进度，include_results=true 时附带已完成的结果
+    """
+    job = BATCH_JOBS.get(job_id)
+    if not job or job["username"] != user["username"]:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    response = {key: value for key, value in job.items() if not key.startswith("_") and key != "output_path"}
+    if include_results:
+        results = []
+        if os.path.exists(job["output_path"]):
+            with open(job["output_path"], "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        results.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        response["results"] = results
+    return response
+
+# ---------------------------------------------------------
+# 7. 持久化任务队列
+# ---------------------------------------------------------
+
+# 任务持久化在 SQLite 中，由独立的工作进程执行；API 进程重启不会丢失任务
+job_queue = JobQueue()
+job_workers = JobWorkerPool(db_path=job_queue.db_path)
+
+# 工作进程存活检查间隔（秒）
+JOB_SUPERVISE_INTERVAL = 30
+
+# 退还任务配额的检查间隔（秒）
+JOB_REFUND_INTERVAL = 5
+
+async def _supervise_workers():
+    """定期重新拉起意外退出的工作进程"""
+    while True:
+        await asyncio.sleep(JOB_SUPERVISE_INTERVAL)
+        job_workers.ensure_alive()
+
+def refund_finished_jobs():
+    """退还失败、已取消或命中结果缓存的任务预扣的配额（每个任务只退还一次）"""
+    for username in job_queue.claim_refunds():
+        quota_store.refund(username)
+
+async def _refund_jobs_periodically():
+    """任务由工作进程结束（重试耗尽、命中缓存），配额由 API 进程定期结算"""
+    while True:
+        await asyncio.sleep(JOB_REFUND_INTERVAL)
+        try:
+            await run_in_threadpool(refund_finished_jobs)
+        except Exception as e:
+            print(f"⚠️ 退还任务配额失败: {e}")
+
+@app.on_event("startup")
+async def start_job_workers():
+    if job_workers.processes > 0:
+        job_workers.start()
+        app.state.job_supervisor = asyncio.create_task(_supervise_workers())
+    # 工作进程也可能单独运行（python -m src.job_queue），无论是否启动本地工作进程都结算配额
+    app.state.job_refunder = asyncio.create_task(_refund_jobs_periodically())
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    for name in ("job_supervisor", "job_refunder"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    await run_in_threadpool(job_workers.stop)
+    await run_in_threadpool(refund_finished_jobs)
+
+@app.on_event("shutdown")
+async def flush_quota():
+    await run_in_threadpool(quota_store.close)
+
+@app.on_event("shutdown")
+async def flush_analysis_store():
+    if pipeline.store:
+        await run_in_threadpool(pipeline.store.close)
+
+@app.on_event("shutdown")
+def stop_feature_workers():
+    if analyzer.feature_extractor:
+        analyzer.feature_extractor.close()
+
+def _get_user_job(job_id: str, user: dict, include_result: bool = False) -> dict:
+    """读取当前用户的任务，不存在或属于其他用户时返回 404"""
+    job = job_queue.get(job_id, include_result=include_result)
+    if not job or job["username"] != user["username"]:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    job.pop("idempotency_key", None)
+    job.pop("payload", None)
+    return job
+
+@app.post("/api/jobs")
+async def submit_job(
+    request: AnalyzeRequest,
+    idempotency_key: Optional[str] = Header(None),
+    user: dict = Depends(get_quota_user)
+):
+    """
+    提交分析任务，立即返回 job_id
+    
+    同一用户重复提交同一视频（或相同的 Idempotency-Key）时返回已有任务，不重复扣除配额；
+    任务失败、被取消或命中结果缓存时退还配额；
+    使用 GET /api/jobs/{job_id} 查询状态，GET /api/jobs/{job_id}/result 获取结果
+    """
+    # 先结算已结束的任务：重新提交失败 / 已取消的任务会重置其退还标记
+    await run_in_threadpool(refund_finished_jobs)
+    consume_quota(user)
+    try:
+        job = await run_in_threadpool(
+            job_queue.submit,
+            str(request.video_url),
+            username=user["username"],
+            idempotency_key=f"{user['username']}:{idempotency_key}" if idempotency_key else None
+        )
+    except BaseException:
+        quota_store.refund(user["username"])
+        raise
+    if job["created"]:
+        print(f"📥 用户 {user['username']} 提交任务 {job['job_id']}: {request.video_url}")
+    else:
+        # 返回已有任务，不重复扣除配额
+        quota_store.refund(user["username"])
+    
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "created": job["created"],
+        "quota_remaining": quota_remaining(user)
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, user: dict = Depends(get_current_user)):
+    """
+    查询任务状态：queued / running / succeeded / failed / cancelled
+    """
+    return await run_in_threadpool(_get_user_job, job_id, user)
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str, user: dict = Depends(get_current_user)):
+    """
+    获取任务结果，任务未完成时返回 409
+    """
+    job = await run_in_threadpool(_get_user_job, job_id, user, True)
+    if job["status"] == JOB_SUCCEEDED:
+        return {
+            "success": True,
+            "job_id": job_id,
+            "metadata": job["result"]["metadata"],
+            "analysis": job["result"]["analysis"]
+        }
+    if job["status"] == JOB_CANCELLED:
+        raise HTTPException(status_code=409, detail="任务已取消")
+    if job["status"] == JOB_FAILED:
+        raise HTTPException(status_code=409, detail=f"任务失败: {job.get('error')}")
+    raise HTTPException(status_code=409, detail=f"任务尚未完成（状态: {job['status']}）")
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, user: dict = Depends(get_current_user)):
+    """
+    取消排队中或运行中的任务
+    """
+    await run_in_threadpool(_get_user_job, job_id, user)
+    job = await run_in_threadpool(job_queue.cancel, job_id)
+    await run_in_threadpool(refund_finished_jobs)
+    return {"job_id": job_id, "status": job["status"], "quota_remaining": quota_remaining(user)}
+
+# ---------------------------------------------------------
+# 8. 检索已分析的视频
+# ---------------------------------------------------------
+
+# 单次检索最多返回的视频数
+MAX_SEARCH_RESULTS = 100
+
+@app.get("/api/search")
+async def search_analyses(
+    q: Optional[str] = None,
+    video_url: Optional[str] = None,
+    field: Optional[List[str]] = Query(None),
+    k: int = 10,
+    mode: str = "hybrid",
+    user: dict = Depends(get_current_user)
+):
+    """
+    检索已分析的视频（不消耗配额）
+    
+    - q：按文本检索（关键词 + 向量相似度）
+    - video_url：查找与该视频相似的视频（按 field 的第一个字段比较，默认 hook）
+    - field：限定字段（可重复）：summary / hook / pain_point / product / selling_proposition /
+      script_template / transcript
+    - mode：hybrid（默认）/ keyword / semantic
+    """
+    index = analyzer.search_index
+    if index is None:
+        raise HTTPException(status_code=503, detail="检索未启用（设置 SEARCH_INDEX=on）")
+    if not q and not video_url:
+        raise HTTPException(status_code=400, detail="需要提供 q 或 video_url")
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode 可选: {', '.join(SEARCH_MODES)}")
+    unknown = [name for name in field or [] if name not in FIELD_NAMES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知的字段: {', '.join(unknown)}")
+    k = max(1, min(k, MAX_SEARCH_RESULTS))
+    
+    try:
+        if video_url:
+            results = await run_in_threadpool(
+                index.similar, video_url, field=(field or ["hook"])[0], k=k, mode=mode
+            )
+        else:
+            results = await run_in_threadpool(index.search, q, k=k, fields=field, mode=mode)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    return {"query": q, "video_url": video_url, "results": results}
+
 # ---------------------------------------------------------
-# 6. 启动说明
+# 9. 启动说明
 # ---------------------------------------------------------
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+"""
+Benchmark: 分析结果存储
+
+合成 N 份报告，对比：
+1. 写入：AnalysisStore 批量追加 vs 每份报告单独提交 vs 每份报告一个 JSON 文件
+2. 聚合（按 hook_type × editing_pace 统计数量和平均互动率）：
+   逐个读取 JSON 文件 vs SQL GROUP BY vs 导出 Parquet 后用 pyarrow 聚合
+
+运行: python -m benchmarks.bench_analysis_store [--reports 20000]
+"""
+
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+from src.analysis_store import COLUMN_NAMES, AnalysisStore, flatten_report
+
+
+HOOK_TYPES = ['Visual Shock', 'Verbal Question', 'Product Demo', 'Before/After', 'POV', 'Unboxing']
+PACES = ['Fast', 'Medium', 'Slow']
+
+
+def synthetic_report(i: int, rng: random.Random):
+    views = rng.randint(1_000, 5_000_000)
+    metadata = {
+        'video_url': f'https://www.tiktok.com/@bench/video/{i}',
+        'author': f'seller_{i % 500}',
+        'description': 'This cleaning hack will change your life! #lazada ' * 3,
+        'views': views,
+        'likes': int(views * rng.uniform(0.01, 0.1)),
+        'comments': int(views * rng.uniform(0.001, 0.01)),
+        'shares': int(views * rng.uniform(0.001, 0.02)),
+        'duration': rng.randint(8, 120),
+        'publish_time': 1_700_000_000 + i * 60,
+    }
+    analysis = {
+        'video_content_summary': {'what_is_this_video_about': 'A product demo ' * 10, 'primary_language': 'Thai'},
+        'structure_breakdown': {
+            'hook_type': rng.choice(HOOK_TYPES),
+            'hook_description': 'Opens with a messy kitchen and a question ' * 4,
+            'product_reveal_timestamp': f'00:{rng.randint(1, 15):02d}',
+            'key_selling_proposition': 'Cleans in 30 seconds without scrubbing',
+        },
+        'creative_insight': {'editing_pace': rng.choice(PACES), 'visual_style': 'UGC'},
+        'lazada_adaptation_brief': {
+            'remake_difficulty': rng.choice(['Low', 'Medium', 'High']),
+            'script_template': '1. Show the problem 2. Apply the product 3. Reveal the result ' * 5,
+        },
+    }
+    transcript = [{'timestamp': f'00:{s:02d}', 'text': 'spoken line ' * 6} for s in range(0, 30, 3)]
+    return metadata['video_url'], analysis, metadata, transcript
+
+
+def aggregate_json_files(directory: Path):
+    groups = defaultdict(lambda: [0, 0.0])
+    for path in directory.iterdir():
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        flat = flatten_report(report['metadata']['video_url'], report['analysis'], report['metadata'])
+        group = groups[(flat['hook_type'], flat['editing_pace'])]
+        group[0] += 1
+        group[1] += flat['engagement_rate'] or 0.0
+    return {key: (count, total / count) for key, (count, total) in groups.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析结果存储基准测试")
+    parser.add_argument('--reports', type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    reports = [synthetic_report(i, rng) for i in range(args.reports)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+
+        # 1. 写入
+        store = AnalysisStore(str(tmp / 'batched.sqlite3'))
+        start = time.perf_counter()
+        for video_url, analysis, metadata, transcript in reports:
+            store.append(video_url, analysis, metadata, transcript, source='bench')
+        store.flush()
+        batched = time.perf_counter() - start
+
+        conn = sqlite3.connect(str(tmp / 'per_row.sqlite3'))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f"CREATE TABLE analyses ({', '.join(COLUMN_NAMES)}, report TEXT)")
+        sample = reports[:min(2_000, len(reports))]
+        start = time.perf_counter()
+        for video_url, analysis, metadata, transcript in sample:
+            flat = flatten_report(video_url, analysis, metadata, transcript, 'bench')
+            report = json.dumps({'metadata': metadata, 'analysis': analysis, 'transcript': transcript})
+            conn.execute(
+                f"INSERT INTO analyses VALUES ({', '.join('?' * (len(COLUMN_NAMES) + 1))})",
+                [flat[name] for name in COLUMN_NAMES] + [report]
+            )
+            conn.commit()
+        per_row = (time.perf_counter() - start) * len(reports) / len(sample)
+        conn.close()
+
+        json_dir = tmp / 'json'
+        json_dir.mkdir()
+        start = time.perf_counter()
+        for i, (video_url, analysis, metadata, transcript) in enumerate(reports):
+            with open(json_dir / f'{i}.json', 'w', encoding='utf-8') as f:
+                json.dump({'metadata': metadata, 'analysis': analysis, 'transcript': transcript}, f)
+        json_files = time.perf_counter() - start
+
+        print(f"写入 {args.reports} 份报告:")
+        print(f"  AnalysisStore 批量追加      {batched:8.2f} 秒")
+        print(f"  每份单独提交（按 {len(sample)} 份估算） {per_row:8.2f} 秒")
+        print(f"  每份一个 JSON 文件          {json_files:8.2f} 秒")
+
+        # 2. 聚合
+        start = time.perf_counter()
+        expected = aggregate_json_files(json_dir)
+        from_json = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = store._conn.execute(
+            'SELECT hook_type, editing_pace, COUNT(*), AVG(engagement_rate) FROM latest_analyses '
+            'GROUP BY hook_type, editing_pace'
+        ).fetchall()
+        from_sql = time.perf_counter() - start
+        assert {(h, p): c for h, p, c, _ in rows} == {key: value[0] for key, value in expected.items()}
+
+        parquet_path = str(tmp / 'analyses.parquet')
+        start = time.perf_counter()
+        store.export(parquet_path)
+        export_seconds = time.perf_counter() - start
+
+        import pyarrow.parquet as pq
+        start = time.perf_counter()
+        table = pq.read_table(parquet_path, columns=['hook_type', 'editing_pace', 'engagement_rate'])
+        grouped = table.group_by(['hook_type', 'editing_pace']).aggregate(
+            [('engagement_rate', 'count'), ('engagement_rate', 'mean')]
+        )
+        from_parquet = time.perf_counter() - start
+        assert grouped.num_rows == len(expected)
+
+        print(f"\n聚合（hook_type × editing_pace，{len(expected)} 组）:")
+        print(f"  逐个读取 JSON 文件          {from_json:8.2f} 秒")
+        print(f"  SQL GROUP BY               {from_sql:8.3f} 秒")
+        print(f"  Parquet + pyarrow          {from_parquet:8.3f} 秒（导出 {export_seconds:.2f} 秒，"
+              f"{os.path.getsize(parquet_path) / 1e6:.1f} MB）")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
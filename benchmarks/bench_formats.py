@@ -0,0 +1,68 @@
+"""
+Benchmark: yt-dlp 格式选择策略
+对每个 URL 分别用旧的 'best[ext=mp4]/best'、按平台策略选择的视频流和纯音频流下载，
+对比下载字节数和耗时（需要网络）
+
+运行: python -m benchmarks.bench_formats URL [URL ...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import yt_dlp
+
+from src.format_policy import FormatSelector, describe_format, platform_of, policy_for
+
+
+LEGACY_FORMAT = 'best[ext=mp4]/best'
+
+
+def download(video_url: str, fmt, output_dir: str):
+    """返回 (格式描述, 字节数, 耗时秒)"""
+    opts = {
+        'format': fmt,
+        'outtmpl': os.path.join(output_dir, '%(id)s.%(format_id)s.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'nocheckcertificate': True,
+    }
+    start = time.perf_counter()
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(video_url, download=True)
+        filename = ydl.prepare_filename(info)
+    elapsed = time.perf_counter() - start
+    selected = fmt.selected if isinstance(fmt, FormatSelector) else info
+    return describe_format(selected), os.path.getsize(filename), elapsed
+
+
+def main():
+    urls = sys.argv[1:]
+    if not urls:
+        print(__doc__)
+        sys.exit(1)
+
+    print(f"{'platform':<10}{'mode':<8}{'format':<36}{'size(MB)':>10}{'time(s)':>9}")
+    for url in urls:
+        platform = platform_of(url)
+        modes = [
+            ('legacy', LEGACY_FORMAT),
+            ('policy', FormatSelector(policy_for(url))),
+            ('audio', FormatSelector(policy_for(url, audio_only=True))),
+        ]
+        legacy_size = None
+        for mode, fmt in modes:
+            with tempfile.TemporaryDirectory() as output_dir:
+                try:
+                    label, size, elapsed = download(url, fmt, output_dir)
+                except Exception as e:
+                    print(f"{platform:<10}{mode:<8}失败: {e}")
+                    continue
+            legacy_size = legacy_size or size
+            print(f"{platform:<10}{mode:<8}{label:<36}{size / 1024 ** 2:>10.2f}{elapsed:>9.1f}"
+                  f"  ({size / legacy_size:.0%} of legacy)")
+
+
+if __name__ == "__main__":
+    main()
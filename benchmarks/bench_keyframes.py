@@ -0,0 +1,136 @@
+"""
+Benchmark: 关键帧 + 转录模式 vs 完整视频模式
+
+1. 直方图与镜头切换检测耗时（合成帧，不需要 ffmpeg）
+2. --video：关键帧采样耗时、帧数、镜头切换数、发送字节数与原视频大小对比（需要 ffmpeg）
+3. --analyze：两种模式分别调用 Gemini，对比端到端耗时、上传字节数和结果一致性（需要 GEMINI_API_KEY）
+
+运行: python -m benchmarks.bench_keyframes [--video path/to/video.mp4] [--analyze]
+"""
+
+import json
+import time
+import argparse
+import difflib
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+from src.frame_sampler import (
+    ANALYSIS_HEIGHT, ANALYSIS_WIDTH, detect_cuts, frame_histograms, histogram_distances, sample_keyframes
+)
+
+
+# 用于判断结果一致性的分类字段
+CATEGORICAL_FIELDS = [
+    ('video_content_summary', 'primary_language'),
+    ('video_content_summary', 'estimated_sentiment'),
+    ('structure_breakdown', 'hook_type'),
+    ('structure_breakdown', 'product_reveal_timestamp'),
+    ('creative_insight', 'visual_style'),
+    ('creative_insight', 'editing_pace'),
+    ('lazada_adaptation_brief', 'remake_difficulty'),
+]
+
+
+def single_bincount_histograms(frames: np.ndarray, bins: int = 16) -> np.ndarray:
+    """对照实现：每个通道加上帧偏移后整体一次 bincount"""
+    count, channels = frames.shape[0], frames.shape[-1]
+    histograms = np.zeros((count, channels * bins), dtype=np.float32)
+    offsets = (np.arange(count, dtype=np.intp) * bins)[:, None]
+    for channel in range(channels):
+        codes = (frames[..., channel].reshape(count, -1) // (256 // bins)).astype(np.intp)
+        codes += offsets
+        counts = np.bincount(codes.ravel(), minlength=count * bins)
+        histograms[:, channel * bins:(channel + 1) * bins] = counts.reshape(count, bins)
+    return histograms / frames[0, ..., 0].size
+
+
+def median_ms(func, iterations: int = 20) -> float:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def bench_histograms(frame_count: int = 720):
+    """720 帧 = 3 分钟视频 @ 4fps"""
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (frame_count, ANALYSIS_HEIGHT, ANALYSIS_WIDTH, 3), dtype=np.uint8)
+    per_frame = median_ms(lambda: frame_histograms(frames))
+    single = median_ms(lambda: single_bincount_histograms(frames))
+    histograms = frame_histograms(frames)
+    cuts = median_ms(lambda: detect_cuts(histogram_distances(histograms)))
+    print(f"直方图（{frame_count} 帧 {ANALYSIS_WIDTH}x{ANALYSIS_HEIGHT}）: "
+          f"逐帧 bincount {per_frame:.1f} ms / 整体一次 bincount {single:.1f} ms；"
+          f"差异 + 切换检测 {cuts:.2f} ms")
+
+
+def field_agreement(a: dict, b: dict) -> float:
+    """分类字段一致的比例（忽略大小写）"""
+    same = 0
+    for section, key in CATEGORICAL_FIELDS:
+        left = str((a.get(section) or {}).get(key, '')).strip().lower()
+        right = str((b.get(section) or {}).get(key, '')).strip().lower()
+        same += left == right
+    return same / len(CATEGORICAL_FIELDS)
+
+
+def text_similarity(a: dict, b: dict) -> float:
+    dump = lambda value: json.dumps(value, ensure_ascii=False, sort_keys=True, indent=1)
+    return difflib.SequenceMatcher(None, dump(a), dump(b)).ratio()
+
+
+def run_full_video(analyzer, video_path: str):
+    start = time.perf_counter()
+    video_file = analyzer.upload_to_gemini(video_path)
+    analysis = analyzer.generate_analysis(video_file)
+    return time.perf_counter() - start, Path(video_path).stat().st_size, analysis
+
+
+def run_keyframes(analyzer, video_path: str):
+    start = time.perf_counter()
+    keyframes = sample_keyframes(video_path)
+    transcript = analyzer.transcribe_video(video_path)
+    analysis = analyzer.generate_keyframe_analysis(keyframes, transcript)
+    sent = keyframes.total_bytes + len(json.dumps(transcript, ensure_ascii=False).encode('utf-8'))
+    return time.perf_counter() - start, sent, analysis
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键帧模式对比")
+    parser.add_argument('--video', help='本地视频文件')
+    parser.add_argument('--analyze', action='store_true', help='两种模式都调用 Gemini（消耗 API 配额）')
+    args = parser.parse_args()
+
+    bench_histograms()
+    if not args.video:
+        return
+
+    keyframes = sample_keyframes(args.video)
+    video_size = Path(args.video).stat().st_size
+    print(f"\n关键帧采样: {keyframes.frame_count} 帧解码 / {len(keyframes.cut_times)} 个镜头切换 / "
+          f"{len(keyframes.keyframes)} 张关键帧，{keyframes.sampling_seconds:.2f} 秒")
+    print(f"发送字节: 关键帧 {keyframes.total_bytes / 1024:.0f} KB vs 视频 {video_size / 1024:.0f} KB "
+          f"（{keyframes.total_bytes / video_size:.0%}）")
+
+    if not args.analyze:
+        return
+
+    from src.video_analyzer import VideoAnalyzer
+    analyzer = VideoAnalyzer(analysis_mode='video')
+    full_seconds, full_bytes, full_analysis = run_full_video(analyzer, args.video)
+    key_seconds, key_bytes, key_analysis = run_keyframes(analyzer, args.video)
+
+    print(f"\n{'mode':<12}{'latency(s)':>12}{'bytes(KB)':>12}")
+    print(f"{'video':<12}{full_seconds:>12.1f}{full_bytes / 1024:>12.0f}")
+    print(f"{'keyframes':<12}{key_seconds:>12.1f}{key_bytes / 1024:>12.0f}")
+    print(f"\n分类字段一致率 {field_agreement(full_analysis, key_analysis):.0%}，"
+          f"全文相似度 {text_similarity(full_analysis, key_analysis):.2f}")
+
+
+if __name__ == "__main__":
+    main()
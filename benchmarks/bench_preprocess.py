@@ -0,0 +1,96 @@
+"""
+Benchmark: 上传前视频预处理的各个预设
+对同一个视频分别使用原文件和每个预设，测量转码耗时与文件大小；
+加 --upload 时（需要 GEMINI_API_KEY）再测量上传 + Gemini 处理耗时，并与原文件的分析结果对比相似度
+
+运行: python -m benchmarks.bench_preprocess --video path/to/video.mp4 [--upload]
+"""
+
+import json
+import time
+import argparse
+import tempfile
+import difflib
+from pathlib import Path
+
+from src.video_preprocess import PRESETS, VideoPreprocessor
+
+
+def transcode(video_path: str, preset, cache_dir: str):
+    """返回 (输出路径, 转码耗时秒)；original 不转码"""
+    if preset is None:
+        return video_path, 0.0
+    preprocessor = VideoPreprocessor(preset, cache_dir=cache_dir, max_bytes=10 * 1024 ** 3)
+    start = time.perf_counter()
+    output = preprocessor.process(video_path)
+    return output, time.perf_counter() - start
+
+
+def upload_and_analyze(analyzer, path: str):
+    """返回 (上传 + 处理耗时秒, 分析结果)"""
+    start = time.perf_counter()
+    video_file, backend = analyzer.gemini_pool.upload(path)
+    video_file = analyzer.file_waiter.wait(video_file, timeout=600, kind='video', get_file=backend.get_file)
+    upload_seconds = time.perf_counter() - start
+    analysis = analyzer.generate_analysis(video_file)
+    return upload_seconds, analysis
+
+
+def similarity(a, b) -> float:
+    """两份分析结果的文本相似度（0-1）"""
+    dump = lambda value: json.dumps(value, ensure_ascii=False, sort_keys=True, indent=1)
+    return difflib.SequenceMatcher(None, dump(a), dump(b)).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视频预处理预设对比")
+    parser.add_argument('--video', required=True, help='本地视频文件')
+    parser.add_argument('--presets', default=','.join(PRESETS), help='逗号分隔的预设名')
+    parser.add_argument('--upload', action='store_true', help='上传到 Gemini 并分析（消耗 API 配额）')
+    args = parser.parse_args()
+
+    analyzer = None
+    if args.upload:
+        from src.video_analyzer import VideoAnalyzer
+        analyzer = VideoAnalyzer()
+
+    source_size = Path(args.video).stat().st_size
+    candidates = [('original', None)] + [(name, PRESETS[name]) for name in args.presets.split(',') if name]
+
+    rows = []
+    baseline = None
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, preset in candidates:
+            path, transcode_seconds = transcode(args.video, preset, cache_dir)
+            size = Path(path).stat().st_size
+            row = {
+                'preset': name,
+                'size_mb': size / 1024 ** 2,
+                'ratio': size / source_size,
+                'transcode_s': transcode_seconds,
+                'upload_s': None,
+                'similarity': None,
+            }
+            if analyzer is not None:
+                row['upload_s'], analysis = upload_and_analyze(analyzer, path)
+                if baseline is None:
+                    baseline = analysis
+                row['similarity'] = similarity(baseline, analysis)
+            rows.append(row)
+
+    print(f"{'preset':<10}{'size(MB)':>10}{'ratio':>8}{'transcode(s)':>14}{'upload+proc(s)':>16}{'similarity':>12}")
+    for r in rows:
+        upload = f"{r['upload_s']:.1f}" if r['upload_s'] is not None else '-'
+        sim = f"{r['similarity']:.2f}" if r['similarity'] is not None else '-'
+        print(f"{r['preset']:<10}{r['size_mb']:>10.2f}{r['ratio']:>8.2f}{r['transcode_s']:>14.2f}{upload:>16}{sim:>12}")
+
+    if analyzer is not None and len(rows) > 1:
+        best = min(rows[1:], key=lambda r: r['upload_s'] + r['transcode_s'])
+        saved = rows[0]['upload_s'] - best['upload_s'] - best['transcode_s']
+        print(f"\n{best['preset']} 预设端到端节省约 {saved:.1f} 秒，分析结果与原文件相似度 {best['similarity']:.2f}")
+    else:
+        print("\n未上传（加 --upload 测量上传 + Gemini 处理耗时和分析结果差异）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: 每个请求的限流 + 配额检查开销
+模拟 get_current_user 中的 RateLimiter.check 和 QuotaStore.try_consume，
+分别测量单个 Token、大量 Token（验证 O(1)）和多线程并发的情况（配额写入临时 SQLite）
+
+运行: python -m benchmarks.bench_rate_limiter
+"""
+
+import time
+import tempfile
+import statistics
+import threading
+from pathlib import Path
+
+from src.rate_limiter import RateLimiter, QuotaStore
+
+# 速率设得足够高，测量的是放行路径的开销
+RATE_PER_MINUTE = 10 ** 9
+QUOTA_MONTHLY = 10 ** 9
+
+
+def bench(func, iterations: int = 20000):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    samples.sort()
+    return {
+        'mean_us': statistics.mean(samples),
+        'p50_us': samples[len(samples) // 2],
+        'p99_us': samples[int(len(samples) * 0.99) - 1],
+    }
+
+
+def bench_threads(func, threads: int = 8, iterations: int = 5000):
+    """多个线程同时调用，合并所有样本"""
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        r = bench(func, iterations)
+        with lock:
+            results.append(r)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return {
+        key: statistics.mean(r[key] for r in results)
+        for key in ('mean_us', 'p50_us', 'p99_us')
+    }
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = RateLimiter()
+        quota = QuotaStore(db_path=Path(tmp) / 'quota.sqlite3', flush_interval=0.1)
+
+        def one_token(i):
+            limiter.check('token_0', RATE_PER_MINUTE)
+            quota.try_consume('user_0', QUOTA_MONTHLY)
+
+        def many_tokens(i):
+            key = i % 10000
+            limiter.check(f'token_{key}', RATE_PER_MINUTE)
+            quota.try_consume(f'user_{key}', QUOTA_MONTHLY)
+
+        # 预热：创建 10000 个 Token 的桶和配额计数
+        for i in range(10000):
+            many_tokens(i)
+
+        results = {
+            '1 token': bench(one_token),
+            '10k tokens': bench(many_tokens),
+            '10k x 8 thr': bench_threads(many_tokens),
+        }
+        quota.close()
+
+    print(f"{'mode':<14}{'mean(us)':>10}{'p50(us)':>10}{'p99(us)':>10}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['mean_us']:>10.2f}{r['p50_us']:>10.2f}{r['p99_us']:>10.2f}")
+
+    worst = max(r['p99_us'] for r in results.values())
+    print(f"\n每个请求的限流 + 配额检查 p99 为 {worst:.2f} us（{worst / 1000:.4f} ms），"
+          f"与 Token 数量无关；配额由后台线程批量写入 SQLite，不在请求路径上")
+
+
+if __name__ == "__main__":
+    main()
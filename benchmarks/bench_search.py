@@ -0,0 +1,104 @@
+"""
+Benchmark: 分析结果检索
+
+合成 N 份分析结果（Zipf 分布的词表，含转录），测量：
+1. 批量索引耗时（切分 + 向量 + SQLite 写入）
+2. 新进程冷启动加载耗时（从 SQLite 全量加载 / 从快照加载）
+3. 各检索模式（keyword / semantic / hybrid）在全部字段和仅 hook 字段上的查询延迟
+
+运行: python -m benchmarks.bench_search [--videos 100000] [--db /tmp/bench_search.sqlite3]
+"""
+
+import os
+import time
+import random
+import argparse
+import statistics
+
+import numpy as np
+
+from src.search_index import SEARCH_MODES, SearchIndex
+
+
+WORDS = [f"w{i}" for i in range(20000)]
+# Zipf 权重：少数常用词 + 长尾
+WEIGHTS = 1 / np.arange(1, len(WORDS) + 1) ** 1.1
+CDF = np.cumsum(WEIGHTS / WEIGHTS.sum())
+
+
+def sentence(rng: np.random.Generator, length: int) -> str:
+    indices = np.minimum(np.searchsorted(CDF, rng.random(length)), len(WORDS) - 1)
+    return ' '.join(WORDS[i] for i in indices)
+
+
+def synthetic_records(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        analysis = {
+            'video_content_summary': {'what_is_this_video_about': sentence(rng, 30)},
+            'structure_breakdown': {
+                'hook_description': sentence(rng, 25),
+                'pain_point_addressed': sentence(rng, 10),
+                'actual_product_shown': sentence(rng, 5),
+                'key_selling_proposition': sentence(rng, 10),
+            },
+            'lazada_adaptation_brief': {'script_template': sentence(rng, 60)},
+        }
+        transcript = [{'timestamp': f'00:{s:02d}', 'text': sentence(rng, 15)} for s in range(0, 30, 5)]
+        yield f'https://www.tiktok.com/@bench/video/{i}', analysis, transcript
+
+
+def median_ms(func, queries) -> float:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索索引基准测试")
+    parser.add_argument('--videos', type=int, default=100_000)
+    parser.add_argument('--db', default='/tmp/bench_search.sqlite3')
+    parser.add_argument('--rebuild', action='store_true', help='删除已有的索引文件重新构建')
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(args.db):
+        os.remove(args.db)
+    if not os.path.exists(args.db):
+        index = SearchIndex(args.db)
+        start = time.perf_counter()
+        records = synthetic_records(args.videos)
+        batch = 2000
+        for offset in range(0, args.videos, batch):
+            index.add_many([next(records) for _ in range(min(batch, args.videos - offset))])
+        print(f"索引 {args.videos} 份分析: {time.perf_counter() - start:.1f} 秒")
+        index.close()
+
+    for source in ('SQLite', '快照'):
+        index = SearchIndex(args.db)
+        if source == 'SQLite' and os.path.exists(index.snapshot_path):
+            os.remove(index.snapshot_path)
+        start = time.perf_counter()
+        index.search('warmup')
+        print(f"冷启动加载（{source}）: {time.perf_counter() - start:.1f} 秒")
+    print(index.stats())
+
+    rng = np.random.default_rng(1)
+    queries = [sentence(rng, 6) for _ in range(30)]
+    print(f"\n{'mode':<10}{'all fields(ms)':>16}{'hook(ms)':>12}")
+    for mode in SEARCH_MODES:
+        all_fields = median_ms(lambda q: index.search(q, k=10, mode=mode), queries)
+        hook = median_ms(lambda q: index.search(q, k=10, fields=['hook'], mode=mode), queries)
+        print(f"{mode:<10}{all_fields:>16.1f}{hook:>12.1f}")
+
+    similar = median_ms(
+        lambda url: index.similar(url, field='hook'),
+        [f'https://www.tiktok.com/@bench/video/{random.randrange(args.videos)}' for _ in range(30)]
+    )
+    print(f"\nsimilar(hook): {similar:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,19 +4,22 @@ Sprint 1 + Sprint 2: 从 TikTok URL 到视频分析结果
 """
 
 import json
+from typing import Optional
 from src.tiktok_fetcher import TikTokFetcher
 from src.video_analyzer import VideoAnalyzer
+from src.analysis_store import get_analysis_store
 
 
-def full_pipeline_example(tiktok_url: str):
+def full_pipeline_example(tiktok_url: str, output_file: Optional[str] = None):
     """
     完整的数据管道示例：
     1. 使用 TikTokFetcher 获取视频元数据和下载链接
     2. 使用 VideoAnalyzer 分析视频结构
-    3. 输出完整的分析报告
+    3. 输出完整的分析报告（写入分析结果存储，可导出为 Parquet 做汇总分析）
     
     Args:
         tiktok_url: TikTok 视频 URL
+        output_file: 额外保存一份 JSON 报告的路径（可选）
     """
     print("=" * 80)
     print("🚀 E-Com Video Insider - 完整流程")
@@ -62,12 +65,17 @@ def full_pipeline_example(tiktok_url: str):
             "ai_analysis": analysis_result
         }
         
-        # 保存报告
-        output_file = "/home/ubuntu/ecom-video-insider/data/analysis_report.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(report, f, indent=2, ensure_ascii=False)
-        
-        print(f"\n✅ 完整报告已保存: {output_file}")
+        # 保存报告：追加到分析结果存储（python -m src.analysis_store export analyses.parquet 导出）
+        store = get_analysis_store()
+        if store:
+            store.append(tiktok_url, analysis_result, video_data, source='example')
+            store.flush()
+            print(f"\n✅ 完整报告已保存: {store.db_path}")
+        
+        if output_file:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"✅ JSON 报告已保存: {output_file}")
         
         # 打印关键洞察
         print("\n" + "=" * 80)
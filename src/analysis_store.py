@@ -0,0 +1,660 @@
+"""
+Analysis Store
+分析结果持久化：SQLite 保存扁平化的元数据列和完整报告 JSON，只追加不修改，后台批量写入；
+可导出为 Parquet / Arrow，供分析人员对数万份报告做聚合查询
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from .paths import get_data_dir
+from .result_cache import extract_video_id
+
+
+# 扁平化列：(列名, 类型)；类型为 TEXT / INTEGER / REAL / TIMESTAMP（SQLite 中存 Unix 秒）
+FLAT_COLUMNS = (
+    ('video_id', 'TEXT'),
+    ('video_url', 'TEXT'),
+    ('platform', 'TEXT'),
+    ('source', 'TEXT'),
+    ('created_at', 'TIMESTAMP'),
+    # 视频元数据
+    ('author', 'TEXT'),
+    ('description', 'TEXT'),
+    ('published_at', 'TIMESTAMP'),
+    ('duration_seconds', 'REAL'),
+    ('music', 'TEXT'),
+    # 互动数据，engagement_rate = (点赞 + 评论 + 分享) / 播放
+    ('views', 'INTEGER'),
+    ('likes', 'INTEGER'),
+    ('comments', 'INTEGER'),
+    ('shares', 'INTEGER'),
+    ('engagement_rate', 'REAL'),
+    # AI 分析
+    ('primary_language', 'TEXT'),
+    ('sentiment', 'TEXT'),
+    ('hook_type', 'TEXT'),
+    ('hook_text_overlay', 'TEXT'),
+    ('product_reveal_seconds', 'REAL'),
+    ('actual_product', 'TEXT'),
+    ('key_selling_proposition', 'TEXT'),
+    ('visual_style', 'TEXT'),
+    ('editing_pace', 'TEXT'),
+    ('remake_difficulty', 'TEXT'),
+    # 本地信号（LOCAL_FEATURES 开启时）
+    ('cut_count', 'INTEGER'),
+    ('cuts_per_second', 'REAL'),
+    ('average_shot_ms', 'INTEGER'),
+    ('motion_mean', 'REAL'),
+    ('hook_cuts', 'INTEGER'),
+    ('loudness_mean_db', 'REAL'),
+    ('speech_onset_ms', 'INTEGER'),
+    # 其他
+    ('transcript_segments', 'INTEGER'),
+    ('near_duplicate_of', 'TEXT'),
+)
+COLUMN_NAMES = [name for name, _ in FLAT_COLUMNS]
+
+# 导出时每批读取的行数
+EXPORT_BATCH_ROWS = 10_000
+
+
+def _get(data: Any, *keys: str) -> Any:
+    """按路径读取嵌套字典，任一层缺失时返回 None"""
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value or None
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _as_timestamp(value: Any) -> Optional[float]:
+    """Unix 秒（毫秒值自动换算）或 ISO 8601 字符串 -> Unix 秒"""
+    number = _as_float(value)
+    if number is not None:
+        return number / 1000 if number > 1e11 else number
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def parse_timestamp_seconds(value: Any) -> Optional[float]:
+    """
+    解析分析结果中的时间点（'MM:SS'、'HH:MM:SS' 或秒数）
+
+    Returns:
+        秒数，无法解析时返回 None
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    seconds = 0.0
+    try:
+        for part in value.strip().split(':'):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+    return seconds
+
+
+def flatten_report(
+    video_url: str,
+    analysis: Dict,
+    metadata: Optional[Dict] = None,
+    transcript: Optional[List[Dict]] = None,
+    source: Optional[str] = None,
+    created_at: Optional[float] = None
+) -> Dict:
+    """
+    把一份报告展开为 FLAT_COLUMNS 对应的字典（缺失的字段为 None）
+
+    Args:
+        video_url: 视频 URL
+        analysis: 分析结果
+        metadata: 视频元数据（可选，TikTokFetcher 格式）
+        transcript: 转录片段（可选）
+        source: 写入来源（可选），例如 'streamlit' / 'pipeline'
+        created_at: 写入时间（Unix 秒，可选，默认当前时间）
+    """
+    metadata = metadata or {}
+    video_id = extract_video_id(video_url)
+    views, likes = _as_int(metadata.get('views')), _as_int(metadata.get('likes'))
+    comments, shares = _as_int(metadata.get('comments')), _as_int(metadata.get('shares'))
+    interactions = sum(value or 0 for value in (likes, comments, shares))
+    features = _get(analysis, 'local_features') or {}
+
+    return {
+        'video_id': video_id,
+        'video_url': video_url,
+        'platform': video_id.split(':', 1)[0] if ':' in video_id else None,
+        'source': source,
+        'created_at': created_at if created_at is not None else time.time(),
+        'author': _as_text(metadata.get('author')),
+        'description': _as_text(metadata.get('description')),
+        'published_at': _as_timestamp(metadata.get('publish_time')),
+        'duration_seconds': _as_float(metadata.get('duration')),
+        'music': _as_text(metadata.get('music')),
+        'views': views,
+        'likes': likes,
+        'comments': comments,
+        'shares': shares,
+        'engagement_rate': round(interactions / views, 6) if views else None,
+        'primary_language': _as_text(
+            _get(analysis, 'video_content_summary', 'primary_language')
+            or _get(analysis, 'video_metadata', 'primary_language')
+        ),
+        'sentiment': _as_text(
+            _get(analysis, 'video_content_summary', 'estimated_sentiment')
+            or _get(analysis, 'video_metadata', 'estimated_sentiment')
+        ),
+        'hook_type': _as_text(_get(analysis, 'structure_breakdown', 'hook_type')),
+        'hook_text_overlay': _as_text(_get(analysis, 'structure_breakdown', 'hook_text_overlay')),
+        'product_reveal_seconds': parse_timestamp_seconds(
+            _get(analysis, 'structure_breakdown', 'product_reveal_timestamp')
+        ),
+        'actual_product': _as_text(_get(analysis, 'structure_breakdown', 'actual_product_shown')),
+        'key_selling_proposition': _as_text(_get(analysis, 'structure_breakdown', 'key_selling_proposition')),
+        'visual_style': _as_text(_get(analysis, 'creative_insight', 'visual_style')),
+        'editing_pace': _as_text(_get(analysis, 'creative_insight', 'editing_pace')),
+        'remake_difficulty': _as_text(_get(analysis, 'lazada_adaptation_brief', 'remake_difficulty')),
+        'cut_count': _as_int(features.get('cut_count')),
+        'cuts_per_second': _as_float(features.get('cuts_per_second')),
+        'average_shot_ms': _as_int(features.get('average_shot_ms')),
+        'motion_mean': _as_float(features.get('motion_mean')),
+        'hook_cuts': _as_int(_get(features, 'hook', 'cuts')),
+        'loudness_mean_db': _as_float(features.get('loudness_mean_db')),
+        'speech_onset_ms': _as_int(features.get('speech_onset_ms')),
+        'transcript_segments': len(transcript) if isinstance(transcript, list) else None,
+        'near_duplicate_of': _as_text(_get(analysis, 'near_duplicate_of', 'video_url')),
+    }
+
+
+def normalize_report(item: Dict) -> Optional[Dict]:
+    """
+    把已导出的各种报告格式统一为 {'video_url', 'metadata', 'analysis', 'transcript'}：
+
+    - Streamlit 下载的报告 {'video_data': {'video_url'}, 'analysis', 'transcript'}
+    - API / 批量分析结果 {'video_url'?, 'metadata': {'video_url'}, 'analysis', 'transcript'?}
+    - example_full_pipeline 报告 {'source_video': {'url', 'engagement'}, 'ai_analysis'}
+
+    Returns:
+        统一格式的报告，无法识别（或批量分析失败的记录）时返回 None
+    """
+    if not isinstance(item, dict):
+        return None
+    analysis = item.get('analysis') or item.get('ai_analysis')
+    source_video = item.get('source_video') or {}
+    if source_video:
+        metadata = {
+            'video_url': source_video.get('url'),
+            'author': source_video.get('author'),
+            'description': source_video.get('description'),
+            **(source_video.get('engagement') or {}),
+        }
+    else:
+        metadata = item.get('video_data') or item.get('metadata') or {}
+    video_url = item.get('video_url') or metadata.get('video_url')
+    if not isinstance(analysis, dict) or not video_url:
+        return None
+    return {
+        'video_url': video_url,
+        'metadata': metadata,
+        'analysis': analysis,
+        'transcript': item.get('transcript'),
+    }
+
+
+def read_report_file(path: str) -> Iterator[Dict]:
+    """
+    读取已导出的分析报告文件（JSON 或 JSONL），格式见 normalize_report
+
+    Returns:
+        统一格式的报告迭代器，无法识别的记录跳过
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            items = (json.loads(line) for line in f if line.strip())
+        else:
+            data = json.load(f)
+            items = data if isinstance(data, list) else [data]
+        for item in items:
+            report = normalize_report(item)
+            if report is not None:
+                yield report
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("导出 Parquet / Arrow 需要安装 pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def arrow_schema(include_report: bool = False):
+    """
+    导出文件的 Arrow schema（FLAT_COLUMNS，可选附加 report JSON 列）
+    """
+    pa = _require_pyarrow()
+    types = {
+        'TEXT': pa.string(),
+        'INTEGER': pa.int64(),
+        'REAL': pa.float64(),
+        'TIMESTAMP': pa.timestamp('ms', tz='UTC'),
+    }
+    fields = [pa.field(name, types[kind]) for name, kind in FLAT_COLUMNS]
+    if include_report:
+        fields.append(pa.field('report', pa.string()))
+    return pa.schema(fields)
+
+
+class AnalysisStore:
+    """
+    分析结果存储
+
+    - 只追加：同一视频每次分析都新增一行，latest_analyses 视图取每个视频最新的一份
+    - append 只写内存缓冲，由后台线程每 flush_interval 秒（或缓冲达到 batch_size 时）批量写入（一次事务）
+    - 扁平化列直接存为 SQLite 列，可以直接用 SQL 聚合；导出 Parquet / Arrow 时只读这些列，不解析 JSON
+    """
+
+    def __init__(self, db_path: Optional[str] = None, batch_size: int = 200, flush_interval: float = 1.0):
+        """
+        Args:
+            db_path: SQLite 文件路径（可选，默认存放在本地数据目录）
+            batch_size: 缓冲达到该行数时立即触发写入
+            flush_interval: 批量写入间隔（秒）
+        """
+        self.db_path = str(db_path or get_data_dir('store') / 'analyses.sqlite3')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                {', '.join(f'{name} {kind}' for name, kind in FLAT_COLUMNS)},
+                report TEXT NOT NULL
+            )
+        """)
+        # 新版本增加的列补到已有的表上
+        existing = {row[1] for row in self._conn.execute('PRAGMA table_info(analyses)')}
+        for name, kind in FLAT_COLUMNS:
+            if name not in existing:
+                self._conn.execute(f'ALTER TABLE analyses ADD COLUMN {name} {kind}')
+        self._conn.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_analyses_video ON analyses (video_id, id);
+            CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses (created_at);
+            CREATE VIEW IF NOT EXISTS latest_analyses AS
+                SELECT * FROM analyses WHERE id IN (SELECT MAX(id) FROM analyses GROUP BY video_id);
+        """)
+        self._conn.commit()
+
+        self._pending: List[tuple] = []
+        self.written = 0
+
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_loop, name='analysis-store-flush', daemon=True)
+        self._flush_thread.start()
+
+    # ---- 写入 ----
+
+    def append(
+        self,
+        video_url: str,
+        analysis: Dict,
+        metadata: Optional[Dict] = None,
+        transcript: Optional[List[Dict]] = None,
+        source: Optional[str] = None
+    ):
+        """
+        追加一份分析报告（只写内存缓冲，不阻塞调用方）
+
+        Args:
+            video_url: 视频 URL
+            analysis: 分析结果
+            metadata: 视频元数据（可选，raw_data 不保存）
+            transcript: 转录片段（可选）
+            source: 写入来源（可选），例如 'streamlit' / 'pipeline' / 'import'
+        """
+        metadata = {key: value for key, value in (metadata or {}).items() if key != 'raw_data'}
+        flat = flatten_report(video_url, analysis, metadata, transcript, source)
+        report = json.dumps(
+            {'metadata': metadata, 'analysis': analysis, 'transcript': transcript},
+            ensure_ascii=False, default=str
+        )
+        with self._lock:
+            self._pending.append(tuple(flat[name] for name in COLUMN_NAMES) + (report,))
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+
+    def flush(self) -> int:
+        """
+        立即写入缓冲中的报告
+
+        Returns:
+            写入的行数
+        """
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        with self._db_lock:
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        f"INSERT INTO analyses ({', '.join(COLUMN_NAMES)}, report) "
+                        f"VALUES ({', '.join('?' * (len(COLUMN_NAMES) + 1))})",
+                        rows
+                    )
+            except Exception:
+                # 写入失败时放回缓冲，下一轮重试
+                with self._lock:
+                    self._pending[:0] = rows
+                raise
+        self.written += len(rows)
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ 分析结果写入失败: {e}")
+
+    # ---- 读取 ----
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        """
+        最近写入的报告（不含 JSON）
+
+        Returns:
+            [{'id', 'video_url', 'author', 'hook_type', 'remake_difficulty', 'views', 'source', 'created_at'}]，
+            按写入时间倒序
+        """
+        self.flush()
+        columns = ('id', 'video_url', 'author', 'hook_type', 'remake_difficulty', 'views', 'source', 'created_at')
+        with self._db_lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM analyses ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def get(self, video_url: Optional[str] = None, record_id: Optional[int] = None) -> Optional[Dict]:
+        """
+        读取一份完整报告：指定 record_id 时按行读取，否则取该视频最新的一份
+
+        Returns:
+            {'id', 'video_url', 'metadata', 'analysis', 'transcript', 'source', 'created_at'}，不存在时返回 None
+        """
+        self.flush()
+        query = 'SELECT id, video_url, source, created_at, report FROM analyses '
+        if record_id is not None:
+            query, params = query + 'WHERE id = ?', (record_id,)
+        else:
+            query, params = query + 'WHERE video_id = ? ORDER BY id DESC LIMIT 1', (extract_video_id(video_url),)
+        with self._db_lock:
+            row = self._conn.execute(query, params).fetchone()
+        if row is None:
+            return None
+        report = json.loads(row[4])
+        return {'id': row[0], 'video_url': row[1], 'source': row[2], 'created_at': row[3], **report}
+
+    def iter_batches(
+        self,
+        latest_only: bool = True,
+        since: Optional[float] = None,
+        include_report: bool = False,
+        batch_rows: int = EXPORT_BATCH_ROWS
+    ) -> Iterator[List[tuple]]:
+        """
+        分批读取扁平化的行（列顺序同 FLAT_COLUMNS，include_report 时末尾附加 report JSON）
+
+        Args:
+            latest_only: 每个视频只取最新的一份
+            since: 只读取该时间（Unix 秒）之后写入的报告（可选）
+            include_report: 是否附带完整报告 JSON
+            batch_rows: 每批行数
+        """
+        self.flush()
+        columns = COLUMN_NAMES + (['report'] if include_report else [])
+        conditions, params = [], []
+        if latest_only:
+            conditions.append('id IN (SELECT MAX(id) FROM analyses GROUP BY video_id)')
+        if since is not None:
+            conditions.append('created_at >= ?')
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        # 独立连接读取，导出期间不阻塞写入
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(columns)} FROM analyses {where} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def to_arrow(self, latest_only: bool = True, since: Optional[float] = None, include_report: bool = False):
+        """
+        读取为 pyarrow.Table（需要安装 pyarrow）
+        """
+        pa = _require_pyarrow()
+        schema = arrow_schema(include_report)
+        batches = [
+            _record_batch(rows, schema)
+            for rows in self.iter_batches(latest_only, since, include_report)
+        ]
+        return pa.Table.from_batches(batches, schema=schema)
+
+    def export(
+        self,
+        path: str,
+        file_format: Optional[str] = None,
+        latest_only: bool = True,
+        since: Optional[float] = None,
+        include_report: bool = False
+    ) -> int:
+        """
+        导出为 Parquet 或 Arrow IPC 文件（需要安装 pyarrow，分批写入，内存占用与总行数无关）
+
+        Args:
+            path: 输出文件路径
+            file_format: 'parquet' 或 'arrow'（可选，默认按扩展名判断，.arrow / .feather / .ipc 为 Arrow）
+            latest_only: 每个视频只导出最新的一份
+            since: 只导出该时间（Unix 秒）之后写入的报告（可选）
+            include_report: 是否附带完整报告 JSON 列
+
+        Returns:
+            导出的行数
+        """
+        pa = _require_pyarrow()
+        if file_format is None:
+            file_format = 'arrow' if os.path.splitext(path)[1].lower() in ('.arrow', '.feather', '.ipc') else 'parquet'
+        if file_format not in ('parquet', 'arrow'):
+            raise ValueError(f"未知的导出格式: {file_format}（可选: parquet / arrow）")
+
+        schema = arrow_schema(include_report)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        if file_format == 'parquet':
+            writer = pa.parquet.ParquetWriter(temp_path, schema, compression='zstd')
+        else:
+            writer = pa.ipc.new_file(temp_path, schema)
+        total = 0
+        try:
+            for rows in self.iter_batches(latest_only, since, include_report):
+                batch = _record_batch(rows, schema)
+                if file_format == 'parquet':
+                    writer.write_batch(batch)
+                else:
+                    writer.write(batch)
+                total += len(rows)
+            writer.close()
+            os.replace(temp_path, path)
+        except BaseException:
+            writer.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return total
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'analyses', 'videos', 'pending', 'written'}
+        """
+        with self._lock:
+            pending = len(self._pending)
+        with self._db_lock:
+            analyses, videos = self._conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT video_id) FROM analyses'
+            ).fetchone()
+        return {'analyses': analyses, 'videos': videos, 'pending': pending, 'written': self.written}
+
+    def close(self):
+        """停止后台线程并写入剩余报告"""
+        self._stop_event.set()
+        self._wake.set()
+        self._flush_thread.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+def _record_batch(rows: List[tuple], schema):
+    """SQLite 行 -> pyarrow.RecordBatch（TIMESTAMP 列由 Unix 秒转换为毫秒）"""
+    pa = _require_pyarrow()
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_timestamp(field.type):
+            values = [int(value * 1000) if value is not None else None for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+_default_store: Optional[AnalysisStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_analysis_store() -> Optional[AnalysisStore]:
+    """
+    获取进程内共享的分析结果存储，ANALYSIS_STORE=off 时返回 None（默认开启）
+
+    文件位置读取 ANALYSIS_STORE_PATH（默认本地数据目录下的 store/analyses.sqlite3）
+    """
+    global _default_store
+    if os.getenv('ANALYSIS_STORE', 'on').lower() not in ('1', 'on', 'true'):
+        return None
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = AnalysisStore(os.getenv('ANALYSIS_STORE_PATH') or None)
+    return _default_store
+
+
+def main():
+    """
+    命令行入口
+
+    示例:
+        python -m src.analysis_store import batch_results.jsonl report.json
+        python -m src.analysis_store export analyses.parquet
+        python -m src.analysis_store export analyses.arrow --all-versions --with-report
+    """
+    parser = argparse.ArgumentParser(description='分析结果存储')
+    parser.add_argument('--db', default=os.getenv('ANALYSIS_STORE_PATH') or None, help='SQLite 文件路径')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='导入已导出的分析报告（JSON / JSONL）')
+    import_parser.add_argument('paths', nargs='+')
+
+    export_parser = subparsers.add_parser('export', help='导出为 Parquet / Arrow')
+    export_parser.add_argument('path', help='输出文件（.parquet / .arrow）')
+    export_parser.add_argument('--format', choices=('parquet', 'arrow'), help='默认按扩展名判断')
+    export_parser.add_argument('--all-versions', action='store_true', help='导出同一视频的全部历史版本')
+    export_parser.add_argument('--since', help='只导出该日期之后的报告（YYYY-MM-DD）')
+    export_parser.add_argument('--with-report', action='store_true', help='附带完整报告 JSON 列')
+
+    recent_parser = subparsers.add_parser('recent', help='最近写入的报告')
+    recent_parser.add_argument('-n', type=int, default=10)
+
+    subparsers.add_parser('stats', help='存储统计')
+    args = parser.parse_args()
+
+    store = AnalysisStore(args.db)
+    try:
+        if args.command == 'import':
+            for path in args.paths:
+                count = 0
+                for report in read_report_file(path):
+                    store.append(
+                        report['video_url'], report['analysis'], report['metadata'], report['transcript'],
+                        source='import'
+                    )
+                    count += 1
+                store.flush()
+                print(f"✅ {path}: 导入 {count} 份报告")
+        elif args.command == 'export':
+            since = time.mktime(time.strptime(args.since, '%Y-%m-%d')) if args.since else None
+            start = time.perf_counter()
+            try:
+                count = store.export(
+                    args.path, args.format, latest_only=not args.all_versions, since=since,
+                    include_report=args.with_report
+                )
+            except ImportError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            print(f"✅ 已导出 {count} 行到 {args.path}（{time.perf_counter() - start:.1f} 秒）")
+        elif args.command == 'recent':
+            for item in store.recent(args.n):
+                created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['created_at']))
+                print(f"{created}  {item['author'] or '-':<20} {item['hook_type'] or '-':<30} {item['video_url']}")
+        else:
+            print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Audio Stream
+用 ffmpeg 管道流式解码视频音轨为 PCM，按固定时长切块，边解码边交给转录器，不落盘中间文件
+"""
+
+import io
+import wave
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import Iterator, Optional, List
+
+
+# ASR 常用参数：16 kHz、单声道、16 位有符号整数
+SAMPLE_RATE = 16000
+CHANNELS = 1
+SAMPLE_WIDTH = 2
+
+
+@dataclass
+class AudioChunk:
+    """一段 PCM 音频（s16le 单声道）"""
+    index: int
+    start_seconds: float
+    pcm: bytes
+    sample_rate: int = SAMPLE_RATE
+
+    @property
+    def duration_seconds(self) -> float:
+        return len(self.pcm) / (SAMPLE_WIDTH * CHANNELS * self.sample_rate)
+
+    def to_wav(self) -> bytes:
+        """封装为内存中的 WAV 文件（Whisper / Gemini 均可直接接收）"""
+        return pcm_to_wav(self.pcm, self.sample_rate)
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """
+    为 PCM 数据加上 WAV 头
+
+    Args:
+        pcm: s16le 单声道 PCM
+        sample_rate: 采样率
+
+    Returns:
+        WAV 文件字节
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def format_timestamp(seconds: float) -> str:
+    """秒数转换为 MM:SS"""
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def parse_timestamp(timestamp: str) -> float:
+    """MM:SS / HH:MM:SS 转换为秒数，无法解析时返回 0"""
+    try:
+        total = 0.0
+        for part in str(timestamp).strip().split(':'):
+            total = total * 60 + float(part)
+        return total
+    except ValueError:
+        return 0.0
+
+
+def build_ffmpeg_command(
+    video_path: str,
+    sample_rate: int = SAMPLE_RATE,
+    keep_audio_path: Optional[str] = None
+) -> List[str]:
+    """
+    构造 ffmpeg 命令：PCM 写到 stdout；指定 keep_audio_path 时同时编码一份 MP3 到该路径
+
+    Args:
+        video_path: 视频文件路径
+        sample_rate: 输出采样率
+        keep_audio_path: 需要保留的 MP3 路径（可选）
+
+    Returns:
+        命令参数列表
+    """
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error',
+        '-i', video_path,
+        '-vn',
+        '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ar', str(sample_rate), '-ac', str(CHANNELS),
+        'pipe:1',
+    ]
+    if keep_audio_path:
+        command += [
+            '-vn', '-acodec', 'libmp3lame',
+            '-ar', str(sample_rate), '-ac', str(CHANNELS),
+            '-y', keep_audio_path,
+        ]
+    return command
+
+
+def iter_pcm_chunks(
+    video_path: str,
+    chunk_seconds: float = 30,
+    sample_rate: int = SAMPLE_RATE,
+    keep_audio_path: Optional[str] = None,
+    read_size: int = 64 * 1024
+) -> Iterator[AudioChunk]:
+    """
+    流式解码视频音轨，每凑满 chunk_seconds 秒就产出一个 AudioChunk
+
+    ffmpeg 在后台持续解码，调用方处理当前块（例如上传转录）时下一块已在解码中
+
+    Args:
+        video_path: 视频文件路径
+        chunk_seconds: 每块时长（秒）
+        sample_rate: 采样率
+        keep_audio_path: 同时保留一份 MP3 的路径（可选，默认不落盘）
+        read_size: 每次从管道读取的字节数
+
+    Yields:
+        AudioChunk
+    """
+    chunk_bytes = int(chunk_seconds * sample_rate) * SAMPLE_WIDTH * CHANNELS
+    process = subprocess.Popen(
+        build_ffmpeg_command(video_path, sample_rate, keep_audio_path),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    # stderr 单独线程读取，避免管道写满后 ffmpeg 阻塞
+    stderr_parts: List[bytes] = []
+    stderr_thread = threading.Thread(
+        target=lambda: stderr_parts.append(process.stderr.read()), daemon=True
+    )
+    stderr_thread.start()
+
+    index = 0
+    buffer = bytearray()
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(read_size)
+            if not data:
+                break
+            buffer.extend(data)
+            while len(buffer) >= chunk_bytes:
+                pcm = bytes(buffer[:chunk_bytes])
+                del buffer[:chunk_bytes]
+                yield AudioChunk(index, index * chunk_seconds, pcm, sample_rate)
+                index += 1
+
+        returncode = process.wait()
+        stderr_thread.join()
+        if returncode != 0:
+            message = b''.join(stderr_parts).decode(errors='replace').strip()
+            raise ValueError(f"音频提取失败: {message or f'ffmpeg 退出码 {returncode}'}")
+
+        # 末尾不足一块的部分（奇数字节截掉，保证样本对齐）
+        tail = len(buffer) - len(buffer) % SAMPLE_WIDTH
+        if tail:
+            yield AudioChunk(index, index * chunk_seconds, bytes(buffer[:tail]), sample_rate)
+        finished = True
+    finally:
+        if not finished and process.poll() is None:
+            # 调用方提前结束迭代或出错：停止 ffmpeg
+            process.kill()
+            process.wait()
+        process.stdout.close()
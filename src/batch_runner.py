@@ -0,0 +1,319 @@
+"""
+Batch Runner
+批量分析数百个视频 URL：分阶段限流、结果流式写入 JSONL、崩溃后断点续跑
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, List, Union, Callable, Iterable
+
+from .tiktok_fetcher import TikTokFetcher
+from .video_analyzer import VideoAnalyzer
+from .pipeline import PIPELINE_STAGES, AsyncVideoPipeline
+from .result_cache import AnalysisCache
+
+
+# 默认各阶段并发数
+DEFAULT_STAGE_LIMITS = {
+    'apify': 4,
+    'download': 8,
+    'upload': 8,
+    'generate': 4,
+}
+
+
+def stage_limits_from_env(defaults: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    读取各阶段并发数：PIPELINE_APIFY_CONCURRENCY / PIPELINE_DOWNLOAD_CONCURRENCY /
+    PIPELINE_UPLOAD_CONCURRENCY / PIPELINE_GENERATE_CONCURRENCY，未设置时使用默认值（0 表示不限制）
+
+    Args:
+        defaults: 默认并发数（可选，默认 DEFAULT_STAGE_LIMITS）
+
+    Returns:
+        {stage: limit}
+    """
+    limits = dict(DEFAULT_STAGE_LIMITS if defaults is None else defaults)
+    for stage in PIPELINE_STAGES:
+        value = os.getenv(f'PIPELINE_{stage.upper()}_CONCURRENCY')
+        if value:
+            limits[stage] = int(value)
+    return limits
+
+
+def load_urls(source: Union[str, Path, Iterable[str]]) -> List[str]:
+    """
+    读取待分析的 URL 列表（保持顺序并去重）
+
+    Args:
+        source: URL 列表，或文本文件路径（每行一个 URL，# 开头为注释）
+
+    Returns:
+        URL 列表
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    else:
+        lines = list(source)
+
+    urls = []
+    seen = set()
+    for line in lines:
+        url = line.strip()
+        if not url or url.startswith('#') or url in seen:
+            continue
+        seen.add(url)
+        urls.append(url)
+    return urls
+
+
+def load_completed_urls(output_path: Union[str, Path]) -> set:
+    """
+    从已有输出文件中读取成功完成的 URL（用于断点续跑）
+
+    最后一行可能因崩溃写了一半，解析失败的行直接跳过；失败记录会在续跑时重试
+
+    Args:
+        output_path: JSONL 输出文件路径
+
+    Returns:
+        已成功完成的 URL 集合
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') == 'ok':
+                completed.add(record.get('video_url'))
+    return completed
+
+
+class BatchRunner:
+    """
+    批量视频分析器
+
+    基于 AsyncVideoPipeline，按 Apify / yt-dlp / Gemini 上传 / Gemini 生成
+    四个阶段分别限制并发，每完成一个视频立即追加一行到 JSONL 输出文件
+    """
+
+    def __init__(
+        self,
+        fetcher: TikTokFetcher,
+        analyzer: VideoAnalyzer,
+        output_path: Union[str, Path],
+        stage_limits: Optional[Dict[str, int]] = None,
+        max_in_flight: int = 32,
+        cache: Optional[AnalysisCache] = None,
+        on_result: Optional[Callable[[Dict], None]] = None,
+        prefetch_metadata: bool = True,
+        pipeline: Optional[AsyncVideoPipeline] = None
+    ):
+        """
+        初始化批量分析器
+
+        Args:
+            fetcher: TikTok 元数据获取器
+            analyzer: 视频分析器
+            output_path: JSONL 输出文件路径（已存在时追加并跳过已完成的 URL）
+            stage_limits: 各阶段并发数，默认 DEFAULT_STAGE_LIMITS
+            max_in_flight: 同时处理的视频数上限（限制本地临时文件数量）
+            cache: 分析结果缓存（可选），命中时跳过全部网络请求
+            on_result: 每完成一个视频时的回调（可选），参数为写入的记录
+            prefetch_metadata: 是否用 TikTokFetcher.fetch_many 把所有元数据合并到少量 Actor 运行中获取，
+                               默认 True；预取失败或缺失的 URL 回退为单独获取
+            pipeline: 共享的流水线（可选，例如后端进程级的流水线，与其他请求共用线程池、请求合并和各阶段并发名额）；
+                      阶段并发由该流水线创建时的 stage_limits 决定（不能同时传入 stage_limits），close 时也不会关闭它
+        """
+        if pipeline is not None and stage_limits is not None:
+            raise ValueError("传入共享流水线时请在创建流水线时设置 stage_limits")
+        self.fetcher = fetcher
+        self._owns_pipeline = pipeline is None
+        if pipeline is None:
+            limits = dict(DEFAULT_STAGE_LIMITS)
+            limits.update(stage_limits or {})
+            self.stage_limits = limits
+            self.pipeline = AsyncVideoPipeline(fetcher, analyzer, stage_limits=limits)
+        else:
+            self.stage_limits = pipeline.stage_limits
+            self.pipeline = pipeline
+        self.output_path = Path(output_path)
+        self.max_in_flight = max_in_flight
+        self.cache = cache
+        self.on_result = on_result
+        self.prefetch_metadata = prefetch_metadata
+
+        self.stats = {'total': 0, 'skipped': 0, 'ok': 0, 'error': 0, 'cached': 0}
+
+    def _write_record(self, output_file, record: Dict):
+        """追加一行结果并立即刷盘，保证崩溃时已完成的结果不丢失"""
+        output_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        output_file.flush()
+        os.fsync(output_file.fileno())
+
+    def _prefetch_metadata(self, urls: List[str], futures: Dict[str, asyncio.Future],
+                           loop: asyncio.AbstractEventLoop):
+        """
+        在线程中批量获取元数据，每拿到一条就通知对应的 future
+
+        出错或缺失的 URL 对应 None，由流水线回退为单独获取
+        """
+        def resolve(url: str, video_data: Optional[Dict]):
+            future = futures.get(url)
+            if future is not None and not future.done():
+                future.set_result(video_data)
+
+        try:
+            for url, video_data in self.fetcher.fetch_many(urls):
+                loop.call_soon_threadsafe(resolve, url, video_data)
+        except Exception as e:
+            print(f"⚠️ 批量获取元数据失败，回退为逐个获取: {e}")
+        finally:
+            for url in urls:
+                loop.call_soon_threadsafe(resolve, url, None)
+
+    async def _analyze_one(self, video_url: str, metadata: Optional[asyncio.Future] = None) -> Dict:
+        """分析单个视频，异常转换为 error 记录"""
+        start_time = time.time()
+        record = {'video_url': video_url}
+        try:
+            result = None
+            if self.cache:
+                result = await asyncio.to_thread(self.cache.get, video_url, kind='api_report')
+                record['cached'] = result is not None
+            if result is None:
+                result = await self.pipeline.run(video_url, metadata=metadata)
+                if self.cache:
+                    await asyncio.to_thread(self.cache.set, video_url, result, kind='api_report')
+            record.update(status='ok', metadata=result['metadata'], analysis=result['analysis'])
+        except Exception as e:
+            record.update(status='error', error=f"{type(e).__name__}: {e}")
+        record['elapsed_seconds'] = round(time.time() - start_time, 2)
+        record['finished_at'] = datetime.now().isoformat()
+        return record
+
+    async def run(self, urls: Union[str, Path, Iterable[str]]) -> Dict:
+        """
+        执行批量分析
+
+        Args:
+            urls: URL 列表或 URL 文件路径
+
+        Returns:
+            统计信息 {'total', 'skipped', 'ok', 'error', 'cached'}
+        """
+        all_urls = load_urls(urls)
+        completed = load_completed_urls(self.output_path)
+        pending = [url for url in all_urls if url not in completed]
+
+        self.stats.update(total=len(all_urls), skipped=len(all_urls) - len(pending))
+        print(f"📦 批量分析: 共 {len(all_urls)} 个 URL，已完成 {self.stats['skipped']} 个，"
+              f"待处理 {len(pending)} 个")
+        print(f"⚙️  阶段并发: {self.stage_limits}，同时处理上限: {self.max_in_flight}")
+
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        start_time = time.time()
+
+        # 未命中缓存的 URL 合并到少量 Apify Actor 运行中预取元数据，与下载同时进行
+        metadata_futures = {}
+        prefetch_task = None
+        if self.prefetch_metadata and pending:
+            uncached = pending
+            if self.cache:
+                uncached = [
+                    url for url in pending
+                    if not await asyncio.to_thread(self.cache.contains, url, kind='api_report')
+                ]
+            if uncached:
+                loop = asyncio.get_running_loop()
+                metadata_futures = {url: loop.create_future() for url in uncached}
+                prefetch_task = asyncio.ensure_future(asyncio.to_thread(
+                    self._prefetch_metadata, uncached, metadata_futures, loop
+                ))
+
+        async def worker(video_url: str) -> Dict:
+            async with in_flight:
+                return await self._analyze_one(video_url, metadata_futures.get(video_url))
+
+        with open(self.output_path, 'a', encoding='utf-8') as output_file:
+            tasks = [asyncio.ensure_future(worker(url)) for url in pending]
+            try:
+                for finished, future in enumerate(asyncio.as_completed(tasks), start=1):
+                    record = await future
+                    self._write_record(output_file, record)
+
+                    self.stats[record['status']] += 1
+                    if record.get('cached'):
+                        self.stats['cached'] += 1
+                    if self.on_result:
+                        self.on_result(record)
+
+                    icon = '✅' if record['status'] == 'ok' else '❌'
+                    print(f"{icon} [{finished}/{len(pending)}] {record['video_url']} "
+                          f"({record['elapsed_seconds']}s)")
+            finally:
+                for task in tasks:
+                    task.cancel()
+                if prefetch_task is not None:
+                    await asyncio.gather(prefetch_task, return_exceptions=True)
+
+        print(f"🏁 批量分析结束，耗时 {time.time() - start_time:.1f} 秒: {self.stats}")
+        return dict(self.stats)
+
+    def close(self):
+        """释放自建流水线的资源（共享的流水线由创建方关闭）"""
+        if self._owns_pipeline:
+            self.pipeline.close()
+
+
+def main():
+    """
+    命令行入口
+
+    示例:
+        python -m src.batch_runner urls.txt -o results.jsonl --generate 2
+    """
+    parser = argparse.ArgumentParser(description='批量分析 TikTok/Reels/Shorts 视频')
+    parser.add_argument('urls_file', help='URL 列表文件（每行一个 URL）')
+    parser.add_argument('-o', '--output', default='batch_results.jsonl',
+                        help='JSONL 输出文件，已存在时自动续跑（默认 batch_results.jsonl）')
+    for stage, limit in DEFAULT_STAGE_LIMITS.items():
+        parser.add_argument(f'--{stage}', type=int, default=limit,
+                            help=f'{stage} 阶段最大并发数（默认 {limit}）')
+    parser.add_argument('--max-in-flight', type=int, default=32,
+                        help='同时处理的视频数上限（默认 32）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用分析结果缓存')
+    parser.add_argument('--no-prefetch', action='store_true',
+                        help='不合并 Apify 调用，逐个获取元数据')
+    args = parser.parse_args()
+
+    analyzer = VideoAnalyzer()
+    runner = BatchRunner(
+        fetcher=TikTokFetcher(),
+        analyzer=analyzer,
+        output_path=args.output,
+        stage_limits={stage: getattr(args, stage) for stage in DEFAULT_STAGE_LIMITS},
+        max_in_flight=args.max_in_flight,
+        cache=None if args.no_cache else AnalysisCache.for_analyzer(analyzer),
+        prefetch_metadata=not args.no_prefetch
+    )
+    try:
+        asyncio.run(runner.run(args.urls_file))
+    finally:
+        runner.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Client Provider
+进程级共享的第三方客户端：OpenAI、Apify、HTTP Session
+每种配置只创建一次，复用连接池和 TLS 会话（Gemini 客户端见 gemini_pool.get_gemini_pool）
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from openai import OpenAI
+from apify_client import ApifyClient
+
+
+# HTTP 连接池大小（同一主机的最大保持连接数）
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '32'))
+
+_lock = threading.RLock()
+_openai_clients: Dict[Tuple[str, Optional[str]], OpenAI] = {}
+_apify_clients: Dict[str, ApifyClient] = {}
+_http_session: Optional[requests.Session] = None
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    """
+    获取共享的 OpenAI 客户端（httpx 连接池 keep-alive）
+
+    Args:
+        api_key: OpenAI API Key
+        base_url: 第三方代理 Base URL（可选）
+
+    Returns:
+        OpenAI 客户端
+    """
+    base_url = base_url.strip() if base_url else None
+    key = (api_key, base_url)
+    with _lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            import httpx
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE
+                ),
+                timeout=httpx.Timeout(600.0, connect=10.0)
+            )
+            if base_url:
+                client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+                print(f"✅ OpenAI Whisper API 已启用（使用代理: {base_url})")
+            else:
+                client = OpenAI(api_key=api_key, http_client=http_client)
+                print("✅ OpenAI Whisper API 已启用（官方 API）")
+            _openai_clients[key] = client
+        return client
+
+
+def get_apify_client(api_token: str) -> ApifyClient:
+    """
+    获取共享的 Apify 客户端
+
+    Args:
+        api_token: Apify API Token
+
+    Returns:
+        ApifyClient
+    """
+    with _lock:
+        client = _apify_clients.get(api_token)
+        if client is None:
+            client = _apify_clients[api_token] = ApifyClient(api_token)
+        return client
+
+
+def get_http_session() -> requests.Session:
+    """
+    获取共享的 requests Session（连接池 keep-alive，用于直接下载视频）
+
+    Returns:
+        requests.Session
+    """
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+        return _http_session
+
+
+def reset_clients():
+    """清空所有共享客户端（用于测试或凭证轮换）"""
+    global _http_session
+    with _lock:
+        for client in _openai_clients.values():
+            client.close()
+        if _http_session is not None:
+            _http_session.close()
+        _openai_clients.clear()
+        _apify_clients.clear()
+        _http_session = None
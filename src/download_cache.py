@@ -0,0 +1,284 @@
+"""
+Download Cache
+按规范视频 ID 持久化缓存已下载的视频文件，按字节预算做 LRU 淘汰
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Callable
+
+from .paths import get_data_dir
+from .result_cache import extract_video_id
+
+
+# 元数据文件名（每个缓存条目一个目录）
+_META_FILENAME = 'meta.json'
+
+
+class DownloadCache:
+    """
+    视频下载缓存
+
+    - 每个视频一个条目目录：<cache_dir>/<key>/video.<ext> + meta.json
+    - 下载先写入 <cache_dir>/.tmp/ 下的临时目录，完成后整体 rename 到位（原子操作），
+      并发请求不会读到写了一半的文件
+    - 同一进程内同一视频的并发请求共享一次下载（按 key 加锁）
+    - 总大小超出预算时按最近访问时间淘汰；最近 protect_seconds 内访问过的条目不淘汰，
+      避免正在上传 / 转录的文件被删除
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = 2 * 1024 ** 3,
+        protect_seconds: float = 600
+    ):
+        """
+        初始化下载缓存
+
+        Args:
+            cache_dir: 缓存目录（可选，默认存放在本地数据目录）
+            max_bytes: 字节预算，默认 2 GB
+            protect_seconds: 最近访问保护时间（秒），默认 600
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else get_data_dir('downloads')
+        self.tmp_dir = self.cache_dir / '.tmp'
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.protect_seconds = protect_seconds
+
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_downloaded = 0
+
+    @staticmethod
+    def make_key(video_url: str, variant: str = '') -> str:
+        """把规范视频 ID（和变体名，例如 audio）转换为安全的目录名"""
+        key = extract_video_id(video_url).replace(':', '_')
+        return f"{key}-{variant}" if variant else key
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    def lookup(self, video_url: str, variant: str = '') -> Optional[str]:
+        """
+        查找已缓存的视频文件
+
+        Args:
+            video_url: 视频 URL
+            variant: 同一视频的不同下载内容（可选，例如只含音频的 audio）
+
+        Returns:
+            本地文件路径，未缓存时返回 None
+        """
+        entry_dir = self._entry_dir(self.make_key(video_url, variant))
+        try:
+            with open(entry_dir / _META_FILENAME, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        file_path = entry_dir / meta['filename']
+        if not file_path.exists():
+            return None
+
+        # 刷新访问时间（用于 LRU）
+        try:
+            os.utime(entry_dir, None)
+        except FileNotFoundError:
+            return None
+        return str(file_path)
+
+    def partial_path(self, video_url: str) -> str:
+        """
+        未完成下载的固定存放路径（用于断点续传，进程重启后仍可继续）
+        """
+        return str(self.tmp_dir / f"{self.make_key(video_url)}.partial")
+
+    def owns(self, file_path: Optional[str]) -> bool:
+        """判断文件是否位于缓存目录中（缓存文件不应被调用方删除）"""
+        if not file_path:
+            return False
+        try:
+            Path(file_path).resolve().relative_to(self.cache_dir.resolve())
+            return True
+        except ValueError:
+            return False
+
+    def get_or_download(self, video_url: str, download_fn: Callable[[str], str], variant: str = '') -> str:
+        """
+        读取缓存，未命中时下载并写入缓存
+
+        Args:
+            video_url: 视频 URL（用于计算缓存键）
+            download_fn: 下载函数，参数为临时目录，返回下载好的文件路径（必须位于该目录中）
+            variant: 同一视频的不同下载内容（可选，例如只含音频的 audio）
+
+        Returns:
+            缓存中的本地文件路径
+        """
+        key = self.make_key(video_url, variant)
+        cached_path = self.lookup(video_url, variant)
+        if cached_path:
+            self.hits += 1
+            print(f"⚡ 命中下载缓存: {cached_path}")
+            return cached_path
+
+        with self._key_lock(key):
+            # 等锁期间其他请求可能已经下载完成
+            cached_path = self.lookup(video_url, variant)
+            if cached_path:
+                self.hits += 1
+                print(f"⚡ 命中下载缓存: {cached_path}")
+                return cached_path
+
+            self.misses += 1
+            staging_dir = self.tmp_dir / f"{key}-{uuid.uuid4().hex}"
+            staging_dir.mkdir(parents=True)
+            try:
+                downloaded = Path(download_fn(str(staging_dir)))
+                filename = f"video{downloaded.suffix or '.mp4'}"
+                if downloaded.parent.resolve() != staging_dir.resolve():
+                    shutil.move(str(downloaded), staging_dir / filename)
+                else:
+                    downloaded.rename(staging_dir / filename)
+
+                size = (staging_dir / filename).stat().st_size
+                with open(staging_dir / _META_FILENAME, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        'video_id': extract_video_id(video_url),
+                        'video_url': video_url,
+                        'filename': filename,
+                        'size': size,
+                        'created_at': time.time(),
+                    }, f, ensure_ascii=False)
+
+                entry_dir = self._entry_dir(key)
+                try:
+                    os.rename(staging_dir, entry_dir)
+                except OSError:
+                    # 其他进程已写入同一条目：丢弃本次下载，复用已有文件
+                    existing = self.lookup(video_url, variant)
+                    if existing:
+                        shutil.rmtree(staging_dir, ignore_errors=True)
+                        return existing
+                    # 残留的不完整条目（缺少 meta.json）：替换
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    os.rename(staging_dir, entry_dir)
+
+                self.bytes_downloaded += size
+            except BaseException:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+
+        self.evict()
+        return str(entry_dir / filename)
+
+    def _entry_size(self, entry_dir: Path) -> int:
+        total = 0
+        for path in entry_dir.iterdir():
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                continue
+        return total
+
+    def total_bytes(self) -> int:
+        """当前缓存占用的字节数"""
+        return sum(self._entry_size(d) for d in self._entries())
+
+    def _entries(self):
+        return [d for d in self.cache_dir.iterdir() if d.is_dir() and d.name != '.tmp']
+
+    def evict(self) -> int:
+        """
+        按最近访问时间淘汰条目直到总大小不超过预算
+
+        Returns:
+            淘汰的条目数
+        """
+        with self._evict_lock:
+            entries = []
+            for entry_dir in self._entries():
+                try:
+                    entries.append((entry_dir.stat().st_mtime, entry_dir, self._entry_size(entry_dir)))
+                except FileNotFoundError:
+                    continue
+
+            total = sum(size for _, _, size in entries)
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            now = time.time()
+            for mtime, entry_dir, size in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                if now - mtime < self.protect_seconds:
+                    continue
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                removed += 1
+
+            self.evictions += removed
+            if removed:
+                print(f"🧹 下载缓存淘汰 {removed} 个视频，当前占用 {total / 1024 ** 2:.1f} MB")
+            return removed
+
+    def stats(self) -> Dict:
+        """
+        缓存统计
+
+        Returns:
+            {'entries', 'total_bytes', 'max_bytes', 'hits', 'misses', 'evictions', 'bytes_downloaded'}
+        """
+        return {
+            'entries': len(self._entries()),
+            'total_bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes_downloaded': self.bytes_downloaded,
+        }
+
+
+_default_cache: Optional[DownloadCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_download_cache() -> Optional[DownloadCache]:
+    """
+    获取进程内共享的下载缓存
+
+    字节预算读取环境变量 DOWNLOAD_CACHE_MAX_BYTES（默认 2 GB），设为 0 时禁用缓存并返回 None
+    """
+    global _default_cache
+    max_bytes = int(os.getenv('DOWNLOAD_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+    if max_bytes <= 0:
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = DownloadCache(
+                    cache_dir=os.getenv('DOWNLOAD_CACHE_DIR') or None,
+                    max_bytes=max_bytes
+                )
+    return _default_cache
@@ -0,0 +1,269 @@
+"""
+Chunked Downloader
+基于共享连接池的 HTTP 下载器：大块流式写入、Range 断点续传、多连接分段并行、大小 / 校验和验证
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple, List
+
+import requests
+
+from .clients import get_http_session
+
+
+# 默认块大小 1 MB（原实现为 8 KB）
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadVerificationError(ValueError):
+    """下载文件的大小或校验和与预期不符"""
+
+
+class ChunkedDownloader:
+    """
+    HTTP 视频下载器
+
+    - 复用 clients.get_http_session() 的连接池
+    - 未完成的数据写入 .part 文件，连接中断后用 Range 请求从断点继续
+    - 服务端支持 Range 且文件较大时，按 parallel_segments 个连接分段并行下载
+    - 下载完成后校验大小（Content-Length）和可选的 SHA-256
+    - 每次下载返回吞吐量指标，并累计到 self.stats
+    """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        chunk_size: Optional[int] = None,
+        parallel_segments: Optional[int] = None,
+        segment_threshold: int = 16 * 1024 * 1024,
+        max_retries: int = 3,
+        timeout: float = 60
+    ):
+        """
+        初始化下载器
+
+        Args:
+            session: requests Session（可选，默认使用共享连接池）
+            chunk_size: 读取块大小（字节），默认读取 DOWNLOAD_CHUNK_SIZE（默认 1 MB）
+            parallel_segments: 并行分段数，默认读取 DOWNLOAD_PARALLEL_SEGMENTS（默认 4），1 表示不分段
+            segment_threshold: 文件大于该字节数时才分段并行，默认 16 MB
+            max_retries: 连接中断后的最大续传次数
+            timeout: 连接 / 读取超时（秒）
+        """
+        self.session = session or get_http_session()
+        self.chunk_size = chunk_size or int(os.getenv('DOWNLOAD_CHUNK_SIZE', str(DEFAULT_CHUNK_SIZE)))
+        self.parallel_segments = parallel_segments or int(os.getenv('DOWNLOAD_PARALLEL_SEGMENTS', '4'))
+        self.segment_threshold = segment_threshold
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self._stats_lock = threading.Lock()
+        self.stats = {'downloads': 0, 'bytes': 0, 'seconds': 0.0, 'resumed_bytes': 0, 'retries': 0}
+
+    def probe(self, url: str) -> Tuple[Optional[int], bool]:
+        """
+        探测文件大小以及服务端是否支持 Range
+
+        Returns:
+            (文件大小或 None, 是否支持 Range)
+        """
+        try:
+            response = self.session.get(
+                url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout
+            )
+            with response:
+                if response.status_code == 206:
+                    content_range = response.headers.get('Content-Range', '')
+                    total = content_range.rsplit('/', 1)[-1]
+                    return (int(total) if total.isdigit() else None), True
+                if response.ok:
+                    length = response.headers.get('Content-Length')
+                    return (int(length) if length and length.isdigit() else None), False
+                response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"⚠️ 探测文件信息失败，使用普通下载: {e}")
+        return None, False
+
+    def download(
+        self,
+        url: str,
+        output_path: str,
+        partial_path: Optional[str] = None,
+        expected_size: Optional[int] = None,
+        expected_sha256: Optional[str] = None
+    ) -> Dict:
+        """
+        下载文件
+
+        Args:
+            url: 下载链接
+            output_path: 最终文件路径（下载完成并校验通过后才出现）
+            partial_path: 未完成数据的存放路径（可选，默认 output_path + '.part'），
+                          传入固定路径可在进程重启后继续下载
+            expected_size: 预期字节数（可选，默认使用服务端返回的大小）
+            expected_sha256: 预期 SHA-256（可选）
+
+        Returns:
+            下载指标 {'path', 'bytes', 'seconds', 'throughput_mbps', 'resumed_bytes',
+                      'segments', 'retries'}
+        """
+        output_path = Path(output_path)
+        partial_path = Path(partial_path) if partial_path else output_path.with_name(output_path.name + '.part')
+        partial_path.parent.mkdir(parents=True, exist_ok=True)
+
+        start_time = time.time()
+        total_size, accepts_ranges = self.probe(url)
+        if expected_size is None:
+            expected_size = total_size
+
+        use_segments = (
+            accepts_ranges and total_size and self.parallel_segments > 1
+            and total_size >= self.segment_threshold
+        )
+        if use_segments:
+            resumed, retries = self._download_segmented(url, partial_path, total_size)
+            segments = self.parallel_segments
+        else:
+            resumed, retries = self._download_stream(url, partial_path, accepts_ranges)
+            segments = 1
+
+        self._verify(partial_path, expected_size, expected_sha256)
+        os.replace(partial_path, output_path)
+
+        elapsed = max(time.time() - start_time, 1e-6)
+        size = output_path.stat().st_size
+        fetched = size - resumed
+        metrics = {
+            'path': str(output_path),
+            'bytes': size,
+            'seconds': round(elapsed, 3),
+            'throughput_mbps': round(fetched * 8 / elapsed / 1e6, 2),
+            'resumed_bytes': resumed,
+            'segments': segments,
+            'retries': retries,
+        }
+        with self._stats_lock:
+            self.stats['downloads'] += 1
+            self.stats['bytes'] += fetched
+            self.stats['seconds'] += elapsed
+            self.stats['resumed_bytes'] += resumed
+            self.stats['retries'] += retries
+
+        print(f"📊 下载 {size / 1024 ** 2:.1f} MB，耗时 {elapsed:.1f} 秒，"
+              f"{metrics['throughput_mbps']} Mbps（续传 {resumed} 字节，{segments} 个连接）")
+        return metrics
+
+    def _fetch_range(self, url: str, path: Path, start: int, end: Optional[int],
+                     allow_resume: bool) -> Tuple[int, int]:
+        """
+        下载 [start, end] 区间到 path，path 已有内容时从断点继续
+
+        Returns:
+            (本次续传跳过的字节数, 重试次数)
+        """
+        retries = 0
+        resumed = path.stat().st_size if (allow_resume and path.exists()) else 0
+        if not allow_resume and path.exists():
+            path.unlink()
+
+        while True:
+            offset = path.stat().st_size if path.exists() else 0
+            if end is not None and start + offset > end:
+                return resumed, retries
+
+            headers = {}
+            if allow_resume and (start + offset > 0 or end is not None):
+                headers['Range'] = f"bytes={start + offset}-{'' if end is None else end}"
+
+            try:
+                response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+                with response:
+                    response.raise_for_status()
+                    mode = 'ab'
+                    if headers and response.status_code != 206:
+                        # 服务端忽略了 Range，只能从头开始
+                        mode = 'wb'
+                        resumed = 0
+                    with open(path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            if chunk:
+                                f.write(chunk)
+                return resumed, retries
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                retries += 1
+                if retries > self.max_retries or not allow_resume:
+                    raise
+                print(f"⚠️ 下载中断（{e}），{retries}/{self.max_retries} 次续传...")
+                time.sleep(min(2 ** retries, 10))
+
+    def _download_stream(self, url: str, partial_path: Path, accepts_ranges: bool) -> Tuple[int, int]:
+        """单连接流式下载"""
+        return self._fetch_range(url, partial_path, 0, None, allow_resume=accepts_ranges)
+
+    def _download_segmented(self, url: str, partial_path: Path, total_size: int) -> Tuple[int, int]:
+        """
+        多连接分段并行下载：每段写入独立的 .segN 文件（可单独续传），完成后按顺序合并
+        """
+        count = self.parallel_segments
+        segment_size = -(-total_size // count)
+        ranges: List[Tuple[int, int]] = [
+            (i * segment_size, min((i + 1) * segment_size, total_size) - 1)
+            for i in range(count) if i * segment_size < total_size
+        ]
+        segment_paths = [partial_path.with_name(f"{partial_path.name}.seg{i}") for i in range(len(ranges))]
+
+        # 若上次是单连接下载留下的 .part 文件，改为分段模式后无法复用
+        if partial_path.exists():
+            partial_path.unlink()
+
+        with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix='segment-download') as pool:
+            results = list(pool.map(
+                lambda args: self._fetch_range(url, args[0], args[1][0], args[1][1], allow_resume=True),
+                zip(segment_paths, ranges)
+            ))
+
+        with open(partial_path, 'wb') as out:
+            for segment_path in segment_paths:
+                with open(segment_path, 'rb') as segment:
+                    shutil.copyfileobj(segment, out, length=self.chunk_size)
+        for segment_path in segment_paths:
+            segment_path.unlink()
+
+        return sum(r[0] for r in results), sum(r[1] for r in results)
+
+    def _verify(self, path: Path, expected_size: Optional[int], expected_sha256: Optional[str]):
+        """校验大小和 SHA-256，不通过时删除文件并抛出异常"""
+        size = path.stat().st_size
+        if expected_size is not None and size != expected_size:
+            path.unlink()
+            raise DownloadVerificationError(f"文件大小不符: 预期 {expected_size} 字节，实际 {size} 字节")
+
+        if expected_sha256:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                    digest.update(chunk)
+            if digest.hexdigest().lower() != expected_sha256.lower():
+                path.unlink()
+                raise DownloadVerificationError("文件校验和不符")
+
+    def throughput_summary(self) -> Dict:
+        """
+        累计吞吐量指标
+
+        Returns:
+            {'downloads', 'bytes', 'seconds', 'resumed_bytes', 'retries', 'avg_throughput_mbps'}
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['avg_throughput_mbps'] = (
+            round(stats['bytes'] * 8 / stats['seconds'] / 1e6, 2) if stats['seconds'] else 0.0
+        )
+        return stats
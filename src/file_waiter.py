@@ -0,0 +1,331 @@
+"""
+Gemini File State Waiter
+共享的文件状态等待器：单个后台线程轮询所有待处理文件，指数退避 + 抖动
+"""
+
+import time
+import heapq
+import random
+import asyncio
+import threading
+from concurrent.futures import Future, InvalidStateError
+from typing import Dict, Optional, Callable, List
+
+import google.generativeai as genai
+
+
+# 处理耗时直方图的桶上界（秒）
+PROCESSING_TIME_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+class ProcessingTimeHistogram:
+    """
+    文件处理耗时直方图（线程安全）
+    """
+
+    def __init__(self, buckets=PROCESSING_TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        """记录一次耗时"""
+        index = len(self.buckets)
+        for i, upper in enumerate(self.buckets):
+            if seconds <= upper:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def snapshot(self) -> Dict:
+        """
+        导出直方图
+
+        Returns:
+            {'count', 'mean', 'max', 'buckets': {'<=1s': n, ..., '>300s': n}}
+        """
+        with self._lock:
+            counts = list(self._counts)
+            count, total, max_seconds = self.count, self.total, self.max
+        buckets = {f"<={upper}s": counts[i] for i, upper in enumerate(self.buckets)}
+        buckets[f">{self.buckets[-1]}s"] = counts[-1]
+        return {
+            'count': count,
+            'mean': round(total / count, 3) if count else 0.0,
+            'max': round(max_seconds, 3),
+            'buckets': buckets,
+        }
+
+
+class _PendingFile:
+    """等待中的文件"""
+
+    __slots__ = ('name', 'future', 'started_at', 'deadline', 'interval', 'errors', 'kind', 'get_file')
+
+    def __init__(
+        self,
+        name: str,
+        future: Future,
+        timeout: float,
+        interval: float,
+        kind: str,
+        get_file: Optional[Callable] = None
+    ):
+        self.name = name
+        self.future = future
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + timeout
+        self.interval = interval
+        self.errors = 0
+        self.kind = kind
+        self.get_file = get_file
+
+
+class FileStateWaiter:
+    """
+    Gemini 文件状态等待器
+
+    所有等待中的文件由同一个后台线程轮询：
+    - 每个文件的检查间隔从 initial_interval 开始指数增长（带随机抖动），上限 max_interval
+    - 文件变为 ACTIVE 时 future 返回最新的 File 对象，FAILED / 超时 / 连续查询失败时 future 抛出异常
+    - 同步调用方使用 wait()，asyncio 调用方使用 wait_async()，不会为了 sleep 占用线程
+    """
+
+    def __init__(
+        self,
+        get_file: Optional[Callable] = None,
+        initial_interval: float = 0.5,
+        max_interval: float = 8.0,
+        multiplier: float = 1.6,
+        jitter: float = 0.25,
+        max_consecutive_errors: int = 5
+    ):
+        """
+        初始化等待器
+
+        Args:
+            get_file: 查询文件状态的函数，默认 genai.get_file
+            initial_interval: 首次检查间隔（秒）
+            max_interval: 最大检查间隔（秒）
+            multiplier: 每次检查后间隔的增长倍数
+            jitter: 随机抖动比例（0.25 表示 ±25%）
+            max_consecutive_errors: 单个文件连续查询失败多少次后放弃
+        """
+        self._get_file = get_file or genai.get_file
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.max_consecutive_errors = max_consecutive_errors
+
+        self._heap: List = []  # (next_check, seq, _PendingFile)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+        self.histograms: Dict[str, ProcessingTimeHistogram] = {}
+        self.counters = {'active': 0, 'failed': 0, 'timeout': 0, 'error': 0, 'polls': 0}
+
+    def _next_delay(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _histogram(self, kind: str) -> ProcessingTimeHistogram:
+        histogram = self.histograms.get(kind)
+        if histogram is None:
+            histogram = self.histograms.setdefault(kind, ProcessingTimeHistogram())
+        return histogram
+
+    def _ensure_thread(self):
+        """懒启动后台轮询线程（调用方需持有锁）"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name='gemini-file-waiter', daemon=True
+            )
+            self._thread.start()
+
+    def submit(
+        self,
+        file,
+        timeout: float = 300,
+        kind: str = 'video',
+        get_file: Optional[Callable] = None
+    ) -> Future:
+        """
+        提交一个等待处理的文件
+
+        Args:
+            file: genai.upload_file 返回的 File 对象
+            timeout: 最大等待时间（秒）
+            kind: 文件类别（用于分组统计耗时，例如 'video' / 'audio'）
+            get_file: 查询该文件状态的函数（可选，文件由非默认凭证上传时传入对应凭证的 get_file）
+
+        Returns:
+            concurrent.futures.Future，结果为 ACTIVE 状态的 File 对象
+        """
+        future = Future()
+        state = file.state.name
+        if state != "PROCESSING":
+            self._resolve(_PendingFile(file.name, future, timeout, 0, kind), file)
+            return future
+
+        pending = _PendingFile(file.name, future, timeout, self.initial_interval, kind, get_file)
+        with self._condition:
+            self._push(pending, self._next_delay(pending.interval))
+            self._ensure_thread()
+            self._condition.notify()
+        return future
+
+    def wait(self, file, timeout: float = 300, kind: str = 'video', get_file: Optional[Callable] = None):
+        """
+        同步等待文件处理完成
+
+        Returns:
+            ACTIVE 状态的 File 对象
+
+        Raises:
+            TimeoutError: 超过 timeout 仍在处理
+            ValueError: 文件处理失败
+        """
+        return self.submit(file, timeout=timeout, kind=kind, get_file=get_file).result()
+
+    async def wait_async(
+        self,
+        file,
+        timeout: float = 300,
+        kind: str = 'video',
+        get_file: Optional[Callable] = None
+    ):
+        """
+        异步等待文件处理完成（不占用线程）
+        """
+        return await asyncio.wrap_future(
+            self.submit(file, timeout=timeout, kind=kind, get_file=get_file)
+        )
+
+    def pending_count(self) -> int:
+        """当前等待中的文件数"""
+        with self._condition:
+            return len(self._heap)
+
+    def stats(self) -> Dict:
+        """
+        等待器统计
+
+        Returns:
+            {'pending', 'counters', 'processing_time': {kind: 直方图}}
+        """
+        return {
+            'pending': self.pending_count(),
+            'counters': dict(self.counters),
+            'processing_time': {kind: h.snapshot() for kind, h in self.histograms.items()},
+        }
+
+    def _push(self, pending: _PendingFile, delay: float):
+        self._seq += 1
+        heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, pending))
+
+    @staticmethod
+    def _settle(future: Future, result=None, exception: Optional[BaseException] = None):
+        """结束 future；查询期间调用方已取消（客户端断开、任务取消）时忽略"""
+        if future.done():
+            return
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _resolve(self, pending: _PendingFile, file):
+        """根据最新状态结束等待"""
+        elapsed = time.monotonic() - pending.started_at
+        state = file.state.name
+        if state == "FAILED":
+            self.counters['failed'] += 1
+            self._histogram(pending.kind).observe(elapsed)
+            self._settle(pending.future, exception=ValueError(f"文件处理失败: {pending.name} ({state})"))
+        else:
+            self.counters['active'] += 1
+            self._histogram(pending.kind).observe(elapsed)
+            self._settle(pending.future, file)
+
+    def _run(self):
+        """后台轮询循环：每次取出已到检查时间的文件逐个查询"""
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                next_check = self._heap[0][0]
+                now = time.monotonic()
+                if next_check > now:
+                    self._condition.wait(timeout=next_check - now)
+                    continue
+
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[2])
+
+            for pending in due:
+                # 单个文件出错不能停止轮询线程，否则其余等待中的文件永远得不到结果
+                try:
+                    self._poll(pending)
+                except Exception as e:
+                    print(f"⚠️ 文件状态轮询异常: {pending.name}: {e}")
+                    self._settle(pending.future, exception=e)
+
+    def _poll(self, pending: _PendingFile):
+        """查询单个文件状态，未完成则按退避间隔重新排队"""
+        if pending.future.done():
+            return
+
+        if time.monotonic() > pending.deadline:
+            self.counters['timeout'] += 1
+            self._settle(pending.future, exception=TimeoutError(
+                f"文件处理超时（超过 {int(pending.deadline - pending.started_at)} 秒）: {pending.name}"
+            ))
+            return
+
+        try:
+            self.counters['polls'] += 1
+            file = (pending.get_file or self._get_file)(pending.name)
+            pending.errors = 0
+        except Exception as e:
+            pending.errors += 1
+            if pending.errors >= self.max_consecutive_errors:
+                self.counters['error'] += 1
+                self._settle(pending.future, exception=e)
+                return
+            file = None
+
+        if file is not None and file.state.name != "PROCESSING":
+            self._resolve(pending, file)
+            return
+
+        pending.interval = min(pending.interval * self.multiplier, self.max_interval)
+        delay = min(self._next_delay(pending.interval), max(pending.deadline - time.monotonic(), 0))
+        with self._condition:
+            self._push(pending, delay)
+
+
+_default_waiter: Optional[FileStateWaiter] = None
+_default_waiter_lock = threading.Lock()
+
+
+def get_file_waiter() -> FileStateWaiter:
+    """
+    获取进程内共享的文件状态等待器
+    """
+    global _default_waiter
+    if _default_waiter is None:
+        with _default_waiter_lock:
+            if _default_waiter is None:
+                _default_waiter = FileStateWaiter()
+    return _default_waiter
@@ -0,0 +1,269 @@
+"""
+Format Policy
+yt-dlp 格式选择策略：按平台选择满足目标分辨率 / 码率的最小视频流，只需要转录时单独选择纯音频流；
+记录每次选择的下载字节数和耗时，便于按平台（TikTok / Reels / Shorts）调整策略
+"""
+
+import os
+import shutil
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, Iterator, List, Optional
+
+from .result_cache import extract_video_id
+
+
+@dataclass(frozen=True)
+class FormatPolicy:
+    """格式选择策略"""
+
+    name: str
+    target_height: int = 720
+    max_tbr: Optional[float] = None
+    audio_only: bool = False
+    min_abr: float = 32
+    concurrent_fragments: int = 1
+    allow_merge: bool = True
+
+
+# 各平台默认策略：短视频分析 720p 足够，码率上限（kbps）只在同分辨率有多个码率档时起作用
+PLATFORM_POLICIES: Dict[str, FormatPolicy] = {
+    'tiktok': FormatPolicy('tiktok', target_height=720, max_tbr=2500),
+    'instagram': FormatPolicy('instagram', target_height=720, max_tbr=2500),
+    'youtube': FormatPolicy('youtube', target_height=720, max_tbr=2500),
+    'url': FormatPolicy('url', target_height=720),
+}
+
+
+def platform_of(video_url: str) -> str:
+    """视频 URL 所属平台（tiktok / youtube / instagram，无法识别时为 url）"""
+    return extract_video_id(video_url).split(':', 1)[0]
+
+
+def policy_for(video_url: str, audio_only: bool = False) -> FormatPolicy:
+    """
+    按平台选择策略，并应用环境变量覆盖
+
+    - YTDLP_TARGET_HEIGHT: 目标分辨率（高度）
+    - YTDLP_MAX_TBR: 码率上限（kbps）
+    - YTDLP_CONCURRENT_FRAGMENTS: DASH / HLS 分片并发下载数（默认 1，不并发）
+
+    Args:
+        video_url: 视频 URL
+        audio_only: 是否只下载音频（只需要转录时）
+    """
+    policy = PLATFORM_POLICIES.get(platform_of(video_url), PLATFORM_POLICIES['url'])
+    overrides = {'audio_only': audio_only}
+    if os.getenv('YTDLP_TARGET_HEIGHT'):
+        overrides['target_height'] = int(os.environ['YTDLP_TARGET_HEIGHT'])
+    if os.getenv('YTDLP_MAX_TBR'):
+        overrides['max_tbr'] = float(os.environ['YTDLP_MAX_TBR'])
+    if os.getenv('YTDLP_CONCURRENT_FRAGMENTS'):
+        overrides['concurrent_fragments'] = max(1, int(os.environ['YTDLP_CONCURRENT_FRAGMENTS']))
+    return replace(policy, **overrides)
+
+
+def _has_video(fmt: Dict) -> bool:
+    return fmt.get('vcodec') != 'none'
+
+
+def _has_audio(fmt: Dict) -> bool:
+    return fmt.get('acodec') != 'none'
+
+
+def _size_key(fmt: Dict):
+    """按估计大小排序：已知大小的在前，其次按码率"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    return (size is None, size or 0, fmt.get('tbr') or float('inf'), fmt.get('ext') != 'mp4')
+
+
+def _merge(video: Dict, audio: Dict) -> Dict:
+    """组合纯视频流和纯音频流（yt-dlp 下载后用 ffmpeg 合并）"""
+    sizes = [f.get('filesize') or f.get('filesize_approx') for f in (video, audio)]
+    return {
+        'format_id': f"{video['format_id']}+{audio['format_id']}",
+        'ext': video['ext'],
+        'requested_formats': [video, audio],
+        'protocol': f"{video.get('protocol')}+{audio.get('protocol')}",
+        'height': video.get('height'),
+        'width': video.get('width'),
+        'tbr': (video.get('tbr') or 0) + (audio.get('tbr') or audio.get('abr') or 0) or None,
+        'filesize_approx': sum(sizes) if all(sizes) else None,
+    }
+
+
+# 可直接合并（不转封装）的视频 / 音频扩展名
+_MERGE_EXTS = {'mp4': ('m4a', 'mp4'), 'webm': ('webm',)}
+
+
+def select_audio(formats: List[Dict], policy: FormatPolicy) -> Optional[Dict]:
+    """
+    选择满足最低音频码率的最小纯音频流（都不满足时选码率最高的）
+
+    Args:
+        formats: yt-dlp 格式列表
+        policy: 格式选择策略
+    """
+    audio = [f for f in formats if _has_audio(f) and not _has_video(f)]
+    if not audio:
+        return None
+    adequate = [f for f in audio if (f.get('abr') or f.get('tbr') or 0) >= policy.min_abr]
+    if adequate:
+        return min(adequate, key=_size_key)
+    return max(audio, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+
+
+def select_format(formats: List[Dict], policy: FormatPolicy, can_merge: bool = False) -> Optional[Dict]:
+    """
+    按策略选择要下载的格式
+
+    - 视频：高度不低于 target_height（没有时以最高可用高度为准）且码率不超过 max_tbr 的候选中估计大小最小的一个；
+      can_merge 时候选包括「纯视频 + 纯音频」组合，否则只考虑音视频合一的流
+    - 纯音频（audio_only）：select_audio；没有纯音频流时退回最小的音视频合一流
+
+    Args:
+        formats: yt-dlp 格式列表
+        policy: 格式选择策略
+        can_merge: 是否可以合并音视频流（需要 ffmpeg）
+
+    Returns:
+        格式字典（组合流为 yt-dlp 的 requested_formats 结构），没有可用格式时返回 None
+    """
+    formats = [
+        f for f in formats
+        if f.get('format_id') and not f.get('has_drm') and f.get('protocol') != 'mhtml'
+        and (_has_video(f) or _has_audio(f))
+    ]
+    muxed = [f for f in formats if _has_video(f) and _has_audio(f)]
+
+    if policy.audio_only:
+        audio = select_audio(formats, policy)
+        if audio is not None:
+            return audio
+        return min(muxed, key=_size_key) if muxed else None
+
+    candidates = list(muxed)
+    if can_merge and policy.allow_merge:
+        for video in (f for f in formats if _has_video(f) and not _has_audio(f)):
+            exts = _MERGE_EXTS.get(video.get('ext'))
+            if not exts:
+                continue
+            audio = select_audio([f for f in formats if f.get('ext') in exts], policy)
+            if audio is not None:
+                candidates.append(_merge(video, audio))
+    if not candidates:
+        return None
+
+    heights = [f['height'] for f in candidates if f.get('height')]
+    if heights:
+        threshold = min(policy.target_height, max(heights))
+        adequate = [f for f in candidates if (f.get('height') or 0) >= threshold]
+    else:
+        adequate = candidates
+    if policy.max_tbr:
+        within = [f for f in adequate if (f.get('tbr') or 0) <= policy.max_tbr]
+        adequate = within or adequate
+    return min(adequate, key=_size_key)
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which('ffmpeg') is not None
+
+
+class FormatSelector:
+    """
+    yt-dlp 的 format 回调（ydl_opts['format'] = FormatSelector(policy)）
+
+    选择结果记录在 self.selected 中
+    """
+
+    def __init__(self, policy: FormatPolicy, can_merge: Optional[bool] = None):
+        """
+        Args:
+            policy: 格式选择策略
+            can_merge: 是否可以合并音视频流（可选，默认检测 ffmpeg 是否可用）
+        """
+        self.policy = policy
+        self.can_merge = ffmpeg_available() if can_merge is None else can_merge
+        self.selected: Optional[Dict] = None
+
+    def __call__(self, ctx: Dict) -> Iterator[Dict]:
+        formats = ctx.get('formats') or []
+        selected = select_format(formats, self.policy, can_merge=self.can_merge)
+        if selected is None and formats:
+            # 无法识别的格式信息：退回 yt-dlp 排序中的最佳格式
+            selected = formats[-1]
+        self.selected = selected
+        if selected is not None:
+            yield selected
+
+
+def describe_format(fmt: Optional[Dict]) -> str:
+    """格式的简短描述，例如 '720p mp4 1350kbps (id 301+140)'"""
+    if not fmt:
+        return 'unknown'
+    parts = []
+    if fmt.get('height'):
+        parts.append(f"{fmt['height']}p")
+    elif not _has_video(fmt):
+        parts.append('audio')
+    parts.append(fmt.get('ext') or '?')
+    if fmt.get('tbr'):
+        parts.append(f"{fmt['tbr']:.0f}kbps")
+    return f"{' '.join(parts)} (id {fmt.get('format_id')})"
+
+
+class FormatStats:
+    """
+    按「平台/类型」统计 yt-dlp 下载：次数、字节数、耗时和各格式的选择次数
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {}
+
+    def record(self, platform: str, kind: str, fmt: Optional[Dict], size: int, seconds: float):
+        """
+        记录一次下载
+
+        Args:
+            platform: 平台（tiktok / youtube / instagram / url）
+            kind: video / audio
+            fmt: 选择的格式
+            size: 下载的文件字节数
+            seconds: 下载耗时（秒，包含解析）
+        """
+        key = f"{platform}/{kind}"
+        label = describe_format(fmt).split(' (id')[0]
+        with self._lock:
+            entry = self._stats.setdefault(key, {'downloads': 0, 'bytes': 0, 'seconds': 0.0, 'formats': {}})
+            entry['downloads'] += 1
+            entry['bytes'] += size
+            entry['seconds'] += seconds
+            entry['formats'][label] = entry['formats'].get(label, 0) + 1
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'<platform>/<kind>': {'downloads', 'bytes', 'seconds', 'avg_mb', 'avg_seconds', 'formats'}}
+        """
+        with self._lock:
+            return {
+                key: {
+                    'downloads': entry['downloads'],
+                    'bytes': entry['bytes'],
+                    'seconds': round(entry['seconds'], 2),
+                    'avg_mb': round(entry['bytes'] / entry['downloads'] / 1024 ** 2, 2),
+                    'avg_seconds': round(entry['seconds'] / entry['downloads'], 2),
+                    'formats': dict(entry['formats']),
+                }
+                for key, entry in self._stats.items()
+            }
+
+
+_format_stats = FormatStats()
+
+
+def get_format_stats() -> FormatStats:
+    """进程内共享的下载统计"""
+    return _format_stats
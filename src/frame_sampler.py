@@ -0,0 +1,313 @@
+"""
+Frame Sampler
+本地镜头切换检测与关键帧采样：ffmpeg 管道输出低分辨率帧，NumPy 计算颜色直方图差异并检测切换点；
+前 10 秒（Hook / 留存窗口）密集采样，之后按镜头切换稀疏采样，用于「关键帧 + 转录」分析模式
+"""
+
+import os
+import time
+import subprocess
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# 分析模式：video 上传完整视频（默认）；keyframes 只发送关键帧 + 转录
+ANALYSIS_MODES = ('video', 'keyframes')
+
+# 镜头检测使用的帧尺寸和采样率（只用于计算直方图，不需要清晰）
+ANALYSIS_WIDTH = 64
+ANALYSIS_HEIGHT = 36
+ANALYSIS_FPS = 4.0
+
+
+def analysis_mode_from_env() -> str:
+    """读取 ANALYSIS_MODE（video / keyframes，默认 video）"""
+    mode = os.getenv('ANALYSIS_MODE', 'video').lower() or 'video'
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"未知的分析模式: {mode}（可选 {', '.join(ANALYSIS_MODES)}）")
+    return mode
+
+
+@dataclass
+class Keyframe:
+    """一张关键帧（JPEG）"""
+    timestamp: float
+    reason: str
+    jpeg: bytes
+
+
+@dataclass
+class KeyframeSet:
+    """关键帧采样结果"""
+    keyframes: List[Keyframe]
+    cut_times: List[float]
+    duration: float
+    sampling_seconds: float = 0.0
+    frame_count: int = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(len(frame.jpeg) for frame in self.keyframes)
+
+
+def decode_frames(
+    video_path: str,
+    fps: float = ANALYSIS_FPS,
+    width: int = ANALYSIS_WIDTH,
+    height: int = ANALYSIS_HEIGHT,
+    max_seconds: Optional[float] = None,
+    timeout: float = 300
+) -> np.ndarray:
+    """
+    用 ffmpeg 把视频解码为固定帧率的低分辨率 RGB 帧
+
+    Args:
+        video_path: 视频文件路径
+        fps: 采样帧率
+        width / height: 输出尺寸
+        max_seconds: 最多解码的时长（秒，可选）
+        timeout: ffmpeg 超时（秒）
+
+    Returns:
+        uint8 数组，形状 (帧数, height, width, 3)
+
+    Raises:
+        ValueError: ffmpeg 解码失败
+    """
+    command = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', video_path]
+    if max_seconds:
+        command += ['-t', str(max_seconds)]
+    command += [
+        '-an', '-vf', f'fps={fps},scale={width}:{height}',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1',
+    ]
+    try:
+        completed = subprocess.run(command, capture_output=True, timeout=timeout, check=True)
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"视频解码失败: {e.stderr.decode(errors='replace').strip()[-200:]}")
+
+    frame_size = width * height * 3
+    count = len(completed.stdout) // frame_size
+    return np.frombuffer(completed.stdout[:count * frame_size], dtype=np.uint8).reshape(count, height, width, 3)
+
+
+def frame_histograms(frames: np.ndarray, bins: int = 16) -> np.ndarray:
+    """
+    每帧每个颜色通道的归一化直方图
+
+    逐帧 bincount：小帧的数据留在 CPU 缓存中，实测比整体加偏移后一次 bincount 更快
+
+    Args:
+        frames: uint8 数组 (N, H, W, 3)
+        bins: 每个通道的分桶数（须整除 256）
+
+    Returns:
+        float32 数组 (N, 3 * bins)，每个通道的直方图之和为 1
+    """
+    count, channels = frames.shape[0], frames.shape[-1]
+    histograms = np.zeros((count, channels * bins), dtype=np.float32)
+    if count == 0:
+        return histograms
+    pixels = frames[0, ..., 0].size
+    quantized = frames // (256 // bins)
+    for index in range(count):
+        for channel in range(channels):
+            histograms[index, channel * bins:(channel + 1) * bins] = np.bincount(
+                quantized[index, ..., channel].ravel(), minlength=bins
+            )
+    return histograms / pixels
+
+
+def histogram_distances(histograms: np.ndarray) -> np.ndarray:
+    """
+    相邻帧直方图的差异（各通道总变差距离的平均，0 表示相同，1 表示完全不同）
+
+    Returns:
+        float32 数组 (N,)，第一帧为 0
+    """
+    if len(histograms) < 2:
+        return np.zeros(len(histograms), dtype=np.float32)
+    channels = 3
+    diff = np.abs(np.diff(histograms, axis=0)).sum(axis=1) / (2 * channels)
+    return np.concatenate([[0.0], diff]).astype(np.float32)
+
+
+def detect_cuts(
+    distances: np.ndarray,
+    fps: float = ANALYSIS_FPS,
+    threshold: float = 0.3,
+    min_gap_seconds: float = 0.5
+) -> List[int]:
+    """
+    按直方图差异检测镜头切换
+
+    - 差异超过 threshold 且为局部最大值的帧视为切换点
+    - 两个切换点至少间隔 min_gap_seconds（保留差异较大的一个）
+
+    Returns:
+        切换后第一帧的帧序号（升序）
+    """
+    if len(distances) < 2:
+        return []
+    padded = np.concatenate([[0.0], distances, [0.0]])
+    peaks = (distances > threshold) & (distances >= padded[:-2]) & (distances >= padded[2:])
+    candidates = np.flatnonzero(peaks)
+
+    min_gap = max(1, int(round(min_gap_seconds * fps)))
+    cuts: List[int] = []
+    for index in candidates[np.argsort(-distances[candidates], kind='stable')]:
+        if all(abs(index - kept) >= min_gap for kept in cuts):
+            cuts.append(int(index))
+    return sorted(cuts)
+
+
+def plan_samples(
+    frame_count: int,
+    cuts: List[int],
+    fps: float = ANALYSIS_FPS,
+    hook_seconds: float = 10,
+    hook_interval: float = 0.5,
+    sparse_interval: float = 4,
+    max_frames: int = 32
+) -> List[Tuple[int, str]]:
+    """
+    选择要发送的帧
+
+    - 前 hook_seconds 秒每 hook_interval 秒一帧（hook）
+    - 之后每个镜头切换一帧（cut），相邻采样超过 sparse_interval 秒时补一帧（fill）
+    - 超出 max_frames 时保留全部 hook 帧，优先保留 cut 帧，其余均匀抽取
+
+    Returns:
+        [(帧序号, 原因)]，按帧序号升序
+    """
+    if frame_count <= 0:
+        return []
+    hook_end = min(frame_count, int(hook_seconds * fps))
+    hook_step = max(1, int(round(hook_interval * fps)))
+    hook = [(index, 'hook') for index in range(0, hook_end, hook_step)]
+
+    rest: List[Tuple[int, str]] = []
+    last = hook[-1][0] if hook else -1
+    sparse_step = max(1, int(round(sparse_interval * fps)))
+    cut_set = sorted(c for c in cuts if hook_end <= c < frame_count)
+    for index in cut_set + [frame_count]:
+        while index - last > sparse_step:
+            last += sparse_step
+            rest.append((last, 'fill'))
+        if index < frame_count:
+            rest.append((index, 'cut'))
+            last = index
+
+    budget = max_frames - len(hook)
+    if budget <= 0:
+        return hook[:max_frames]
+    if len(rest) > budget:
+        cut_samples = [item for item in rest if item[1] == 'cut']
+        fill_samples = [item for item in rest if item[1] == 'fill']
+        if len(cut_samples) >= budget:
+            rest = _evenly(cut_samples, budget)
+        else:
+            rest = sorted(cut_samples + _evenly(fill_samples, budget - len(cut_samples)))
+    return hook + rest
+
+
+def _evenly(items: List, count: int) -> List:
+    """均匀抽取 count 个元素（保持顺序）"""
+    if count <= 0:
+        return []
+    keep = np.unique(np.linspace(0, len(items) - 1, count).round().astype(int))
+    return [items[i] for i in keep]
+
+
+def split_jpeg_stream(data: bytes) -> List[bytes]:
+    """把 ffmpeg image2pipe 输出的连续 MJPEG 拆分为单张 JPEG"""
+    images = []
+    start = data.find(b'\xff\xd8')
+    while start != -1:
+        end = data.find(b'\xff\xd9', start + 2)
+        if end == -1:
+            break
+        images.append(data[start:end + 2])
+        start = data.find(b'\xff\xd8', end + 2)
+    return images
+
+
+def extract_jpegs(
+    video_path: str,
+    frame_indices: List[int],
+    fps: float = ANALYSIS_FPS,
+    max_height: int = 480,
+    quality: int = 5,
+    timeout: float = 300
+) -> List[bytes]:
+    """
+    一次 ffmpeg 调用按帧序号（与 decode_frames 相同的帧率下）导出 JPEG
+
+    Args:
+        video_path: 视频文件路径
+        frame_indices: 帧序号（升序）
+        fps: 帧序号对应的帧率
+        max_height: 输出图片最大高度（只缩小）
+        quality: JPEG 质量（ffmpeg -q:v，2 最好，31 最差）
+        timeout: ffmpeg 超时（秒）
+    """
+    if not frame_indices:
+        return []
+    select = '+'.join(f'eq(n\\,{index})' for index in frame_indices)
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-i', video_path, '-an',
+        '-vf', f"fps={fps},select='{select}',scale=-2:'min({max_height},ih)'",
+        '-fps_mode', 'vfr', '-f', 'image2pipe', '-c:v', 'mjpeg', '-q:v', str(quality), 'pipe:1',
+    ]
+    try:
+        completed = subprocess.run(command, capture_output=True, timeout=timeout, check=True)
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"关键帧导出失败: {e.stderr.decode(errors='replace').strip()[-200:]}")
+    return split_jpeg_stream(completed.stdout)
+
+
+def sample_keyframes(
+    video_path: str,
+    hook_seconds: float = 10,
+    max_frames: int = 32,
+    threshold: float = 0.3,
+    max_height: int = 480,
+    max_seconds: Optional[float] = None
+) -> KeyframeSet:
+    """
+    检测镜头切换并导出关键帧
+
+    Args:
+        video_path: 视频文件路径
+        hook_seconds: 密集采样的开头时长（秒）
+        max_frames: 最多导出的帧数
+        threshold: 镜头切换的直方图差异阈值
+        max_height: 导出图片最大高度
+        max_seconds: 只分析前若干秒（可选）
+
+    Returns:
+        KeyframeSet
+    """
+    start = time.perf_counter()
+    frames = decode_frames(video_path, max_seconds=max_seconds)
+    distances = histogram_distances(frame_histograms(frames))
+    cuts = detect_cuts(distances, threshold=threshold)
+    plan = plan_samples(len(frames), cuts, hook_seconds=hook_seconds, max_frames=max_frames)
+    images = extract_jpegs(video_path, [index for index, _ in plan], max_height=max_height)
+
+    keyframes = [
+        Keyframe(timestamp=index / ANALYSIS_FPS, reason=reason, jpeg=jpeg)
+        for (index, reason), jpeg in zip(plan, images)
+    ]
+    result = KeyframeSet(
+        keyframes=keyframes,
+        cut_times=[index / ANALYSIS_FPS for index in cuts],
+        duration=len(frames) / ANALYSIS_FPS,
+        sampling_seconds=time.perf_counter() - start,
+        frame_count=len(frames),
+    )
+    print(f"🖼️  关键帧采样完成: {len(keyframes)} 帧 / {len(cuts)} 个镜头切换，"
+          f"{result.total_bytes / 1024:.0f} KB（{result.sampling_seconds:.1f} 秒）")
+    return result
@@ -0,0 +1,326 @@
+"""
+Gemini Client Pool
+多 API Key / 多端点（官方 API 与 KIE 等代理）的 Gemini 客户端池：
+每个后端使用独立的客户端（不依赖进程级 genai.configure），无文件的调用路由到负载最低的健康后端，
+已上传的文件固定由上传它的后端访问
+"""
+
+import os
+import mimetypes
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from google.generativeai.types import file_types
+
+from .remote_file_registry import credentials_namespace
+from .upstream_governor import CircuitBreaker, CircuitOpenError, UpstreamGovernor, get_gemini_governor
+
+
+# 固定关系最多保留的文件数（Gemini 文件 48 小时后过期，超出时淘汰最早的记录）
+MAX_PINNED_FILES = 10000
+
+
+def parse_backend_configs(
+    api_key: Optional[str] = None,
+    api_base: Optional[str] = None,
+    extra: Optional[str] = None
+) -> List[Tuple[str, Optional[str]]]:
+    """
+    解析后端配置
+
+    Args:
+        api_key: 主 API Key（GEMINI_API_KEY）
+        api_base: 主 Key 使用的 API Base（GEMINI_API_BASE，可选）
+        extra: 额外的后端，逗号分隔，每项为 "key" 或 "key@api_base"，默认读取 GEMINI_API_KEYS
+
+    Returns:
+        去重后的 [(api_key, api_base), ...]，主 Key 在最前
+    """
+    extra = os.getenv('GEMINI_API_KEYS', '') if extra is None else extra
+    configs: List[Tuple[str, Optional[str]]] = []
+    if api_key:
+        configs.append((api_key, api_base or None))
+    for item in extra.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, base = item.partition('@')
+        config = (key.strip(), base.strip() or None)
+        if config[0] and config not in configs:
+            configs.append(config)
+    return configs
+
+
+class GeminiBackend:
+    """
+    单个 API Key + 端点
+
+    客户端由私有的 _ClientManager 创建，多个后端在同一进程内互不覆盖配置；
+    注入 model 时使用 genai 模块的全局配置（兼容旧的单 Key 用法）
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: Optional[str] = None,
+        model_name: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        model=None,
+        governor: Optional[UpstreamGovernor] = None
+    ):
+        """
+        Args:
+            api_key: Gemini API Key
+            api_base: 自定义 API Base URL（可选）
+            model_name: 模型名
+            generation_config: 生成参数（可选）
+            model: 注入的 GenerativeModel（可选，使用全局 genai 配置）
+            governor: 调用管控器（可选，默认按 Key + 端点使用进程内共享实例）
+        """
+        self.api_key = api_key
+        self.api_base = api_base or None
+        self.namespace = credentials_namespace(api_key, self.api_base)
+
+        if model is not None:
+            self._manager = None
+            self.model = model
+            self.governor = governor or get_gemini_governor(self.api_base)
+        else:
+            self._manager = genai_client._ClientManager()
+            if self.api_base:
+                self._manager.configure(
+                    api_key=api_key,
+                    transport='rest',
+                    client_options={'api_endpoint': self.api_base}
+                )
+            else:
+                self._manager.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+            self.model._client = self._manager.get_default_client('generative')
+            self.governor = governor or get_gemini_governor(self.api_base, key_id=self.namespace[:8])
+        self.name = self.governor.endpoint
+        self._async_lock = threading.Lock()
+
+    def upload_file(self, path: str, mime_type: Optional[str] = None, display_name: Optional[str] = None):
+        """上传本地文件（与 genai.upload_file 相同，但使用本后端的凭证）"""
+        if self._manager is None:
+            return genai.upload_file(path=path, mime_type=mime_type, display_name=display_name)
+
+        path = Path(path)
+        mime_type = mime_type or mimetypes.guess_type(path)[0]
+        if mime_type is None:
+            raise ValueError(f"无法识别文件类型: {path}")
+        response = self._manager.get_default_client('file').create_file(
+            path=path, mime_type=mime_type, display_name=display_name or path.name, resumable=True
+        )
+        return file_types.File(response)
+
+    def get_file(self, name: str):
+        """查询文件（与 genai.get_file 相同，但使用本后端的凭证）"""
+        if self._manager is None:
+            return genai.get_file(name)
+        if '/' not in name:
+            name = f"files/{name}"
+        return file_types.File(self._manager.get_default_client('file').get_file(name=name))
+
+    def generate(self, contents, **kwargs):
+        """model.generate_content"""
+        return self.model.generate_content(contents, **kwargs)
+
+    async def generate_async(self, contents, **kwargs):
+        """model.generate_content_async（异步客户端在首次调用时创建）"""
+        if self._manager is not None and self.model._async_client is None:
+            with self._async_lock:
+                if self.model._async_client is None:
+                    self.model._async_client = self._manager.get_default_client('generative_async')
+        return await self.model.generate_content_async(contents, **kwargs)
+
+    @property
+    def healthy(self) -> bool:
+        return self.governor.breaker.state != CircuitBreaker.OPEN
+
+    @property
+    def load(self) -> float:
+        """并发占用率（进行中请求数 / 当前并发上限）"""
+        limiter = self.governor.limiter
+        return limiter.in_flight / max(int(limiter.limit), 1)
+
+
+class GeminiClientPool:
+    """
+    Gemini 后端池
+
+    - 不涉及已上传文件的调用（上传、内联音频转录）选择负载最低的健康后端，熔断时换下一个
+    - Gemini 文件只对上传它的 Key 可见：上传后记录文件名 -> 后端，之后对该文件的生成调用固定到同一后端
+    - 每个后端有独立的并发上限、熔断器和 RPM 预算，总吞吐随 Key 数量线性增加
+    """
+
+    def __init__(self, backends: List[GeminiBackend]):
+        """
+        Args:
+            backends: 后端列表（第一个为主后端）
+        """
+        if not backends:
+            raise ValueError("至少需要一个 Gemini 后端")
+        self.backends = backends
+        self._by_name = {backend.name: backend for backend in backends}
+        self._pins: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._next = 0
+        self.routed: Dict[str, int] = {backend.name: 0 for backend in backends}
+
+    @property
+    def primary(self) -> GeminiBackend:
+        return self.backends[0]
+
+    def choose(self, exclude: Tuple[str, ...] = ()) -> GeminiBackend:
+        """
+        选择负载最低的健康后端（负载相同时轮询）
+
+        Args:
+            exclude: 排除的后端名称
+
+        Returns:
+            后端；全部熔断时返回负载最低的一个（调用时会抛出 CircuitOpenError）
+        """
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.backends)
+        ordered = self.backends[start:] + self.backends[:start]
+        candidates = [b for b in ordered if b.name not in exclude] or ordered
+        healthy = [b for b in candidates if b.healthy] or candidates
+        return min(healthy, key=lambda b: b.load)
+
+    def pin(self, file, backend: GeminiBackend):
+        """记录文件由哪个后端上传"""
+        with self._lock:
+            self._pins[file.name] = backend.name
+            self._pins.move_to_end(file.name)
+            while len(self._pins) > MAX_PINNED_FILES:
+                self._pins.popitem(last=False)
+
+    def backend_for(self, file) -> GeminiBackend:
+        """文件所属的后端（未记录时返回主后端）"""
+        name = getattr(file, 'name', file)
+        with self._lock:
+            backend_name = self._pins.get(name)
+        return self._by_name.get(backend_name, self.primary)
+
+    def call(self, func: Callable[[GeminiBackend], Any], file=None) -> Any:
+        """
+        在管控下调用 func(backend)
+
+        Args:
+            func: 调用函数，参数为选中的后端
+            file: 调用涉及的 Gemini 文件（可选，指定后固定使用上传它的后端）
+        """
+        if file is not None:
+            backend = self.backend_for(file)
+            return self._routed(backend).governor.call(func, backend)
+
+        tried: Tuple[str, ...] = ()
+        while True:
+            backend = self._routed(self.choose(exclude=tried))
+            try:
+                return backend.governor.call(func, backend)
+            except CircuitOpenError:
+                tried += (backend.name,)
+                if len(tried) >= len(self.backends):
+                    raise
+
+    async def call_async(self, factory: Callable[[GeminiBackend], Awaitable[Any]], file=None) -> Any:
+        """call 的异步版本，factory(backend) 返回 awaitable"""
+        if file is not None:
+            backend = self._routed(self.backend_for(file))
+            return await backend.governor.call_async(lambda: factory(backend))
+
+        tried: Tuple[str, ...] = ()
+        while True:
+            backend = self._routed(self.choose(exclude=tried))
+            try:
+                return await backend.governor.call_async(lambda: factory(backend))
+            except CircuitOpenError:
+                tried += (backend.name,)
+                if len(tried) >= len(self.backends):
+                    raise
+
+    def _routed(self, backend: GeminiBackend) -> GeminiBackend:
+        self.routed[backend.name] += 1
+        return backend
+
+    def upload(self, path: str, mime_type: Optional[str] = None):
+        """
+        上传文件到负载最低的后端并记录固定关系
+
+        Returns:
+            (File 对象, 后端)
+        """
+        holder: Dict[str, GeminiBackend] = {}
+
+        def upload(backend: GeminiBackend):
+            holder['backend'] = backend
+            return backend.upload_file(path, mime_type=mime_type)
+
+        file = self.call(upload)
+        self.pin(file, holder['backend'])
+        return file, holder['backend']
+
+    def generate(self, contents, file=None, **kwargs):
+        """generate_content（传入 file 时固定到上传它的后端）"""
+        return self.call(lambda backend: backend.generate(contents, **kwargs), file=file)
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'backends': {name: {'healthy', 'load', 'routed'}}, 'pinned_files'}
+        """
+        return {
+            'backends': {
+                backend.name: {
+                    'healthy': backend.healthy,
+                    'load': round(backend.load, 2),
+                    'routed': self.routed[backend.name],
+                }
+                for backend in self.backends
+            },
+            'pinned_files': len(self._pins),
+        }
+
+
+_pools: Dict[Tuple, GeminiClientPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_gemini_pool(
+    api_key: str,
+    api_base: Optional[str],
+    model_name: str,
+    generation_config: Optional[Dict] = None
+) -> GeminiClientPool:
+    """
+    获取进程内共享的后端池（主 Key + GEMINI_API_KEYS 中的额外后端）
+
+    Args:
+        api_key: 主 API Key
+        api_base: 主 Key 的 API Base（可选）
+        model_name: 模型名
+        generation_config: 生成参数（可选）
+    """
+    configs = parse_backend_configs(api_key, api_base)
+    key = (tuple(configs), model_name, tuple(sorted((generation_config or {}).items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = GeminiClientPool([
+                    GeminiBackend(key_, base, model_name=model_name, generation_config=generation_config)
+                    for key_, base in configs
+                ])
+                if len(configs) > 1:
+                    print(f"✅ Gemini 后端池: {len(configs)} 个 Key / 端点")
+    return pool
@@ -0,0 +1,589 @@
+"""
+Job Queue
+持久化的分析任务队列（SQLite）与工作进程池：任务与 HTTP 请求解耦，进程重启后自动恢复
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import threading
+import multiprocessing
+from typing import Dict, Optional, List, Any
+
+from .paths import get_data_dir
+from .result_cache import extract_video_id
+
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINAL_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# 工作进程持有任务的租约时长（秒），超时未续约的任务会被其他进程重新领取
+DEFAULT_LEASE_SECONDS = 120
+
+
+def default_idempotency_key(video_url: str, username: Optional[str] = None) -> str:
+    """
+    按「用户 + 规范视频 ID」生成幂等键，同一视频的不同 URL 写法视为同一任务
+
+    Args:
+        video_url: 视频 URL
+        username: 提交任务的用户（可选）
+
+    Returns:
+        幂等键
+    """
+    return f"{username or ''}:{extract_video_id(video_url)}"
+
+
+def retry_delay(attempt: int, base: float = 5, maximum: float = 300) -> float:
+    """
+    第 attempt 次失败后的重试等待时间：指数退避 + 随机抖动
+
+    Args:
+        attempt: 已尝试次数（从 1 开始）
+        base: 首次重试等待时间（秒）
+        maximum: 最长等待时间（秒）
+    """
+    delay = min(base * 2 ** (attempt - 1), maximum)
+    return delay * (1 + random.uniform(0, 0.25))
+
+
+class JobQueue:
+    """
+    SQLite 任务队列
+
+    - submit 按幂等键去重：同一视频已有未失败的任务时直接返回该任务
+    - claim 在事务中领取任务并设置租约；工作进程崩溃后租约过期，任务被重新领取（至少完成一次）
+    - 失败的任务按指数退避重试，超过 max_attempts 后标记为 failed
+    - 失败、取消或命中结果缓存的任务记为待退还配额，由 API 进程通过 claim_refunds 领取并退还
+    - 多个进程可以同时打开同一个数据库文件
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化任务队列
+
+        Args:
+            db_path: SQLite 文件路径（可选，默认存放在本地数据目录）
+        """
+        self.db_path = str(db_path or get_data_dir('jobs') / 'jobs.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                video_url TEXT NOT NULL,
+                username TEXT,
+                payload TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                next_run_at REAL NOT NULL,
+                worker_id TEXT,
+                lease_expires_at REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL,
+                cached INTEGER NOT NULL DEFAULT 0,
+                quota_refunded INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._migrate()
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_jobs_status_next ON jobs (status, next_run_at)'
+        )
+
+    def _migrate(self):
+        """为旧版本创建的数据库补充配额退还相关的列（已有任务视为已结算，不再退还）"""
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        if 'cached' not in columns:
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN cached INTEGER NOT NULL DEFAULT 0')
+        if 'quota_refunded' not in columns:
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN quota_refunded INTEGER NOT NULL DEFAULT 0')
+            self._conn.execute('UPDATE jobs SET quota_refunded = 1')
+
+    def submit(
+        self,
+        video_url: str,
+        username: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        max_attempts: int = 3,
+        payload: Optional[Dict] = None
+    ) -> Dict:
+        """
+        提交分析任务
+
+        Args:
+            video_url: 视频 URL
+            username: 提交任务的用户（可选）
+            idempotency_key: 幂等键（可选，默认按用户 + 规范视频 ID 生成）
+            max_attempts: 最大尝试次数
+            payload: 附加参数（可选）
+
+        Returns:
+            任务信息，'created' 为 False 表示返回的是已存在的任务
+        """
+        key = idempotency_key or default_idempotency_key(video_url, username)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT job_id, status FROM jobs WHERE idempotency_key = ?', (key,)
+                ).fetchone()
+                created = row is None or row['status'] in (JOB_FAILED, JOB_CANCELLED)
+                if not created:
+                    job_id = row['job_id']
+                elif row is not None:
+                    # 之前失败或已取消：重新排队
+                    job_id = row['job_id']
+                    self._conn.execute(
+                        'UPDATE jobs SET video_url = ?, payload = ?, status = ?, attempts = 0, '
+                        'max_attempts = ?, next_run_at = ?, worker_id = NULL, lease_expires_at = NULL, '
+                        'result = NULL, error = NULL, updated_at = ?, finished_at = NULL, '
+                        'cached = 0, quota_refunded = 0 WHERE job_id = ?',
+                        (video_url, json.dumps(payload or {}), JOB_QUEUED, max_attempts, now, now, job_id)
+                    )
+                else:
+                    job_id = uuid.uuid4().hex
+                    self._conn.execute(
+                        'INSERT INTO jobs (job_id, idempotency_key, video_url, username, payload, status, '
+                        'max_attempts, next_run_at, created_at, updated_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (job_id, key, video_url, username, json.dumps(payload or {}), JOB_QUEUED,
+                         max_attempts, now, now, now)
+                    )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return dict(self.get(job_id), created=created)
+
+    def claim(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[Dict]:
+        """
+        领取一个可执行的任务（排队中且到达重试时间，或运行中但租约已过期）
+
+        Args:
+            worker_id: 工作进程标识
+            lease_seconds: 租约时长（秒）
+
+        Returns:
+            任务信息，没有可执行任务时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 租约过期且已用完尝试次数的任务（工作进程反复崩溃）不再重试
+                self._conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ?, '
+                    'finished_at = ? WHERE status = ? AND lease_expires_at <= ? AND attempts >= max_attempts',
+                    (JOB_FAILED, '工作进程执行超时', now, now, JOB_RUNNING, now)
+                )
+                row = self._conn.execute(
+                    'SELECT job_id FROM jobs '
+                    'WHERE (status = ? AND next_run_at <= ?) OR (status = ? AND lease_expires_at <= ?) '
+                    'ORDER BY next_run_at LIMIT 1',
+                    (JOB_QUEUED, now, JOB_RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return None
+                self._conn.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, worker_id = ?, '
+                    'lease_expires_at = ?, updated_at = ? WHERE job_id = ?',
+                    (JOB_RUNNING, worker_id, now + lease_seconds, now, row['job_id'])
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return self.get(row['job_id'])
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> bool:
+        """
+        续约
+
+        Returns:
+            False 表示任务已被取消或已被其他进程接管，应停止执行
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET lease_expires_at = ?, updated_at = ? '
+                'WHERE job_id = ? AND worker_id = ? AND status = ?',
+                (now + lease_seconds, now, job_id, worker_id, JOB_RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Any, cached: bool = False) -> bool:
+        """
+        标记任务成功并保存结果
+
+        Args:
+            job_id: 任务 ID
+            worker_id: 工作进程标识
+            result: 分析结果
+            cached: 结果是否来自结果缓存（不消耗配额，记为待退还）
+
+        Returns:
+            False 表示任务已被取消或已被其他进程接管，结果被丢弃
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = NULL, lease_expires_at = NULL, '
+                'updated_at = ?, finished_at = ?, cached = ? WHERE job_id = ? AND worker_id = ? AND status = ?',
+                (JOB_SUCCEEDED, json.dumps(result, ensure_ascii=False), now, now, int(cached),
+                 job_id, worker_id, JOB_RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> Optional[str]:
+        """
+        记录一次失败：未超过最大尝试次数时按退避时间重新排队，否则标记为 failed
+
+        Returns:
+            任务的新状态（queued / failed），任务已不属于该进程时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT attempts, max_attempts FROM jobs WHERE job_id = ? AND worker_id = ? AND status = ?',
+                    (job_id, worker_id, JOB_RUNNING)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute('COMMIT')
+                    return None
+                if row['attempts'] < row['max_attempts']:
+                    status = JOB_QUEUED
+                    self._conn.execute(
+                        'UPDATE jobs SET status = ?, error = ?, next_run_at = ?, worker_id = NULL, '
+                        'lease_expires_at = NULL, updated_at = ? WHERE job_id = ?',
+                        (status, error, now + retry_delay(row['attempts']), now, job_id)
+                    )
+                else:
+                    status = JOB_FAILED
+                    self._conn.execute(
+                        'UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, '
+                        'updated_at = ?, finished_at = ? WHERE job_id = ?',
+                        (status, error, now, now, job_id)
+                    )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return status
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        取消任务（运行中的任务在下次续约时停止，结果被丢弃）
+
+        Returns:
+            取消后的任务信息，任务不存在时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, lease_expires_at = NULL, updated_at = ?, finished_at = ? '
+                'WHERE job_id = ? AND status IN (?, ?)',
+                (JOB_CANCELLED, now, now, job_id, JOB_QUEUED, JOB_RUNNING)
+            )
+        return self.get(job_id)
+
+    def claim_refunds(self) -> List[str]:
+        """
+        领取待退还配额的任务（失败、已取消，或命中结果缓存后成功），每个任务只会被领取一次
+
+        Returns:
+            每个任务对应一个用户名（同一用户可能出现多次）
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                where = (
+                    'quota_refunded = 0 AND username IS NOT NULL '
+                    'AND (status IN (?, ?) OR (status = ? AND cached = 1))'
+                )
+                params = (JOB_FAILED, JOB_CANCELLED, JOB_SUCCEEDED)
+                rows = self._conn.execute(f'SELECT username FROM jobs WHERE {where}', params).fetchall()
+                if rows:
+                    self._conn.execute(f'UPDATE jobs SET quota_refunded = 1 WHERE {where}', params)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [row['username'] for row in rows]
+
+    def get(self, job_id: str, include_result: bool = False) -> Optional[Dict]:
+        """
+        查询任务
+
+        Args:
+            job_id: 任务 ID
+            include_result: 是否附带结果
+
+        Returns:
+            任务信息，不存在时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'] or '{}')
+        result = job.pop('result')
+        if include_result:
+            job['result'] = json.loads(result) if result else None
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        """
+        各状态的任务数
+
+        Returns:
+            {'queued': n, 'running': n, ...}
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = {status: 0 for status in (JOB_QUEUED, JOB_RUNNING) + FINAL_STATES}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# ---- 工作进程 ----
+
+async def _execute_job(queue: JobQueue, pipeline, cache, job: Dict, worker_id: str, lease_seconds: float):
+    """执行单个任务：续约的同时运行分析流水线，完成后写回结果"""
+    video_url = job['video_url']
+    job_task = asyncio.ensure_future(_analyze(pipeline, cache, video_url))
+
+    # 定期续约；任务被取消或被接管时停止执行
+    while not job_task.done():
+        await asyncio.wait([job_task], timeout=lease_seconds / 3)
+        if not job_task.done():
+            alive = await asyncio.to_thread(queue.heartbeat, job['job_id'], worker_id, lease_seconds)
+            if not alive:
+                print(f"🛑 任务 {job['job_id']} 已取消，停止执行")
+                job_task.cancel()
+
+    try:
+        result, cached = job_task.result()
+    except asyncio.CancelledError:
+        return
+    except Exception as e:
+        status = await asyncio.to_thread(queue.fail, job['job_id'], worker_id, str(e))
+        print(f"❌ 任务 {job['job_id']} 第 {job['attempts']} 次执行失败: {e}"
+              f"{'，稍后重试' if status == JOB_QUEUED else ''}")
+        return
+
+    # 先把报告写入分析结果存储，任务标记为成功时检索 / 导出已能看到这份报告
+    if pipeline.store is not None:
+        try:
+            await asyncio.to_thread(pipeline.store.flush)
+        except Exception as e:
+            print(f"⚠️ 任务 {job['job_id']} 的报告写入存储失败（稍后重试）: {e}")
+    await asyncio.to_thread(queue.complete, job['job_id'], worker_id, result, cached)
+    print(f"✅ 任务 {job['job_id']} 完成{'（命中缓存）' if cached else ''}")
+
+
+async def _analyze(pipeline, cache, video_url: str):
+    """
+    运行分析流水线（与 /api/analyze 共用结果缓存）
+
+    Returns:
+        (分析结果, 是否命中缓存)
+    """
+    cached = await asyncio.to_thread(cache.get, video_url, kind='api_report')
+    if cached is not None:
+        return cached, True
+    result = await pipeline.run(video_url)
+    await asyncio.to_thread(cache.set, video_url, result, kind='api_report')
+    return result, False
+
+
+async def _worker_loop(db_path: str, worker_id: str, concurrency: int, poll_interval: float,
+                       lease_seconds: float, stop_event, parent_pid: Optional[int] = None):
+    # 在工作进程内创建客户端（不跨进程共享）
+    from .tiktok_fetcher import TikTokFetcher
+    from .video_analyzer import VideoAnalyzer
+    from .result_cache import AnalysisCache
+    from .pipeline import AsyncVideoPipeline
+
+    queue = JobQueue(db_path)
+    analyzer = VideoAnalyzer()
+    cache = AnalysisCache.for_analyzer(analyzer)
+    pipeline = AsyncVideoPipeline(TikTokFetcher(), analyzer)
+    running: set = set()
+
+    print(f"👷 工作进程 {worker_id} 已启动（并发 {concurrency}）")
+    try:
+        while not stop_event.is_set():
+            # 工作进程不是守护进程（需要创建本地信号 / 本地转录的进程池），主进程异常退出时自行退出
+            if parent_pid is not None and os.getppid() != parent_pid:
+                print(f"🛑 主进程已退出，工作进程 {worker_id} 停止")
+                break
+            while len(running) < concurrency:
+                job = await asyncio.to_thread(queue.claim, worker_id, lease_seconds)
+                if job is None:
+                    break
+                print(f"▶️  {worker_id} 领取任务 {job['job_id']}（第 {job['attempts']} 次）: {job['video_url']}")
+                task = asyncio.ensure_future(
+                    _execute_job(queue, pipeline, cache, job, worker_id, lease_seconds)
+                )
+                running.add(task)
+                task.add_done_callback(running.discard)
+            await asyncio.sleep(poll_interval)
+    finally:
+        # 停止时放弃运行中的任务，租约过期后由其他进程重新领取
+        for task in running:
+            task.cancel()
+        pipeline.close()
+        # 等待本地信号 / 本地转录的进程池退出，否则本进程退出时会卡在回收子进程
+        for resource in (analyzer.feature_extractor, analyzer.transcriber):
+            if resource is not None:
+                resource.close(wait=True)
+        queue.close()
+
+
+def run_worker(db_path: str, worker_id: str, concurrency: int = 4, poll_interval: float = 1.0,
+               lease_seconds: float = DEFAULT_LEASE_SECONDS, stop_event=None, parent_pid: Optional[int] = None):
+    """
+    工作进程入口
+
+    Args:
+        db_path: 任务队列数据库路径
+        worker_id: 工作进程标识
+        concurrency: 同时执行的任务数
+        poll_interval: 空闲时的轮询间隔（秒）
+        lease_seconds: 租约时长（秒）
+        stop_event: multiprocessing.Event，置位后退出
+        parent_pid: 主进程 PID（可选），主进程退出后工作进程随之退出
+    """
+    stop_event = stop_event or multiprocessing.Event()
+    try:
+        asyncio.run(_worker_loop(
+            db_path, worker_id, concurrency, poll_interval, lease_seconds, stop_event, parent_pid
+        ))
+    except KeyboardInterrupt:
+        pass
+
+
+class JobWorkerPool:
+    """
+    任务工作进程池
+
+    每个进程独立创建 Fetcher / Analyzer / 流水线，并发执行 concurrency 个任务；
+    退出的进程由 ensure_alive() 重新拉起
+
+    工作进程不是守护进程：守护进程不能再创建子进程，而本地信号提取和本地转录都使用进程池。
+    因此必须调用 stop() 结束工作进程；主进程异常退出时，工作进程检测到父进程变化后自行退出
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        processes: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS
+    ):
+        """
+        初始化进程池
+
+        Args:
+            db_path: 任务队列数据库路径（可选，默认与 JobQueue 相同）
+            processes: 进程数，默认读取 JOB_WORKERS（默认 2）
+            concurrency: 每个进程的并发任务数，默认读取 JOB_WORKER_CONCURRENCY（默认 4）
+            lease_seconds: 租约时长（秒）
+        """
+        self.db_path = str(db_path or get_data_dir('jobs') / 'jobs.sqlite3')
+        self.processes = processes if processes is not None else int(os.getenv('JOB_WORKERS', '2'))
+        self.concurrency = concurrency or int(os.getenv('JOB_WORKER_CONCURRENCY', '4'))
+        self.lease_seconds = lease_seconds
+
+        # spawn：不继承父进程的线程和 SDK 客户端状态
+        self._context = multiprocessing.get_context('spawn')
+        self._stop_event = self._context.Event()
+        self._workers: List[multiprocessing.Process] = []
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = self._context.Process(
+            target=run_worker,
+            args=(self.db_path, f"worker-{os.getpid()}-{index}", self.concurrency, 1.0,
+                  self.lease_seconds, self._stop_event, os.getpid()),
+            name=f"job-worker-{index}",
+            daemon=False
+        )
+        process.start()
+        return process
+
+    def start(self):
+        """启动所有工作进程"""
+        self._stop_event.clear()
+        self._workers = [self._spawn(i) for i in range(self.processes)]
+        print(f"✅ 已启动 {self.processes} 个任务工作进程")
+
+    def ensure_alive(self) -> int:
+        """
+        重新拉起已退出的工作进程
+
+        Returns:
+            重启的进程数
+        """
+        restarted = 0
+        for index, process in enumerate(self._workers):
+            if not process.is_alive() and not self._stop_event.is_set():
+                print(f"⚠️ 工作进程 {process.name} 已退出（退出码 {process.exitcode}），重新启动")
+                self._workers[index] = self._spawn(index)
+                restarted += 1
+        return restarted
+
+    def stop(self, timeout: float = 10):
+        """通知所有工作进程退出并等待，超时仍未退出的进程强制结束"""
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for process in self._workers:
+            process.join(max(deadline - time.monotonic(), 0))
+        for process in self._workers:
+            if process.is_alive():
+                print(f"⚠️ 工作进程 {process.name} 未在 {timeout} 秒内退出，强制结束")
+                process.terminate()
+                process.join(5)
+        self._workers = []
+
+    def stats(self) -> Dict:
+        """
+        进程池状态
+
+        Returns:
+            {'processes', 'alive', 'concurrency'}
+        """
+        return {
+            'processes': self.processes,
+            'alive': sum(1 for p in self._workers if p.is_alive()),
+            'concurrency': self.concurrency,
+        }
@@ -0,0 +1,265 @@
+"""
+JSON Stream
+Gemini 响应的增量 JSON 解析：边接收 stream=True 的分块边扫描，顶层字段一闭合就解析并产出，
+同时兼容纯 JSON、Markdown 代码块和带说明文字的响应（只扫描一遍）
+"""
+
+import re
+import json
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# 字符串外需要关注的结构字符
+_STRUCTURAL = re.compile(r'["{}\[\],:]')
+# 字符串内需要关注的字符
+_STRING_SPECIAL = re.compile(r'["\\]')
+_NON_SPACE = re.compile(r'\S')
+
+
+class JSONStreamError(ValueError):
+    """响应中没有可解析的 JSON 对象（text 属性为已接收的原始文本）"""
+
+    def __init__(self, message: str, text: str = ''):
+        super().__init__(message)
+        self.text = text
+
+
+class StreamingJSONParser:
+    """
+    顶层 JSON 对象的增量解析器
+
+    - 跳过第一个 { 之前的说明文字 / ```json 标记，以及根对象闭合后的内容
+    - feed() 每次只扫描新增的文本，顶层字段的值完整后立即 json.loads 该片段并返回
+    - 根对象闭合后 done 为 True，result() 返回完整字典
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.sections: Dict[str, Any] = {}
+        self.done = False
+
+        self._pos = 0
+        self._root_start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._expect = 'key'  # key / colon / value / in_value / after_value
+        self._key_start = 0
+        self._key = None
+        self._value_start = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        追加一段文本
+
+        Args:
+            chunk: 新收到的响应文本
+
+        Returns:
+            本次新闭合的顶层字段 [(key, value), ...]
+        """
+        if not chunk or self.done:
+            return []
+        self.text += chunk
+        completed: List[Tuple[str, Any]] = []
+
+        if self._root_start is None:
+            start = self.text.find('{', self._pos)
+            if start == -1:
+                self._pos = len(self.text)
+                return completed
+            self._root_start = start
+            self._depth = 1
+            self._pos = start + 1
+
+        text = self.text
+        while not self.done:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, self._pos)
+                if match is None:
+                    self._pos = len(text)
+                    break
+                if match.group() == '\\':
+                    if match.end() >= len(text):
+                        # 转义符在分块末尾，等下一块再处理
+                        self._pos = match.start()
+                        break
+                    self._pos = match.end() + 1
+                    continue
+                self._pos = match.end()
+                self._in_string = False
+                if self._depth == 1:
+                    self._close_depth1_string(completed)
+                continue
+
+            if self._depth == 1 and self._expect == 'value':
+                match = _NON_SPACE.search(text, self._pos)
+                if match is None:
+                    self._pos = len(text)
+                    break
+                self._value_start = match.start()
+                self._expect = 'in_value'
+                if match.group() not in '"{[':
+                    # 数字 / true / false / null：等到 , 或 } 时结束
+                    self._pos = match.end()
+                    continue
+
+            match = _STRUCTURAL.search(text, self._pos)
+            if match is None:
+                self._pos = len(text)
+                break
+            char, index = match.group(), match.start()
+            self._pos = match.end()
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == 'key':
+                    self._key_start = index
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._expect == 'in_value':
+                        self._emit(text[self._value_start:index], completed)
+                    elif self._expect in ('colon', 'value') or (
+                        not self.sections and text[self._root_start + 1:index].strip()
+                    ):
+                        # 例如说明文字中的 {x}：不是 JSON 对象
+                        raise JSONStreamError("JSON 对象格式无效", self.text)
+                    self.done = True
+                elif self._depth == 1 and self._expect == 'in_value':
+                    self._emit(text[self._value_start:index + 1], completed)
+                    self._expect = 'after_value'
+            elif self._depth == 1:
+                if char == ':' and self._expect == 'colon':
+                    self._expect = 'value'
+                elif char == ',':
+                    if self._expect == 'in_value':
+                        self._emit(text[self._value_start:index], completed)
+                    self._expect = 'key'
+
+        return completed
+
+    def _close_depth1_string(self, completed: List[Tuple[str, Any]]):
+        """根对象一层的字符串结束：可能是键，也可能是字符串值"""
+        if self._expect == 'key':
+            self._key = self._loads(self.text[self._key_start:self._pos])
+            self._expect = 'colon'
+        elif self._expect == 'in_value':
+            self._emit(self.text[self._value_start:self._pos], completed)
+            self._expect = 'after_value'
+
+    def _emit(self, fragment: str, completed: List[Tuple[str, Any]]):
+        value = self._loads(fragment)
+        self.sections[self._key] = value
+        completed.append((self._key, value))
+
+    def _loads(self, fragment: str) -> Any:
+        try:
+            return json.loads(fragment)
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(f"JSON 解析失败: {e}", self.text) from e
+
+    def result(self) -> Dict[str, Any]:
+        """
+        返回完整的解析结果
+
+        Raises:
+            JSONStreamError: 没有找到 JSON 对象，或对象未闭合
+        """
+        if self._root_start is None:
+            raise JSONStreamError("响应中未找到 JSON 对象", self.text)
+        if not self.done:
+            raise JSONStreamError("JSON 对象不完整（响应可能被截断）", self.text)
+        return self.sections
+
+
+def parse_json_response(text: str, max_attempts: int = 3) -> Dict[str, Any]:
+    """
+    从完整响应文本中解析 JSON 对象（非流式调用的统一入口）
+
+    说明文字里出现的 { 会导致解析失败，此时从下一个 { 重新开始，最多尝试 max_attempts 次
+
+    Args:
+        text: 响应文本
+        max_attempts: 最多尝试的起始位置数
+
+    Returns:
+        解析后的字典
+
+    Raises:
+        JSONStreamError: 无法解析
+    """
+    offset = 0
+    error: Optional[JSONStreamError] = None
+    for _ in range(max_attempts):
+        parser = StreamingJSONParser()
+        try:
+            parser.feed(text[offset:])
+            return parser.result()
+        except JSONStreamError as e:
+            error = e
+            if parser._root_start is None:
+                break
+            next_start = text.find('{', offset + parser._root_start + 1)
+            if next_start == -1:
+                break
+            offset = next_start
+    raise JSONStreamError(str(error), text)
+
+
+def iter_sections(
+    chunks: Iterable,
+    parser: Optional[StreamingJSONParser] = None
+) -> Iterator[Tuple[str, Any]]:
+    """
+    消费 generate_content(stream=True) 的分块，逐个产出闭合的顶层字段
+
+    Args:
+        chunks: 响应分块（带 .text 属性的对象或字符串）
+        parser: 解析器（可选，传入后可在迭代结束时调用 parser.result() 取完整结果）
+
+    Yields:
+        (key, value)
+    """
+    parser = parser or StreamingJSONParser()
+    for chunk in chunks:
+        yield from parser.feed(_chunk_text(chunk))
+
+
+async def aiter_sections(
+    chunks,
+    parser: Optional[StreamingJSONParser] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """iter_sections 的异步版本（generate_content_async(stream=True)）"""
+    parser = parser or StreamingJSONParser()
+    async for chunk in chunks:
+        for section in parser.feed(_chunk_text(chunk)):
+            yield section
+
+
+def parse_stream(
+    chunks: Iterable,
+    on_section: Optional[Callable[[str, Any], None]] = None
+) -> Dict[str, Any]:
+    """
+    消费流式响应并返回完整结果，每个顶层字段闭合时回调 on_section(key, value)
+
+    Raises:
+        JSONStreamError: 无法解析
+    """
+    parser = StreamingJSONParser()
+    for key, value in iter_sections(chunks, parser):
+        if on_section:
+            on_section(key, value)
+    return parser.result()
+
+
+def _chunk_text(chunk) -> str:
+    if isinstance(chunk, str):
+        return chunk
+    try:
+        return chunk.text
+    except ValueError:
+        # 被安全策略拦截等情况下分块没有文本
+        return ''
@@ -0,0 +1,446 @@
+"""
+Near Duplicate
+近似重复视频检测：每秒一帧的感知哈希（pHash）+ 音频指纹，多索引哈希按汉明距离检索；
+同一素材被不同账号搬运（裁剪、加水印、重新编码）时复用已有分析结果，跳过上传和生成
+"""
+
+import os
+import json
+import time
+import copy
+import sqlite3
+import threading
+from itertools import combinations
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .paths import get_data_dir
+from .result_cache import extract_video_id
+from .frame_sampler import decode_frames
+from .video_features import decode_pcm
+from .audio_stream import SAMPLE_RATE
+
+
+# 帧哈希：每秒一帧、32x32 灰度，取 DCT 左上 8x8 低频系数与中位数比较得到 64 位
+HASH_FPS = 1.0
+HASH_SIZE = 32
+# 画面几乎是纯色的帧（黑屏、转场）不参与检索
+MIN_FRAME_STD = 4.0
+
+# 音频指纹：128 ms 窗口、64 ms 步长，300-2000 Hz 分 33 个对数频带，相邻频带能量差的时间变化取符号得到 32 位
+AUDIO_WINDOW = 2048
+AUDIO_HOP = 1024
+AUDIO_BANDS = 33
+
+# uint8 的 1 的个数查找表（兼容 numpy 1.x，不依赖 np.bitwise_count）
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    """正交 DCT-II 矩阵"""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(HASH_SIZE)
+
+
+def phash_frames(gray: np.ndarray) -> np.ndarray:
+    """
+    批量计算 pHash
+
+    Args:
+        gray: float32 数组 (N, 32, 32)
+
+    Returns:
+        uint64 数组 (N,)
+    """
+    if len(gray) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    coefficients = _DCT @ gray @ _DCT.T
+    low = coefficients[:, :8, :8].reshape(len(gray), 64)
+    # 直流分量不参与中位数计算
+    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return np.packbits(bits, axis=1, bitorder='little').view('<u8').ravel().astype(np.uint64)
+
+
+def audio_fingerprint(pcm: np.ndarray, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    音频指纹（Haitsma-Kalker 风格的子带能量差分）
+
+    Args:
+        pcm: int16 单声道 PCM
+
+    Returns:
+        uint32 数组，每 64 ms 一项
+    """
+    if len(pcm) < AUDIO_WINDOW * 2:
+        return np.zeros(0, dtype=np.uint32)
+    frames = 1 + (len(pcm) - AUDIO_WINDOW) // AUDIO_HOP
+    index = np.arange(AUDIO_WINDOW)[None, :] + AUDIO_HOP * np.arange(frames)[:, None]
+    windows = pcm[index].astype(np.float32) * np.hanning(AUDIO_WINDOW).astype(np.float32)
+    power = np.abs(np.fft.rfft(windows, axis=1)) ** 2
+
+    freqs = np.fft.rfftfreq(AUDIO_WINDOW, 1 / sample_rate)
+    edges = np.geomspace(300, 2000, AUDIO_BANDS + 1)
+    band_of = np.digitize(freqs, edges) - 1
+    valid = (band_of >= 0) & (band_of < AUDIO_BANDS)
+    energy = np.zeros((frames, AUDIO_BANDS), dtype=np.float64)
+    np.add.at(energy.T, band_of[valid], power[:, valid].T)
+
+    band_diff = energy[:, :-1] - energy[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    return np.packbits(bits, axis=1, bitorder='little').view('<u4').ravel().astype(np.uint32)
+
+
+def audio_bit_error_rate(a: np.ndarray, b: np.ndarray, max_offset: int = 32) -> Optional[float]:
+    """
+    两段音频指纹在 ±max_offset 帧（默认约 ±2 秒）对齐范围内的最小误码率
+
+    Returns:
+        0-1，任一方没有音频时返回 None
+    """
+    if len(a) == 0 or len(b) == 0:
+        return None
+    best = 1.0
+    for offset in range(-max_offset, max_offset + 1):
+        left = a[max(0, offset):]
+        right = b[max(0, -offset):]
+        length = min(len(left), len(right))
+        if length < 16:
+            continue
+        diff = np.bitwise_xor(left[:length], right[:length])
+        best = min(best, _POPCOUNT[diff.view(np.uint8)].sum() / (length * 32))
+    return float(best)
+
+
+@dataclass
+class VideoFingerprint:
+    """视频指纹"""
+    frame_hashes: np.ndarray
+    audio_bits: np.ndarray
+    duration: float
+
+
+def compute_fingerprint(video_path: str, max_seconds: float = 120) -> VideoFingerprint:
+    """
+    计算视频指纹（只看前 max_seconds 秒）
+
+    Args:
+        video_path: 本地视频文件路径
+        max_seconds: 最多分析的时长（秒）
+    """
+    frames = decode_frames(video_path, fps=HASH_FPS, width=HASH_SIZE, height=HASH_SIZE, max_seconds=max_seconds)
+    gray = frames.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    informative = gray.reshape(len(gray), -1).std(axis=1) >= MIN_FRAME_STD
+    hashes = phash_frames(gray[informative])
+
+    pcm = decode_pcm(video_path)[:int(max_seconds * SAMPLE_RATE)]
+    return VideoFingerprint(
+        frame_hashes=hashes,
+        audio_bits=audio_fingerprint(pcm),
+        duration=len(frames) / HASH_FPS,
+    )
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """
+    多索引哈希（Norouzi et al.）：64 位哈希拆成 4 段 16 位，每段一张哈希表
+
+    汉明距离 ≤ r 时至少有一段的距离 ≤ r // 4（鸽巢原理），因此只需在每张表中枚举
+    距离 ≤ r // 4 的键，再对候选精确计算距离；r = 10 时每次查询 4 × 137 次字典查找。
+    64 位 / 半径 10 下 BK 树几乎无法剪枝，实测比线性扫描还慢（见 benchmarks/bench_near_duplicate.py）
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self):
+        self._tables: List[Dict[int, List[Tuple[int, Any]]]] = [{} for _ in range(self.CHUNKS)]
+        self._masks: Dict[int, List[int]] = {}
+        self.size = 0
+
+    def _chunk_masks(self, distance: int) -> List[int]:
+        """16 位内距离 ≤ distance 的全部翻转掩码"""
+        if distance not in self._masks:
+            masks = [0]
+            for bits in range(1, distance + 1):
+                masks += [sum(1 << p for p in positions) for positions in combinations(range(self.CHUNK_BITS), bits)]
+            self._masks[distance] = masks
+        return self._masks[distance]
+
+    def _keys(self, value: int) -> List[int]:
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, value: int, item: Any):
+        self.size += 1
+        entry = (value, item)
+        for table, key in zip(self._tables, self._keys(value)):
+            table.setdefault(key, []).append(entry)
+
+    def search(self, value: int, radius: int) -> List[Tuple[Any, int]]:
+        """
+        Returns:
+            距离不超过 radius 的 [(条目, 距离)]
+        """
+        masks = self._chunk_masks(radius // self.CHUNKS)
+        seen = set()
+        results = []
+        for table, key in zip(self._tables, self._keys(value)):
+            for mask in masks:
+                for entry in table.get(key ^ mask, ()):
+                    if entry in seen:
+                        continue
+                    seen.add(entry)
+                    distance = hamming(value, entry[0])
+                    if distance <= radius:
+                        results.append((entry[1], distance))
+        return results
+
+
+@dataclass
+class DuplicateMatch:
+    """近似重复的已分析视频"""
+    video_url: str
+    video_id: str
+    analysis: Dict
+    frame_similarity: float
+    audio_bit_error_rate: Optional[float]
+
+    def annotated_analysis(self) -> Dict:
+        """复制分析结果并标注来源"""
+        analysis = copy.deepcopy(self.analysis)
+        analysis['near_duplicate_of'] = {
+            'video_url': self.video_url,
+            'frame_similarity': round(self.frame_similarity, 3),
+            'audio_bit_error_rate': (
+                round(self.audio_bit_error_rate, 3) if self.audio_bit_error_rate is not None else None
+            ),
+        }
+        return analysis
+
+
+class NearDuplicateIndex:
+    """
+    近似重复视频索引
+
+    - 指纹和分析结果持久化到 SQLite，帧哈希在内存中组织为多索引哈希；
+      每次查询前增量加载其他进程新写入的记录
+    - 查询：每个帧哈希在多索引哈希中找汉明距离 ≤ max_distance 的帧，按视频计票；
+      匹配帧比例 ≥ min_frame_ratio 且（双方都有音频时）音频误码率 ≤ max_audio_ber 视为近似重复
+    - 只复用相同 Prompt / 模型 / 分析模式指纹下的结果
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        max_distance: int = 10,
+        min_frame_ratio: float = 0.6,
+        max_audio_ber: float = 0.35
+    ):
+        """
+        Args:
+            db_path: SQLite 文件路径（可选，默认存放在本地数据目录）
+            max_distance: 帧哈希的最大汉明距离（64 位）
+            min_frame_ratio: 匹配帧占查询帧的最小比例
+            max_audio_ber: 音频指纹的最大误码率
+        """
+        self.db_path = str(db_path or get_data_dir('index') / 'near_duplicates.sqlite3')
+        self.max_distance = max_distance
+        self.min_frame_ratio = min_frame_ratio
+        self.max_audio_ber = max_audio_ber
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS near_duplicates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                video_url TEXT NOT NULL,
+                frame_hashes BLOB NOT NULL,
+                audio_bits BLOB NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (video_id, fingerprint)
+            )
+        """)
+        self._conn.commit()
+
+        self._tree = MultiIndexHash()
+        self._entries: Dict[int, Dict] = {}
+        self._latest: Dict[Tuple[str, str], int] = {}
+        self._loaded_id = 0
+
+        self.lookups = 0
+        self.hits = 0
+
+    def _refresh(self):
+        """加载 _loaded_id 之后写入的记录（调用方持有锁）"""
+        rows = self._conn.execute(
+            'SELECT id, video_id, fingerprint, video_url, frame_hashes, audio_bits FROM near_duplicates '
+            'WHERE id > ? ORDER BY id', (self._loaded_id,)
+        ).fetchall()
+        for row_id, video_id, fingerprint, video_url, frame_hashes, audio_bits in rows:
+            # 同一视频重新分析后旧记录被替换：旧行号留在多索引哈希中，查询时按 _entries 过滤
+            superseded = self._latest.pop((video_id, fingerprint), None)
+            if superseded is not None:
+                self._entries.pop(superseded, None)
+            self._latest[(video_id, fingerprint)] = row_id
+            hashes = np.frombuffer(frame_hashes, dtype='<u8')
+            self._entries[row_id] = {
+                'video_id': video_id,
+                'fingerprint': fingerprint,
+                'video_url': video_url,
+                'frame_count': len(hashes),
+                'audio_bits': np.frombuffer(audio_bits, dtype='<u4'),
+            }
+            for value in set(int(h) for h in hashes):
+                self._tree.add(value, row_id)
+            self._loaded_id = row_id
+
+    def find(
+        self,
+        fingerprint: VideoFingerprint,
+        result_fingerprint: str,
+        exclude_video_id: Optional[str] = None
+    ) -> Optional[DuplicateMatch]:
+        """
+        查找近似重复的已分析视频
+
+        Args:
+            fingerprint: 查询视频的指纹
+            result_fingerprint: 分析结果指纹（Prompt + 模型 + 分析模式）
+            exclude_video_id: 排除的规范视频 ID（可选，通常为查询视频自身）
+
+        Returns:
+            最相似的匹配，没有时返回 None
+        """
+        query = [int(h) for h in fingerprint.frame_hashes]
+        if not query:
+            return None
+
+        with self._lock:
+            self.lookups += 1
+            self._refresh()
+
+            votes: Dict[int, int] = {}
+            for value in query:
+                for row_id in {row_id for row_id, _ in self._tree.search(value, self.max_distance)}:
+                    votes[row_id] = votes.get(row_id, 0) + 1
+
+            best: Optional[Tuple[float, int, Optional[float]]] = None
+            for row_id, count in votes.items():
+                entry = self._entries.get(row_id)
+                if entry is None or entry['fingerprint'] != result_fingerprint or entry['video_id'] == exclude_video_id:
+                    continue
+                # 比例按较长的一方计算：一段视频只是另一段的片段时不算重复
+                ratio = count / max(len(query), entry['frame_count'])
+                if ratio < self.min_frame_ratio:
+                    continue
+                ber = audio_bit_error_rate(fingerprint.audio_bits, entry['audio_bits'])
+                if ber is not None and ber > self.max_audio_ber:
+                    continue
+                if best is None or ratio > best[0]:
+                    best = (ratio, row_id, ber)
+
+            if best is None:
+                return None
+            ratio, row_id, ber = best
+            row = self._conn.execute(
+                'SELECT analysis FROM near_duplicates WHERE id = ?', (row_id,)
+            ).fetchone()
+            if row is None:
+                # 查询期间被其他进程替换
+                return None
+            self.hits += 1
+            entry = self._entries[row_id]
+
+        print(f"♻️  发现近似重复视频: {entry['video_url']}（画面相似度 {ratio:.0%}），复用已有分析结果")
+        return DuplicateMatch(
+            video_url=entry['video_url'],
+            video_id=entry['video_id'],
+            analysis=json.loads(row[0]),
+            frame_similarity=ratio,
+            audio_bit_error_rate=ber,
+        )
+
+    def add(self, video_url: str, fingerprint: VideoFingerprint, analysis: Dict, result_fingerprint: str):
+        """
+        记录已分析视频的指纹和分析结果（同一视频 + 结果指纹只保留最新一次）
+
+        Args:
+            video_url: 视频 URL
+            fingerprint: 视频指纹
+            analysis: 分析结果
+            result_fingerprint: 分析结果指纹
+        """
+        if len(fingerprint.frame_hashes) == 0:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO near_duplicates '
+                '(video_id, fingerprint, video_url, frame_hashes, audio_bits, analysis, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    extract_video_id(video_url),
+                    result_fingerprint,
+                    video_url,
+                    fingerprint.frame_hashes.astype('<u8').tobytes(),
+                    fingerprint.audio_bits.astype('<u4').tobytes(),
+                    json.dumps(analysis, ensure_ascii=False),
+                    time.time(),
+                )
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'videos', 'frame_hashes', 'lookups', 'hits'}
+        """
+        with self._lock:
+            videos = self._conn.execute('SELECT COUNT(*) FROM near_duplicates').fetchone()[0]
+            return {
+                'videos': videos,
+                'frame_hashes': self._tree.size,
+                'lookups': self.lookups,
+                'hits': self.hits,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_index: Optional[NearDuplicateIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """
+    获取进程内共享的近似重复索引，NEAR_DUPLICATE_DETECTION 未开启（默认 off）时返回 None
+
+    阈值读取 NEAR_DUPLICATE_MAX_DISTANCE（默认 10）和 NEAR_DUPLICATE_MIN_RATIO（默认 0.6）
+    """
+    global _default_index
+    if os.getenv('NEAR_DUPLICATE_DETECTION', 'off').lower() not in ('1', 'on', 'true'):
+        return None
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = NearDuplicateIndex(
+                    max_distance=int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '10')),
+                    min_frame_ratio=float(os.getenv('NEAR_DUPLICATE_MIN_RATIO', '0.6')),
+                )
+    return _default_index
@@ -0,0 +1,29 @@
+"""
+E-Com Video Insider - 本地数据目录
+缓存、索引等持久化文件的统一存放位置
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+def get_data_dir(subdir: Optional[str] = None) -> Path:
+    """
+    获取本地数据目录（不存在时自动创建）
+
+    优先读取环境变量 ECOM_DATA_DIR，否则使用系统临时目录（兼容 Streamlit Cloud）
+
+    Args:
+        subdir: 子目录名（可选），例如 'cache'
+
+    Returns:
+        目录路径
+    """
+    base = os.getenv('ECOM_DATA_DIR')
+    data_dir = Path(base) if base else Path(tempfile.gettempdir()) / 'ecom_video_insider'
+    if subdir:
+        data_dir = data_dir / subdir
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
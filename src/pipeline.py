@@ -0,0 +1,536 @@
+"""
+Async Video Pipeline
+基于 asyncio 的端到端分析流程：元数据获取 → 下载 → 上传 → AI 分析
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Any, Callable, Awaitable, Union
+
+from .tiktok_fetcher import TikTokFetcher
+from .video_analyzer import VideoAnalyzer
+from .file_waiter import FileStateWaiter
+from .result_cache import extract_video_id
+from .single_flight import AsyncSingleFlight
+from .json_stream import JSONStreamError, StreamingJSONParser, aiter_sections
+from .frame_sampler import KeyframeSet, sample_keyframes
+from .video_features import apply_local_features
+from .analysis_store import AnalysisStore, get_analysis_store
+
+
+# 流水线各阶段名称（用于分别限制并发数）
+PIPELINE_STAGES = ('apify', 'download', 'upload', 'generate')
+
+
+class AsyncVideoPipeline:
+    """
+    异步视频分析流水线
+
+    - Apify 元数据获取与 yt-dlp 下载互不依赖，并发执行
+    - 阻塞的 SDK 调用放到专用线程池中执行，等待 Gemini 处理时由 FileStateWaiter 统一轮询，不占用线程
+    - Gemini 生成使用 SDK 原生的 generate_content_async（流式，顶层字段闭合即解析）
+    - 同一视频的并发请求按规范视频 ID 合并（single-flight），只调用一次 Apify / 下载 / 上传 / 生成
+    """
+
+    def __init__(
+        self,
+        fetcher: TikTokFetcher,
+        analyzer: VideoAnalyzer,
+        executor: Optional[ThreadPoolExecutor] = None,
+        file_waiter: Optional[FileStateWaiter] = None,
+        stage_limits: Optional[Dict[str, int]] = None,
+        store: Optional[AnalysisStore] = None
+    ):
+        """
+        初始化异步流水线
+
+        Args:
+            fetcher: TikTok 元数据获取器
+            analyzer: 视频分析器
+            executor: 执行阻塞调用的线程池（可选，默认新建 32 线程的线程池）
+            file_waiter: Gemini 文件状态等待器（可选，默认与 analyzer 共用）
+            stage_limits: 各阶段最大并发数（可选），例如 {'apify': 4, 'generate': 2}，
+                          键为 PIPELINE_STAGES 之一，未指定的阶段不限制
+            store: 分析结果存储（可选，默认按 ANALYSIS_STORE 使用共享存储），每完成一个视频追加一份报告
+        """
+        self.fetcher = fetcher
+        self.analyzer = analyzer
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=32, thread_name_prefix='video-pipeline'
+        )
+        self.file_waiter = file_waiter or analyzer.file_waiter
+        self.store = store or get_analysis_store()
+
+        stage_limits = stage_limits or {}
+        unknown = set(stage_limits) - set(PIPELINE_STAGES)
+        if unknown:
+            raise ValueError(f"未知的流水线阶段: {', '.join(sorted(unknown))}")
+        self.stage_limits = {stage: limit for stage, limit in stage_limits.items() if limit and limit > 0}
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.stage_limits.items()}
+
+        # 同一视频的并发请求在各阶段合并为一次上游调用
+        self._flights = {
+            name: AsyncSingleFlight(name) for name in PIPELINE_STAGES + ('transcribe', 'features')
+        }
+        # 合并下载后多个 run 共用同一个本地文件：按视频 ID 计数，最后一个结束的调用方负责删除
+        self._video_refs: Dict[str, Dict[str, Any]] = {}
+
+    @asynccontextmanager
+    async def _stage(self, name: str):
+        """占用指定阶段的并发名额（未配置限制时直接放行）"""
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+        async with semaphore:
+            yield
+
+    def _retain_video(self, video_id: str, cleanup: bool):
+        """加入同一视频的下载前登记引用（cleanup=False 的调用方要求保留文件）"""
+        ref = self._video_refs.setdefault(video_id, {'count': 0, 'path': None, 'keep': False})
+        ref['count'] += 1
+        ref['keep'] = ref['keep'] or not cleanup
+
+    def _release_video(self, video_id: str, video_path: Optional[str]):
+        """释放引用；最后一个调用方结束时删除本地文件（除非有调用方要求保留）"""
+        ref = self._video_refs[video_id]
+        ref['path'] = ref['path'] or video_path
+        ref['count'] -= 1
+        if ref['count'] > 0:
+            return
+        del self._video_refs[video_id]
+        if ref['path'] and not ref['keep']:
+            self.analyzer.cleanup_temp_file(ref['path'])
+
+    async def _run_blocking(self, func: Callable, *args, **kwargs) -> Any:
+        """在线程池中执行阻塞函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def fetch_metadata(self, video_url: str) -> Dict:
+        """
+        异步获取视频元数据（Apify），同一视频的并发请求只调用一次
+
+        Args:
+            video_url: 视频 URL
+
+        Returns:
+            格式化后的视频元数据
+        """
+        return await self._flights['apify'].do(
+            extract_video_id(video_url), lambda publish: self._fetch_metadata(video_url)
+        )
+
+    async def _fetch_metadata(self, video_url: str) -> Dict:
+        async with self._stage('apify'):
+            return await self._run_blocking(self.fetcher.fetch_video_data, video_url)
+
+    async def download(self, video_url: str, progress_hook: Optional[Callable[[Dict], None]] = None) -> str:
+        """
+        异步下载视频（yt-dlp）
+
+        同一视频的并发请求共享一次下载，进度回调分发给所有调用方
+
+        Args:
+            video_url: 视频 URL
+            progress_hook: yt-dlp 下载进度回调（可选，在线程池中调用）
+
+        Returns:
+            本地视频文件路径
+        """
+        return await self._flights['download'].do(
+            extract_video_id(video_url),
+            lambda publish: self._download(video_url, publish),
+            on_event=progress_hook
+        )
+
+    async def _download(self, video_url: str, progress_hook: Callable[[Dict], None]) -> str:
+        async with self._stage('download'):
+            return await self._run_blocking(
+                self.analyzer.download_video_with_ytdlp, video_url, progress_hook=progress_hook
+            )
+
+    async def upload(
+        self,
+        video_path: str,
+        max_wait_time: int = 300,
+        on_state: Optional[Callable[[str], None]] = None
+    ):
+        """
+        异步上传视频到 Gemini 并等待处理完成（同一文件的并发上传只执行一次）
+
+        Args:
+            video_path: 本地视频文件路径
+            max_wait_time: 最大等待时间（秒）
+            on_state: 上传状态回调（可选）：preprocessing / uploading / reused / PROCESSING / ACTIVE
+
+        Returns:
+            状态为 ACTIVE 的 Gemini File 对象
+        """
+        return await self._flights['upload'].do(
+            os.path.realpath(video_path),
+            lambda publish: self._upload(video_path, max_wait_time, publish),
+            on_event=on_state
+        )
+
+    async def _upload(self, video_path: str, max_wait_time: int, on_state: Callable[[str], None]):
+        print(f"☁️  开始上传视频到 Gemini API: {video_path}")
+        async with self._stage('upload'):
+            if self.analyzer.preprocessor is not None:
+                on_state('preprocessing')
+                video_path = await self._run_blocking(self.analyzer.prepare_upload, video_path)
+
+            # 相同内容的视频已上传且仍有效时直接复用
+            video_file, content_hash = await self._run_blocking(
+                self.analyzer.find_uploaded_file, video_path
+            )
+            if video_file is not None:
+                on_state('reused')
+                return video_file
+            on_state('uploading')
+            video_file, backend = await self._run_blocking(self.analyzer.gemini_pool.upload, video_path)
+        print(f"✅ 视频上传成功，文件名: {video_file.name}")
+        on_state(video_file.state.name)
+
+        # 由共享等待器轮询状态，这里只挂起协程
+        video_file = await self.file_waiter.wait_async(
+            video_file, timeout=max_wait_time, kind='video', get_file=backend.get_file
+        )
+        await self._run_blocking(
+            self.analyzer.file_registry.register, backend.namespace, content_hash, video_file
+        )
+
+        print(f"✅ 视频处理完成，状态: {video_file.state.name}")
+        on_state(video_file.state.name)
+        return video_file
+
+    async def generate(
+        self,
+        video_file,
+        prompt: Optional[str] = None,
+        on_section: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict:
+        """
+        异步流式调用 Gemini 分析视频
+
+        同一文件 + Prompt 的并发请求共享一次生成，已生成的字段会回放给后加入的调用方
+
+        Args:
+            video_file: 已处理完成的 Gemini File 对象
+            prompt: 分析 Prompt（可选，默认使用 VideoAnalyzer.build_analysis_prompt）
+            on_section: 顶层字段生成完毕时的回调 (key, value)（可选）
+
+        Returns:
+            解析后的分析结果
+        """
+        prompt = prompt or self.analyzer.build_analysis_prompt()
+        key = (video_file.name, hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+        return await self._flights['generate'].do(
+            key, lambda publish: self._generate(video_file, prompt, publish), on_event=on_section
+        )
+
+    async def _generate(self, video_file, prompt: str, on_section: Callable[[str, Any], None]) -> Dict:
+        async def stream_and_parse(backend) -> Dict:
+            # 每次尝试使用新的解析器；中途断开重试时已产出的字段会再次回调
+            parser = StreamingJSONParser()
+            response = await backend.generate_async([video_file, prompt], stream=True)
+            async for key, value in aiter_sections(response, parser):
+                on_section(key, value)
+            return parser.result()
+
+        async with self._stage('generate'):
+            try:
+                return await self.analyzer.gemini_pool.call_async(stream_and_parse, file=video_file)
+            except JSONStreamError as e:
+                print(f"⚠️  JSON 解析失败，原始响应: {e.text[:200]}")
+                raise
+
+    async def generate_from_keyframes(
+        self,
+        video_path: str,
+        keyframes: KeyframeSet,
+        transcript: Optional[list] = None,
+        on_section: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict:
+        """
+        关键帧模式：关键帧 + 转录一次流式发送给 Gemini（不上传视频文件）
+
+        同一视频的并发请求共享一次生成
+
+        Args:
+            video_path: 本地视频文件路径（用于合并并发请求）
+            keyframes: 关键帧采样结果
+            transcript: 转录结果（可选）
+            on_section: 顶层字段生成完毕时的回调 (key, value)（可选）
+
+        Returns:
+            解析后的分析结果
+        """
+        contents = self.analyzer.build_keyframe_contents(keyframes, transcript)
+        key = ('keyframes', os.path.realpath(video_path), hashlib.sha256(contents[0].encode('utf-8')).hexdigest())
+        return await self._flights['generate'].do(
+            key, lambda publish: self._generate_contents(contents, publish), on_event=on_section
+        )
+
+    async def _generate_contents(self, contents: list, on_section: Callable[[str, Any], None]) -> Dict:
+        async def stream_and_parse(backend) -> Dict:
+            parser = StreamingJSONParser()
+            response = await backend.generate_async(contents, stream=True)
+            async for key, value in aiter_sections(response, parser):
+                on_section(key, value)
+            return parser.result()
+
+        async with self._stage('generate'):
+            try:
+                return await self.analyzer.gemini_pool.call_async(stream_and_parse)
+            except JSONStreamError as e:
+                print(f"⚠️  JSON 解析失败，原始响应: {e.text[:200]}")
+                raise
+
+    async def _analyze_keyframes(
+        self,
+        video_path: str,
+        emit: Callable[[str, Dict], None],
+        on_section: Callable[[str, Any], None],
+        transcribe: bool
+    ):
+        """关键帧模式：采样关键帧与转录并行，完成后一次生成；返回 (分析结果, 转录)"""
+        async def sample() -> KeyframeSet:
+            # 关键帧采样代替上传，占用 upload 阶段的并发名额
+            async with self._stage('upload'):
+                return await self._run_blocking(sample_keyframes, video_path)
+
+        keyframes, transcript = await asyncio.gather(
+            self._tracked('keyframes', emit, sample()),
+            self._tracked('transcribe', emit, self._transcribe(
+                video_path, emit if transcribe else (lambda event, data: None)
+            ))
+        )
+        analysis_result = await self._tracked(
+            'generate', emit, self.generate_from_keyframes(video_path, keyframes, transcript, on_section)
+        )
+        return analysis_result, transcript
+
+    async def run(
+        self,
+        video_url: str,
+        cleanup: bool = True,
+        metadata: Optional[Union[Dict, Awaitable[Optional[Dict]]]] = None,
+        on_section: Optional[Callable[[str, Any], None]] = None,
+        on_event: Optional[Callable[[str, Dict], None]] = None,
+        transcribe: bool = False
+    ) -> Dict:
+        """
+        执行完整流程
+
+        Args:
+            video_url: 视频 URL
+            cleanup: 是否在分析后删除本地视频文件，默认 True（合并下载时由最后一个结束的调用方删除）
+            metadata: 已获取（或正在批量获取）的元数据（可选），提供时跳过单独的 Apify 调用；
+                      可等待对象的结果为 None 时回退为单独获取
+            on_section: 分析结果顶层字段生成完毕时的回调 (key, value)（可选）
+            on_event: 进度事件回调 (event, data)（可选），可能在线程池中调用，需线程安全。事件：
+                      stage {'stage', 'status'} / metadata {...} /
+                      download {'status', 'downloaded_bytes', 'total_bytes'} / upload {'state'} /
+                      transcript {'segments'} / features {...} / analysis_section {'key', 'value'} /
+                      duplicate {'video_url', 'frame_similarity', 'audio_bit_error_rate'}（命中近似重复视频，
+                      跳过上传和生成，直接返回已有分析结果）
+            transcribe: 是否同时转录语音（与上传、分析并行），默认 False；
+                        关键帧模式（analyzer.analysis_mode == 'keyframes'）总是转录，
+                        以 keyframes 阶段代替 upload 阶段
+
+        Returns:
+            {'metadata': {...}, 'analysis': {...}}，transcribe=True 时附带 'transcript': [...]
+        """
+        print(f"🚀 [async] 开始分析: {video_url}")
+        start_time = time.time()
+        emit = on_event or (lambda event, data: None)
+
+        def section_callback(key, value):
+            if on_section:
+                on_section(key, value)
+            emit('analysis_section', {'key': key, 'value': value})
+
+        video_id = extract_video_id(video_url)
+        self._retain_video(video_id, cleanup)
+        metadata_task = asyncio.ensure_future(
+            self._tracked('metadata', emit, self._resolve_metadata(video_url, metadata))
+        )
+        download_task = asyncio.ensure_future(
+            self._tracked('download', emit, self.download(video_url, self._download_progress(emit)))
+        )
+        video_path = None
+        features_task = None
+
+        try:
+            # 元数据与下载并发执行，任一失败立即取消另一个
+            video_data, video_path = await asyncio.gather(metadata_task, download_task)
+            emit('metadata', video_data)
+            fingerprint, duplicate = await self._find_duplicate(video_url, video_path, emit)
+            if duplicate is not None:
+                # 近似重复视频：复用已有分析结果，跳过本地信号、上传和生成
+                analysis_result = duplicate.annotated_analysis()
+                transcript = await self._transcribe(video_path, emit) if transcribe else None
+            else:
+                if self.analyzer.feature_extractor is not None:
+                    features_task = asyncio.ensure_future(
+                        self._tracked('features', emit, self._features(video_path, emit))
+                    )
+                if self.analyzer.analysis_mode == 'keyframes':
+                    analysis_result, transcript = await self._analyze_keyframes(
+                        video_path, emit, section_callback, transcribe
+                    )
+                    features = await features_task if features_task else None
+                else:
+                    analysis_result, transcript = await self._analyze_video(
+                        video_path, emit, section_callback, transcribe, features_task
+                    )
+                    features = features_task.result() if features_task else None
+                apply_local_features(analysis_result, features)
+                if fingerprint is not None:
+                    await self._run_blocking(self.analyzer.remember_analysis, video_url, fingerprint, analysis_result)
+        except BaseException:
+            for task in (metadata_task, download_task, features_task):
+                if task:
+                    task.cancel()
+            if download_task.done() and not download_task.cancelled() and not download_task.exception():
+                video_path = download_task.result()
+            raise
+        finally:
+            self._release_video(video_id, video_path)
+
+        if self.analyzer.search_index is not None:
+            await self._run_blocking(self.analyzer.index_analysis, video_url, analysis_result, transcript)
+        if self.store is not None:
+            self.store.append(video_url, analysis_result, video_data, transcript, source='pipeline')
+
+        print(f"✅ [async] 分析完成，耗时 {time.time() - start_time:.1f} 秒")
+        result = {'metadata': video_data, 'analysis': analysis_result}
+        if transcribe:
+            result['transcript'] = transcript
+        return result
+
+    async def _analyze_video(
+        self,
+        video_path: str,
+        emit: Callable[[str, Dict], None],
+        on_section: Callable[[str, Any], None],
+        transcribe: bool,
+        features_task: Optional[asyncio.Future]
+    ):
+        """完整视频模式：上传与转录、本地信号并行，生成前等待本地信号写入 Prompt；返回 (分析结果, 转录)"""
+        transcript_task = None
+        try:
+            if transcribe:
+                transcript_task = asyncio.ensure_future(self._tracked(
+                    'transcribe', emit, self._transcribe(video_path, emit)
+                ))
+            video_file = await self._tracked(
+                'upload', emit, self.upload(video_path, on_state=lambda state: emit('upload', {'state': state}))
+            )
+            prompt = self.analyzer.build_analysis_prompt(await features_task if features_task else None)
+            analysis_result = await self._tracked(
+                'generate', emit, self.generate(video_file, prompt=prompt, on_section=on_section)
+            )
+            transcript = await transcript_task if transcript_task else None
+        except BaseException:
+            if transcript_task:
+                transcript_task.cancel()
+            raise
+        return analysis_result, transcript
+
+    @staticmethod
+    async def _tracked(stage: str, emit: Callable[[str, Dict], None], coro: Awaitable) -> Any:
+        """执行一个阶段并发出 started / completed 事件"""
+        emit('stage', {'stage': stage, 'status': 'started'})
+        result = await coro
+        emit('stage', {'stage': stage, 'status': 'completed'})
+        return result
+
+    @staticmethod
+    def _download_progress(emit: Callable[[str, Dict], None], interval: float = 0.5) -> Callable[[Dict], None]:
+        """把 yt-dlp 进度回调转换为 download 事件（按 interval 秒节流）"""
+        last_emit = [0.0]
+
+        def hook(progress: Dict):
+            status = progress.get('status')
+            now = time.time()
+            if status == 'downloading' and now - last_emit[0] < interval:
+                return
+            last_emit[0] = now
+            emit('download', {
+                'status': status,
+                'downloaded_bytes': progress.get('downloaded_bytes'),
+                'total_bytes': progress.get('total_bytes') or progress.get('total_bytes_estimate'),
+            })
+        return hook
+
+    async def _find_duplicate(self, video_url: str, video_path: str, emit: Callable[[str, Dict], None]):
+        """计算视频指纹并查找近似重复的已分析视频，命中时发出 duplicate 事件；返回 (指纹, 匹配)"""
+        if self.analyzer.duplicate_index is None:
+            return None, None
+        fingerprint, match = await self._tracked('dedup', emit, self._run_blocking(
+            self.analyzer.find_near_duplicate, video_url, video_path
+        ))
+        if match is not None:
+            emit('duplicate', match.annotated_analysis()['near_duplicate_of'])
+        return fingerprint, match
+
+    async def _transcribe(self, video_path: str, emit: Callable[[str, Dict], None]) -> list:
+        """转录语音，每个音频块完成时发出 transcript 事件；失败时返回空列表，不影响分析结果"""
+        try:
+            return await self._flights['transcribe'].do(
+                os.path.realpath(video_path),
+                lambda publish: self._run_blocking(
+                    self.analyzer.transcribe_video, video_path, on_segments=publish
+                ),
+                on_event=lambda segments: emit('transcript', {'segments': segments})
+            )
+        except Exception as e:
+            print(f"⚠️ 转录失败: {e}")
+            return []
+
+    async def _features(self, video_path: str, emit: Callable[[str, Dict], None]) -> Optional[Dict]:
+        """在进程池中计算本地信号并发出 features 事件；失败时返回 None，不影响分析结果"""
+        extractor = self.analyzer.feature_extractor
+        try:
+            features = await self._flights['features'].do(
+                os.path.realpath(video_path), lambda publish: asyncio.wrap_future(extractor.submit(video_path))
+            )
+        except Exception as e:
+            print(f"⚠️ 本地信号提取失败: {e}")
+            return None
+        emit('features', features)
+        return features
+
+    def coalescing_stats(self) -> Dict:
+        """
+        各阶段的请求合并统计
+
+        Returns:
+            {stage: {'calls', 'executions', 'saved', 'in_flight'}, 'total_saved': n}
+        """
+        stats = {name: flight.stats() for name, flight in self._flights.items()}
+        stats['total_saved'] = sum(s['saved'] for s in stats.values())
+        return stats
+
+    async def _resolve_metadata(self, video_url: str, metadata) -> Dict:
+        """使用预取的元数据，缺失时单独调用 Apify"""
+        if metadata is not None and not isinstance(metadata, dict):
+            metadata = await metadata
+        if metadata is None:
+            metadata = await self.fetch_metadata(video_url)
+        return metadata
+
+    def close(self):
+        """关闭自建的线程池，写入存储中尚未写入的报告"""
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+        if self.store is not None:
+            self.store.flush()
@@ -0,0 +1,479 @@
+"""
+Rate Limiter
+令牌桶限流（按用户 Token 和按上游 API）与持久化的月度配额计数
+"""
+
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from .paths import get_data_dir
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    按 rate_per_second 匀速补充令牌，最多积累 capacity 个；每次操作 O(1)
+    """
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at', '_lock')
+
+    def __init__(self, rate_per_second: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate_per_second: 每秒补充的令牌数
+            capacity: 桶容量（允许的突发量），默认等于一分钟的令牌数
+        """
+        self.rate = rate_per_second
+        self.capacity = capacity if capacity is not None else max(rate_per_second * 60, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> Tuple[bool, float]:
+        """
+        尝试取出令牌（不等待）
+
+        Returns:
+            (是否成功, 失败时需要等待的秒数)
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True, 0.0
+            return False, (tokens - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """
+        取出令牌，不足时阻塞等待
+
+        Args:
+            tokens: 令牌数
+            timeout: 最长等待时间（秒，可选）
+
+        Returns:
+            是否在超时前取得令牌
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ok, wait = self.try_acquire(tokens)
+            if ok:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """acquire 的异步版本（等待时不占用线程）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            ok, wait = self.try_acquire(tokens)
+            if ok:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    """
+    按键（例如用户 Token）分配令牌桶的限流器
+
+    桶在首次访问时创建；速率变化时重建该键的桶
+    """
+
+    def __init__(self, burst_seconds: float = 60):
+        """
+        Args:
+            burst_seconds: 桶容量对应的秒数（默认 60，即允许一分钟的额度一次性用完）
+        """
+        self.burst_seconds = burst_seconds
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, key: str, rate_per_minute: float) -> Tuple[bool, float]:
+        """
+        消耗 key 的一个令牌
+
+        Args:
+            key: 限流键
+            rate_per_minute: 每分钟允许的请求数
+
+        Returns:
+            (是否允许, 被拒绝时的建议重试秒数)
+        """
+        bucket = self._buckets.get(key)
+        rate = rate_per_minute / 60.0
+        if bucket is None or bucket.rate != rate:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None or bucket.rate != rate:
+                    bucket = self._buckets[key] = TokenBucket(
+                        rate, capacity=max(rate * self.burst_seconds, 1)
+                    )
+
+        ok, retry_after = bucket.try_acquire()
+        if ok:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return ok, retry_after
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'keys', 'allowed', 'rejected'}
+        """
+        return {'keys': len(self._buckets), 'allowed': self.allowed, 'rejected': self.rejected}
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    跨进程共享的令牌桶：令牌数保存在 SQLite 的一行中，取令牌是一条原子 UPDATE
+
+    API 进程与任务工作进程打开同一个数据库文件，共用同一份预算；
+    按墙上时钟补充令牌（各进程的 monotonic 时钟不可比），时钟回拨时不补充
+    """
+
+    __slots__ = ('name', '_conn', '_db_lock')
+
+    def __init__(self, name: str, conn: sqlite3.Connection, db_lock: threading.Lock,
+                 rate_per_second: float, capacity: Optional[float] = None):
+        """
+        Args:
+            name: 桶名称（数据库中的主键）
+            conn: 共享的 SQLite 连接（autocommit）
+            db_lock: 保护 conn 的锁
+            rate_per_second: 每秒补充的令牌数
+            capacity: 桶容量
+        """
+        super().__init__(rate_per_second, capacity)
+        self.name = name
+        self._conn = conn
+        self._db_lock = db_lock
+        with self._db_lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO upstream_buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                (name, self.capacity, time.time())
+            )
+
+    def try_acquire(self, tokens: float = 1) -> Tuple[bool, float]:
+        """
+        尝试取出令牌（不等待）
+
+        Returns:
+            (是否成功, 失败时需要等待的秒数)
+        """
+        available = 'MIN(:capacity, tokens + MAX(:now - updated_at, 0) * :rate)'
+        params = {'capacity': self.capacity, 'now': time.time(), 'rate': self.rate,
+                  'tokens': tokens, 'name': self.name}
+        with self._db_lock:
+            cursor = self._conn.execute(
+                f'UPDATE upstream_buckets SET tokens = {available} - :tokens, '
+                f'updated_at = MAX(updated_at, :now) WHERE name = :name AND {available} >= :tokens',
+                params
+            )
+            if cursor.rowcount == 1:
+                return True, 0.0
+            row = self._conn.execute(
+                f'SELECT {available} FROM upstream_buckets WHERE name = :name', params
+            ).fetchone()
+        return False, (tokens - row[0]) / self.rate if self.rate > 0 else float('inf')
+
+    def available(self) -> float:
+        """当前可用令牌数（读取共享状态）"""
+        with self._db_lock:
+            row = self._conn.execute(
+                'SELECT MIN(?, tokens + MAX(? - updated_at, 0) * ?) FROM upstream_buckets WHERE name = ?',
+                (self.capacity, time.time(), self.rate, self.name)
+            ).fetchone()
+        return row[0]
+
+
+# 上游 API 的调用预算（每分钟请求数），未配置或为 0 时不限制
+UPSTREAM_RATE_ENV = {
+    'gemini': 'GEMINI_RPM',
+    'apify': 'APIFY_RPM',
+    'whisper': 'WHISPER_RPM',
+}
+
+
+class UpstreamLimiter:
+    """
+    上游 API 令牌桶（Gemini / Apify / Whisper）
+
+    所有用户的请求共享同一预算，超出时排队等待而不是直接失败；
+    'gemini#<key>' 形式的名称按 'gemini' 的速率为每个 API Key 单独建桶。
+    令牌数保存在 SQLite 中（SharedTokenBucket），API 进程与任务工作进程共用同一份预算，
+    GEMINI_RPM 等是整个部署（同一数据目录下所有进程）的总预算
+    """
+
+    def __init__(self, rates_per_minute: Optional[Dict[str, float]] = None, db_path: Optional[str] = None):
+        """
+        Args:
+            rates_per_minute: 各上游每分钟请求数（可选，默认读取 GEMINI_RPM / APIFY_RPM / WHISPER_RPM）
+            db_path: 共享令牌桶的 SQLite 文件路径（可选，默认存放在本地数据目录）
+        """
+        if rates_per_minute is None:
+            rates_per_minute = {
+                name: float(os.getenv(env, '0') or 0) for name, env in UPSTREAM_RATE_ENV.items()
+            }
+        self._rates = {name: rate for name, rate in rates_per_minute.items() if rate and rate > 0}
+        self._buckets: Dict[str, SharedTokenBucket] = {}
+        self._lock = threading.Lock()
+        self.waited_seconds: Dict[str, float] = {}
+        self._conn = None
+        self._db_lock = threading.Lock()
+        if self._rates:
+            self.db_path = str(db_path or get_data_dir('ratelimit') / 'upstream.sqlite3')
+            self._conn = sqlite3.connect(
+                self.db_path, check_same_thread=False, timeout=30, isolation_level=None
+            )
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS upstream_buckets (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+        for name in self._rates:
+            self._bucket(name)
+
+    def _bucket(self, name: str) -> Optional[SharedTokenBucket]:
+        bucket = self._buckets.get(name)
+        if bucket is not None:
+            return bucket
+        rate = self._rates.get(name.split('#', 1)[0])
+        if rate is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(name)
+            if bucket is None:
+                # 上游预算不允许突发，桶容量为每秒速率（至少 1）
+                bucket = self._buckets[name] = SharedTokenBucket(
+                    name, self._conn, self._db_lock, rate / 60.0, capacity=max(rate / 60.0, 1)
+                )
+                self.waited_seconds[name] = 0.0
+            return bucket
+
+    def acquire(self, name: str, tokens: float = 1):
+        """取得一次调用名额（阻塞）；未配置限制的上游直接返回"""
+        bucket = self._bucket(name)
+        if bucket is None:
+            return
+        start = time.monotonic()
+        bucket.acquire(tokens)
+        self.waited_seconds[name] += time.monotonic() - start
+
+    async def acquire_async(self, name: str, tokens: float = 1):
+        """acquire 的异步版本"""
+        bucket = self._bucket(name)
+        if bucket is None:
+            return
+        start = time.monotonic()
+        await bucket.acquire_async(tokens)
+        self.waited_seconds[name] += time.monotonic() - start
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {name: {'rate_per_minute', 'tokens', 'waited_seconds'}}
+        """
+        return {
+            name: {
+                'rate_per_minute': bucket.rate * 60,
+                'tokens': round(bucket.available(), 2),
+                'waited_seconds': round(self.waited_seconds[name], 3),
+            }
+            for name, bucket in list(self._buckets.items())
+        }
+
+
+_upstream_limiter: Optional[UpstreamLimiter] = None
+_upstream_limiter_lock = threading.Lock()
+
+
+def get_upstream_limiter() -> UpstreamLimiter:
+    """获取上游限流器（每个进程一个实例，预算通过 SQLite 在进程间共享）"""
+    global _upstream_limiter
+    if _upstream_limiter is None:
+        with _upstream_limiter_lock:
+            if _upstream_limiter is None:
+                _upstream_limiter = UpstreamLimiter()
+    return _upstream_limiter
+
+
+def current_period() -> str:
+    """当前配额周期（自然月，YYYY-MM）"""
+    return datetime.now().strftime('%Y-%m')
+
+
+class QuotaStore:
+    """
+    月度配额计数
+
+    - 计数保存在内存中，check / consume 只加锁改内存，不访问磁盘
+    - 变更由后台线程每 flush_interval 秒以增量（used = used + ?）批量写入 SQLite（一次事务），
+      随后重新读取总数；多个进程共用同一个数据库文件时不会互相覆盖，
+      但各进程只能看到其他进程最多 flush_interval 秒前的用量，并发扣除时可能略微超出上限
+    - 进程重启后从 SQLite 恢复；按自然月分周期，新的月份自动从 0 开始
+    """
+
+    def __init__(self, db_path: Optional[str] = None, flush_interval: float = 1.0):
+        """
+        Args:
+            db_path: SQLite 文件路径（可选，默认存放在本地数据目录）
+            flush_interval: 批量写入间隔（秒）
+        """
+        self.db_path = str(db_path or get_data_dir('quota') / 'quota.sqlite3')
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS quota_usage (
+                username TEXT NOT NULL,
+                period TEXT NOT NULL,
+                used INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (username, period)
+            )
+        """)
+        self._conn.commit()
+
+        self._period = current_period()
+        self._used: Dict[str, int] = {}
+        # 尚未写入 SQLite 的增量（退还为负数）
+        self._pending: Dict[str, int] = {}
+        self._reload_locked()
+
+        self._stop_event = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_loop, name='quota-flush', daemon=True)
+        self._flush_thread.start()
+
+    def _roll_period(self):
+        """进入新的月份时清空计数（调用方持有 _lock）"""
+        period = current_period()
+        if period != self._period:
+            self._flush_locked()
+            self._period = period
+            self._reload_locked()
+
+    def used(self, username: str) -> int:
+        """本月已用次数"""
+        with self._lock:
+            self._roll_period()
+            return self._used.get(username, 0)
+
+    def try_consume(self, username: str, limit: int, amount: int = 1) -> bool:
+        """
+        在不超过 limit 的前提下扣除配额（检查与扣除是原子的）
+
+        Returns:
+            是否扣除成功
+        """
+        with self._lock:
+            self._roll_period()
+            used = self._used.get(username, 0)
+            if used + amount > limit:
+                return False
+            self._add_locked(username, amount)
+            return True
+
+    def consume(self, username: str, amount: int = 1) -> int:
+        """
+        无条件扣除配额（已预先检查过的场景，例如批量任务逐条扣除）
+
+        Returns:
+            扣除后的已用次数
+        """
+        with self._lock:
+            self._roll_period()
+            return self._add_locked(username, amount)
+
+    def refund(self, username: str, amount: int = 1):
+        """退还配额（预扣后分析失败时调用）"""
+        with self._lock:
+            self._roll_period()
+            self._add_locked(username, -min(amount, self._used.get(username, 0)))
+
+    def _add_locked(self, username: str, amount: int) -> int:
+        """修改内存计数并记录增量（调用方持有 _lock）"""
+        used = self._used[username] = self._used.get(username, 0) + amount
+        self._pending[username] = self._pending.get(username, 0) + amount
+        return used
+
+    def _reload_locked(self):
+        """从 SQLite 读取本周期的总数（包含其他进程写入的用量），再叠加未写入的增量（调用方持有 _lock）"""
+        with self._db_lock:
+            rows = self._conn.execute(
+                'SELECT username, used FROM quota_usage WHERE period = ?', (self._period,)
+            ).fetchall()
+        self._used = dict(rows)
+        for name, delta in self._pending.items():
+            self._used[name] = max(self._used.get(name, 0) + delta, 0)
+
+    def _flush_locked(self) -> int:
+        """把增量写入 SQLite 并刷新总数（调用方持有 _lock）"""
+        now = time.time()
+        rows = [(name, self._period, delta, now) for name, delta in self._pending.items() if delta]
+        self._pending = {}
+        if rows:
+            with self._db_lock:
+                self._conn.executemany(
+                    'INSERT INTO quota_usage (username, period, used, updated_at) VALUES (?1, ?2, MAX(?3, 0), ?4) '
+                    'ON CONFLICT(username, period) DO UPDATE SET '
+                    'used = MAX(used + ?3, 0), updated_at = ?4',
+                    rows
+                )
+                self._conn.commit()
+        self._reload_locked()
+        return len(rows)
+
+    def flush(self) -> int:
+        """
+        立即写入所有变更（并读取其他进程写入的用量）
+
+        Returns:
+            写入的行数
+        """
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ 配额写入失败: {e}")
+
+    def close(self):
+        """停止后台线程并写入剩余变更"""
+        self._stop_event.set()
+        self._flush_thread.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
@@ -0,0 +1,221 @@
+"""
+Remote File Registry
+记录已上传到 Gemini 的文件（按本地文件内容哈希），在服务端有效期内复用，跳过重复上传
+"""
+
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from .paths import get_data_dir
+
+
+# Gemini 文件默认保留 48 小时
+DEFAULT_FILE_TTL_SECONDS = 48 * 3600
+
+# 距离过期不足该时间的句柄不再复用，避免分析过程中文件被服务端删除
+EXPIRY_SAFETY_MARGIN_SECONDS = 3600
+
+
+def file_content_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    计算本地文件内容的 SHA-256
+
+    Args:
+        file_path: 文件路径
+        chunk_size: 分块读取大小（字节）
+
+    Returns:
+        十六进制哈希
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def credentials_namespace(api_key: Optional[str], api_base: Optional[str]) -> str:
+    """
+    计算凭证命名空间：Gemini 文件只能被上传它的 API Key / 项目访问
+
+    Args:
+        api_key: Gemini API Key
+        api_base: 自定义 API Base URL
+
+    Returns:
+        16 位十六进制命名空间（不包含明文 Key）
+    """
+    payload = f"{api_key or ''}|{api_base or ''}".encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def _expiration_timestamp(file) -> float:
+    """读取 File 对象的过期时间，缺失时按默认保留时长估算"""
+    expiration = getattr(file, 'expiration_time', None)
+    if isinstance(expiration, datetime):
+        return expiration.timestamp()
+    return time.time() + DEFAULT_FILE_TTL_SECONDS
+
+
+class RemoteFileRegistry:
+    """
+    Gemini 远程文件登记表（SQLite）
+
+    content_hash + 凭证命名空间 -> Gemini 文件名 / URI / 过期时间
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        初始化登记表
+
+        Args:
+            db_path: SQLite 文件路径（可选，默认存放在本地数据目录）
+        """
+        self.db_path = str(db_path or get_data_dir('cache') / 'remote_files.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS remote_files (
+                namespace TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                uri TEXT,
+                mime_type TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, content_hash)
+            )
+        """)
+        self._conn.commit()
+
+        self._cleanup_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, namespace: str, content_hash: str) -> Optional[Dict]:
+        """
+        查询仍在有效期内的远程文件
+
+        Returns:
+            {'file_name', 'uri', 'mime_type', 'expires_at'}，不存在或即将过期时返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT file_name, uri, mime_type, expires_at FROM remote_files '
+                'WHERE namespace = ? AND content_hash = ? AND expires_at > ?',
+                (namespace, content_hash, time.time() + EXPIRY_SAFETY_MARGIN_SECONDS)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        file_name, uri, mime_type, expires_at = row
+        return {'file_name': file_name, 'uri': uri, 'mime_type': mime_type, 'expires_at': expires_at}
+
+    def register(self, namespace: str, content_hash: str, file):
+        """
+        登记一个已处理完成（ACTIVE）的远程文件
+
+        Args:
+            namespace: 凭证命名空间
+            content_hash: 本地文件内容哈希
+            file: genai File 对象
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO remote_files '
+                '(namespace, content_hash, file_name, uri, mime_type, created_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    namespace, content_hash, file.name,
+                    getattr(file, 'uri', None), getattr(file, 'mime_type', None),
+                    time.time(), _expiration_timestamp(file)
+                )
+            )
+            self._conn.commit()
+
+    def forget(self, namespace: str, content_hash: str):
+        """删除登记（远程文件已失效时调用）"""
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM remote_files WHERE namespace = ? AND content_hash = ?',
+                (namespace, content_hash)
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """
+        删除已过期的登记
+
+        Returns:
+            删除的条目数
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM remote_files WHERE expires_at <= ?', (time.time(),)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def start_background_cleanup(self, interval_seconds: float = 600):
+        """
+        启动后台清理线程，定期删除过期登记（重复调用无副作用）
+
+        Args:
+            interval_seconds: 清理间隔（秒）
+        """
+        if self._cleanup_thread is not None and self._cleanup_thread.is_alive():
+            return
+
+        def _loop():
+            while not self._stop_event.wait(interval_seconds):
+                try:
+                    removed = self.purge_expired()
+                    if removed:
+                        print(f"🧹 已清理 {removed} 个过期的 Gemini 文件登记")
+                except Exception as e:
+                    print(f"⚠️ 清理 Gemini 文件登记失败: {e}")
+
+        self._stop_event.clear()
+        self._cleanup_thread = threading.Thread(
+            target=_loop, name='remote-file-registry-cleanup', daemon=True
+        )
+        self._cleanup_thread.start()
+
+    def stop_background_cleanup(self):
+        """停止后台清理线程"""
+        self._stop_event.set()
+
+    def stats(self) -> Dict:
+        """
+        登记表统计
+
+        Returns:
+            {'entries', 'hits', 'misses'}
+        """
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM remote_files').fetchone()[0]
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+
+_default_registry: Optional[RemoteFileRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_remote_file_registry() -> RemoteFileRegistry:
+    """
+    获取进程内共享的远程文件登记表（首次调用时启动后台清理线程）
+    """
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = RemoteFileRegistry()
+                _default_registry.start_background_cleanup()
+    return _default_registry
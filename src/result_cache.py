@@ -0,0 +1,486 @@
+"""
+Analysis Result Cache
+按「视频 ID + Prompt 哈希 + 模型名」缓存分析结果，避免重复下载、上传和分析
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Any
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from .paths import get_data_dir
+from .prompts import VIDEO_ANALYSIS_SYSTEM_PROMPT
+
+
+# 各平台视频 URL 中的视频 ID 规则
+_VIDEO_ID_PATTERNS = [
+    ('tiktok', re.compile(r'tiktok\.com/(?:@[^/]+/)?(?:video|photo|v)/(\d+)')),
+    ('youtube', re.compile(r'youtube\.com/shorts/([\w-]{11})')),
+    ('youtube', re.compile(r'youtube\.com/(?:watch\?(?:.*&)?v=|embed/|live/)([\w-]{11})')),
+    ('youtube', re.compile(r'youtu\.be/([\w-]{11})')),
+    ('instagram', re.compile(r'instagram\.com/(?:[^/]+/)?(?:reels?|p|tv)/([\w-]+)')),
+]
+
+
+def normalize_url(url: str) -> str:
+    """
+    规范化 URL：小写域名、去掉 www.、锚点和末尾斜杠，查询参数排序
+
+    Args:
+        url: 原始 URL
+
+    Returns:
+        规范化后的 URL
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    normalized = f"{parts.scheme.lower() or 'https'}://{host}{path}"
+    if query:
+        normalized += f"?{query}"
+    return normalized
+
+
+def extract_video_id(url: str) -> str:
+    """
+    从 URL 中提取平台无关的规范视频 ID
+
+    支持 TikTok / YouTube Shorts / Instagram Reels，
+    无法识别的 URL（例如 CDN 直链）使用规范化 URL 的哈希
+
+    Args:
+        url: 视频 URL
+
+    Returns:
+        规范视频 ID，例如 'tiktok:7588608011745250591'
+    """
+    for platform, pattern in _VIDEO_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return f"{platform}:{match.group(1)}"
+
+    digest = hashlib.sha256(normalize_url(url).encode('utf-8')).hexdigest()[:20]
+    return f"url:{digest}"
+
+
+def prompt_fingerprint(system_prompt: str, model_name: str, analysis_mode: str = 'video') -> str:
+    """
+    计算 Prompt + 模型名（+ 分析模式）的指纹，Prompt、模型或分析模式变更后旧缓存自动失效
+
+    Args:
+        system_prompt: 系统提示词
+        model_name: Gemini 模型名
+        analysis_mode: 分析模式（video 模式的指纹与不区分模式时相同）
+
+    Returns:
+        16 位十六进制指纹
+    """
+    if analysis_mode != 'video':
+        model_name = f"{model_name}#{analysis_mode}"
+    payload = f"{model_name}\n{system_prompt}".encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+class CacheBackend:
+    """
+    缓存存储后端基类
+
+    子类需要实现 get / set / delete / clear / purge_expired / __len__
+    """
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    SQLite 缓存后端（默认）
+
+    单文件存储，适合多进程共享；按最近访问时间做 LRU 淘汰
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 5000):
+        super().__init__(max_entries)
+        self.db_path = str(db_path or get_data_dir('cache') / 'analysis_cache.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                expires_at REAL
+            )
+        """)
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_analysis_cache_accessed ON analysis_cache (accessed_at)'
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM analysis_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute('DELETE FROM analysis_cache WHERE key = ?', (key,))
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                'UPDATE analysis_cache SET accessed_at = ? WHERE key = ?', (now, key)
+            )
+            self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds else None
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO analysis_cache (key, value, created_at, accessed_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, payload, now, now, expires_at)
+            )
+            self._evict_locked()
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM analysis_cache WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM analysis_cache')
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM analysis_cache WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                (time.time(),)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _evict_locked(self):
+        """超出容量时删除最久未访问的条目（调用方需持有锁）"""
+        count = self._conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                'DELETE FROM analysis_cache WHERE key IN ('
+                'SELECT key FROM analysis_cache ORDER BY accessed_at ASC LIMIT ?)',
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM analysis_cache').fetchone()[0]
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    文件系统缓存后端
+
+    每个条目一个 JSON 文件，文件 mtime 记录最近访问时间用于 LRU 淘汰
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 5000):
+        super().__init__(max_entries)
+        self.cache_dir = Path(cache_dir) if cache_dir else get_data_dir('cache') / 'analysis'
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path_for(self, key: str) -> Path:
+        filename = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self.cache_dir / f"{filename}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path_for(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        expires_at = entry.get('expires_at')
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return None
+
+        # 刷新 mtime 作为访问时间
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        return entry.get('value')
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        now = time.time()
+        entry = {
+            'key': key,
+            'value': value,
+            'created_at': now,
+            'expires_at': now + ttl_seconds if ttl_seconds else None,
+        }
+        path = self._path_for(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        # 原子替换，避免并发读到写了一半的文件
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._evict_locked()
+
+    def delete(self, key: str):
+        try:
+            self._path_for(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self) -> int:
+        removed = 0
+        now = time.time()
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    expires_at = json.load(f).get('expires_at')
+                if expires_at is not None and expires_at <= now:
+                    path.unlink()
+                    removed += 1
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return removed
+
+    def _evict_locked(self):
+        """超出容量时删除 mtime 最早的文件（调用方需持有锁）"""
+        files = list(self.cache_dir.glob('*.json'))
+        overflow = len(files) - self.max_entries
+        if overflow <= 0:
+            return
+
+        def _mtime(p: Path) -> float:
+            try:
+                return p.stat().st_mtime
+            except FileNotFoundError:
+                return 0.0
+
+        for path in sorted(files, key=_mtime)[:overflow]:
+            try:
+                path.unlink()
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.cache_dir.glob('*.json'))
+
+
+def create_cache_backend(kind: Optional[str] = None, location: Optional[str] = None,
+                         max_entries: Optional[int] = None) -> CacheBackend:
+    """
+    按名称创建缓存后端
+
+    Args:
+        kind: 'sqlite' 或 'file'，默认读取环境变量 ANALYSIS_CACHE_BACKEND（默认 sqlite）
+        location: SQLite 文件路径或缓存目录，默认读取 ANALYSIS_CACHE_PATH
+        max_entries: 最大条目数，默认读取 ANALYSIS_CACHE_MAX_ENTRIES（默认 5000）
+
+    Returns:
+        CacheBackend 实例
+    """
+    kind = (kind or os.getenv('ANALYSIS_CACHE_BACKEND', 'sqlite')).lower()
+    location = location or os.getenv('ANALYSIS_CACHE_PATH') or None
+    max_entries = max_entries or int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '5000'))
+
+    if kind == 'sqlite':
+        return SQLiteCacheBackend(location, max_entries=max_entries)
+    if kind == 'file':
+        return FileCacheBackend(location, max_entries=max_entries)
+    raise ValueError(f"未知的缓存后端: {kind}（可选: sqlite / file）")
+
+
+class AnalysisCache:
+    """
+    视频分析结果缓存
+
+    缓存键 = 结果类型 + 规范视频 ID + Prompt/模型/分析模式指纹，
+    同一视频换了 URL 写法（带 query、短链参数等）也能命中；
+    与 VideoAnalyzer 配合使用时用 for_analyzer 创建，保证指纹与分析器实际使用的模式一致
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        system_prompt: str = VIDEO_ANALYSIS_SYSTEM_PROMPT,
+        backend: Optional[CacheBackend] = None,
+        ttl_seconds: Optional[float] = None,
+        analysis_mode: str = 'video'
+    ):
+        """
+        初始化分析结果缓存
+
+        Args:
+            model_name: Gemini 模型名（参与缓存键计算）
+            system_prompt: 系统提示词（参与缓存键计算）
+            backend: 存储后端，默认按环境变量创建
+            ttl_seconds: 过期时间（秒），默认读取 ANALYSIS_CACHE_TTL（默认 7 天，0 表示永不过期）
+            analysis_mode: 分析模式（参与缓存键计算，应与产生结果的分析器一致；video 模式的缓存键保持不变）
+        """
+        self.backend = backend if backend is not None else create_cache_backend()
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv('ANALYSIS_CACHE_TTL', str(7 * 24 * 3600)))
+        self.ttl_seconds = ttl_seconds
+        self.fingerprint = prompt_fingerprint(system_prompt, model_name, analysis_mode)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @classmethod
+    def for_analyzer(cls, analyzer, **kwargs) -> 'AnalysisCache':
+        """
+        按分析器的模型、提示词和分析模式创建缓存（指纹等于 analyzer.analysis_fingerprint）
+
+        Args:
+            analyzer: VideoAnalyzer 实例
+            **kwargs: 其他构造参数（backend / ttl_seconds）
+
+        Returns:
+            AnalysisCache 实例
+        """
+        return cls(
+            model_name=analyzer.model_name,
+            system_prompt=analyzer.system_prompt,
+            analysis_mode=analyzer.analysis_mode,
+            **kwargs
+        )
+
+    def make_key(self, video_url: str, kind: str = 'analysis') -> str:
+        """
+        计算缓存键
+
+        Args:
+            video_url: 视频 URL
+            kind: 结果类型（不同入口的结果结构不同，例如 'analysis' / 'report'）
+
+        Returns:
+            缓存键
+        """
+        return f"{kind}:{extract_video_id(video_url)}:{self.fingerprint}"
+
+    def get(self, video_url: str, kind: str = 'analysis') -> Optional[Dict]:
+        """
+        读取缓存，未命中或已过期返回 None
+        """
+        key = self.make_key(video_url, kind)
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # 缓存故障不应影响主流程
+            print(f"⚠️ 读取分析缓存失败: {e}")
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if value is not None:
+            print(f"⚡ 命中分析缓存: {key}")
+        return value
+
+    def contains(self, video_url: str, kind: str = 'analysis') -> bool:
+        """
+        判断缓存中是否存在有效条目（不计入命中统计）
+        """
+        try:
+            return self.backend.get(self.make_key(video_url, kind)) is not None
+        except Exception:
+            return False
+
+    def set(self, video_url: str, result: Dict, kind: str = 'analysis'):
+        """
+        写入缓存
+        """
+        key = self.make_key(video_url, kind)
+        try:
+            self.backend.set(key, result, ttl_seconds=self.ttl_seconds)
+        except Exception as e:
+            print(f"⚠️ 写入分析缓存失败: {e}")
+            return
+
+        with self._lock:
+            self.writes += 1
+
+    def invalidate(self, video_url: str, kind: str = 'analysis'):
+        """删除指定视频的缓存"""
+        self.backend.delete(self.make_key(video_url, kind))
+
+    def stats(self) -> Dict:
+        """
+        命中统计
+
+        Returns:
+            {'hits', 'misses', 'writes', 'evictions', 'hit_rate', 'entries'}
+        """
+        with self._lock:
+            hits, misses, writes = self.hits, self.misses, self.writes
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'writes': writes,
+            'evictions': self.backend.evictions,
+            'hit_rate': round(hits / total, 4) if total else 0.0,
+            'entries': len(self.backend),
+        }
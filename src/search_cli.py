@@ -0,0 +1,83 @@
+"""
+Search CLI
+命令行检索已分析的视频，或把已导出的分析报告（JSON / JSONL）写入检索索引
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .analysis_store import read_report_file
+from .search_index import FIELD_NAMES, SEARCH_MODES, SearchIndex
+
+
+def iter_report_records(path: str) -> Iterable[Tuple[str, Dict, Optional[List[Dict]]]]:
+    """
+    读取已导出的分析报告（JSON 或 JSONL，兼容的格式见 analysis_store.normalize_report）
+
+    Returns:
+        (video_url, analysis, transcript) 迭代器，无法识别的记录跳过
+    """
+    for report in read_report_file(path):
+        yield report['video_url'], report['analysis'], report['transcript']
+
+
+def main():
+    """
+    命令行入口
+
+    示例:
+        python -m src.search_cli add batch_results.jsonl report.json
+        python -m src.search_cli query "before after 对比" --field hook -k 5
+        python -m src.search_cli similar https://www.tiktok.com/@user/video/123 --field hook
+    """
+    parser = argparse.ArgumentParser(description='检索已分析的视频')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='索引已导出的分析报告（JSON / JSONL）')
+    add_parser.add_argument('paths', nargs='+')
+
+    for name, help_text in (('query', '按文本检索'), ('similar', '查找与某个视频相似的视频')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('text', help='查询文本' if name == 'query' else '已索引的视频 URL')
+        sub.add_argument('--field', action='append', choices=FIELD_NAMES,
+                         help='限定字段（可重复；similar 默认 hook）')
+        sub.add_argument('-k', type=int, default=10, help='返回条数（默认 10）')
+        sub.add_argument('--mode', choices=SEARCH_MODES, default='hybrid')
+
+    subparsers.add_parser('stats', help='索引统计')
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    if args.command == 'add':
+        total = 0
+        for path in args.paths:
+            count = index.add_many(iter_report_records(path))
+            print(f"✅ {path}: 索引 {count} 个视频")
+            total += count
+        print(f"🏁 共索引 {total} 个视频")
+    elif args.command == 'stats':
+        print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+    else:
+        start = time.perf_counter()
+        try:
+            if args.command == 'query':
+                results = index.search(args.text, k=args.k, fields=args.field, mode=args.mode)
+            else:
+                results = index.similar(args.text, field=(args.field or ['hook'])[0], k=args.k, mode=args.mode)
+        except (KeyError, ValueError) as e:
+            print(f"❌ {e.args[0]}")
+            sys.exit(1)
+        elapsed = (time.perf_counter() - start) * 1000
+        for rank, result in enumerate(results, start=1):
+            text = ' '.join(result['text'].split())
+            print(f"{rank:>2}. [{result['field']}] {result['video_url']}  (score {result['score']:.4f})")
+            print(f"    {text[:160]}")
+        print(f"🔎 {len(results)} 条结果，{elapsed:.1f} ms")
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
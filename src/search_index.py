@@ -0,0 +1,824 @@
+"""
+Search Index
+分析结果检索：Hook 描述、卖点、脚本模板、转录等字段分别建索引；
+NumPy 倒排表（BM25）做关键词检索，本地 CPU 向量模型 + 按字段的嵌入矩阵做相似度检索，
+两路结果按排名融合（RRF）；文档和向量持久化到 SQLite
+"""
+
+import os
+import re
+import json
+import math
+import time
+import zlib
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .paths import get_data_dir
+from .result_cache import extract_video_id
+
+
+# 索引的字段：名称 -> 分析结果中的 (section, key) 路径（多个路径的文本拼接）
+SEARCH_FIELDS: Dict[str, List[Tuple[str, str]]] = {
+    'summary': [('video_content_summary', 'what_is_this_video_about')],
+    'hook': [('structure_breakdown', 'hook_description'), ('structure_breakdown', 'hook_text_overlay')],
+    'pain_point': [('structure_breakdown', 'pain_point_addressed')],
+    'product': [('structure_breakdown', 'actual_product_shown')],
+    'selling_proposition': [('structure_breakdown', 'key_selling_proposition')],
+    'script_template': [('lazada_adaptation_brief', 'script_template')],
+    'transcript': [],
+}
+FIELD_NAMES = list(SEARCH_FIELDS)
+
+# 计算向量的字段（其余字段只做关键词检索）；每 10 万条分析、384 维 float32 约占 150 MB / 字段
+EMBEDDED_FIELDS = ('summary', 'hook', 'selling_proposition', 'script_template')
+
+# 送入向量模型的最大字符数
+MAX_EMBED_CHARS = 1000
+
+SEARCH_MODES = ('hybrid', 'keyword', 'semantic')
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 排名融合常数（Reciprocal Rank Fusion）
+RRF_K = 60
+
+_STOPWORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the this to was were with you your'.split()
+)
+# 拉丁字母（含越南语）按词切分；中日文、泰文等不以空格分词的文字按相邻两字切分
+_WORD_PATTERN = re.compile(r'[0-9a-z\u00c0-\u024f\u1e00-\u1eff]+')
+_BIGRAM_PATTERN = re.compile(r'[\u0e00-\u0e7f\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    关键词切分（小写；拉丁字母按词，CJK / 泰文按二元组）
+
+    Returns:
+        词列表（保留重复，用于计算词频）
+    """
+    text = text.lower()
+    tokens = [word for word in _WORD_PATTERN.findall(text) if word not in _STOPWORDS]
+    for run in _BIGRAM_PATTERN.findall(text):
+        tokens += [run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)]
+    return tokens
+
+
+def analysis_documents(analysis: Dict, transcript: Optional[List[Dict]] = None) -> Dict[str, str]:
+    """
+    把一份分析结果拆成按字段的文档（缺失的字段为空字符串）
+
+    Args:
+        analysis: Gemini 分析结果
+        transcript: 转录片段（可选）
+
+    Returns:
+        {字段名: 文本}，包含 FIELD_NAMES 中的全部字段
+    """
+    documents = {}
+    for field, paths in SEARCH_FIELDS.items():
+        parts = []
+        for section, key in paths:
+            value = (analysis.get(section) or {}).get(key) if isinstance(analysis, dict) else None
+            if isinstance(value, str) and value.strip() and value.strip().lower() != 'no text overlay':
+                parts.append(value.strip())
+        documents[field] = '\n'.join(parts)
+    documents['transcript'] = ' '.join(
+        segment.get('text', '').strip() for segment in transcript or [] if isinstance(segment, dict)
+    ).strip()
+    return documents
+
+
+class Embedder:
+    """向量模型接口"""
+
+    name = 'base'
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Returns:
+            float32 数组 (len(texts), dim)，每行 L2 归一化（空文本为零向量）
+        """
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    特征哈希向量（不需要模型文件）：词 / 二元组和字符 3-gram 按 crc32 带符号映射到 dim 维，
+    对数词频加权后归一化；衡量的是措辞相似度，语义相似度需使用 SentenceTransformerEmbedder
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            digest = zlib.crc32(feature.encode('utf-8'))
+            bucket = (digest % self.dim, 1.0 if digest & 0x80000000 else -1.0)
+            if len(self._buckets) > 1_000_000:
+                self._buckets.clear()
+            self._buckets[feature] = bucket
+        return bucket
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        cells, weights = [], []
+        for row, text in enumerate(texts):
+            text = text[:MAX_EMBED_CHARS].lower()
+            features = Counter(tokenize(text))
+            compact = ' '.join(text.split())
+            features.update('#' + compact[i:i + 3] for i in range(len(compact) - 2))
+            for feature, count in features.items():
+                index, sign = self._bucket(feature)
+                cells.append(row * self.dim + index)
+                weights.append(sign * (1.0 + math.log(count)))
+        vectors = np.bincount(
+            np.array(cells, dtype=np.int64), weights=weights, minlength=len(texts) * self.dim
+        ).reshape(len(texts), self.dim).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    本地多语言句向量模型（sentence-transformers，CPU）
+
+    模型在第一次调用时加载，需提前下载到本地或可访问 Hugging Face
+    """
+
+    def __init__(self, model_name: Optional[str] = None, batch_size: int = 64):
+        """
+        Args:
+            model_name: 模型名称或本地目录，默认读取 SEARCH_EMBEDDING_MODEL
+                        （默认 paraphrase-multilingual-MiniLM-L12-v2，384 维）
+            batch_size: 编码批大小
+        """
+        self.model_name = model_name or os.getenv(
+            'SEARCH_EMBEDDING_MODEL', 'paraphrase-multilingual-MiniLM-L12-v2'
+        )
+        self.name = f'st:{self.model_name}'
+        self.batch_size = batch_size
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImportError(
+                        "语义检索需要安装 sentence-transformers: pip install sentence-transformers"
+                    ) from e
+                self._model = SentenceTransformer(self.model_name, device='cpu')
+                print(f"✅ 检索向量模型已加载: {self.model_name}")
+            return self._model
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self._get_model().encode(
+            [text[:MAX_EMBED_CHARS] for text in texts],
+            batch_size=self.batch_size, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+        vectors[[not text.strip() for text in texts]] = 0.0
+        return vectors
+
+
+def get_embedder() -> Embedder:
+    """
+    按环境变量 SEARCH_EMBEDDER 选择向量模型
+
+    - hashing（默认）：特征哈希，不依赖额外的包
+    - sentence-transformers：本地句向量模型（SEARCH_EMBEDDING_MODEL）
+    """
+    kind = os.getenv('SEARCH_EMBEDDER', 'hashing').lower()
+    if kind == 'sentence-transformers':
+        return SentenceTransformerEmbedder()
+    if kind != 'hashing':
+        raise ValueError(f"未知的检索向量模型: {kind}（可选 hashing / sentence-transformers）")
+    return HashingEmbedder()
+
+
+class _GrowingArray:
+    """按容量倍增追加的 NumPy 数组（行可以是标量或定长向量）"""
+
+    def __init__(self, dtype, width: Optional[int] = None, initial: Optional[np.ndarray] = None):
+        self._shape_tail = (width,) if width else ()
+        self._data = np.zeros((1024,) + self._shape_tail, dtype=dtype)
+        self.size = 0
+        if initial is not None:
+            self.extend(initial)
+
+    def extend(self, values: np.ndarray):
+        needed = self.size + len(values)
+        if needed > len(self._data):
+            capacity = max(needed, len(self._data) * 2)
+            grown = np.zeros((capacity,) + self._shape_tail, dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:needed] = values
+        self.size = needed
+
+    @property
+    def view(self) -> np.ndarray:
+        return self._data[:self.size]
+
+
+class _InvertedIndex:
+    """
+    倒排表：主体为 CSR 数组（词 ID -> 文档位置、词频），新文档先进入增量缓冲，
+    缓冲超过 compact_threshold 条时合并（同时丢弃已删除的文档）
+    """
+
+    def __init__(self, compact_threshold: int = 200_000):
+        self.vocab: Dict[str, int] = {}
+        self.compact_threshold = compact_threshold
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.docs = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        self._pending: Dict[int, List[Tuple[int, int]]] = {}
+        self._pending_count = 0
+
+    def add(self, position: int, tokens: List[str]):
+        counts = Counter(tokens)
+        for token, count in counts.items():
+            token_id = self.vocab.setdefault(token, len(self.vocab))
+            self._pending.setdefault(token_id, []).append((position, count))
+        self._pending_count += len(counts)
+
+    def needs_compaction(self) -> bool:
+        return self._pending_count >= self.compact_threshold
+
+    def postings(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (文档位置 int32, 词频 float32)
+        """
+        token_id = self.vocab.get(token)
+        if token_id is None:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        docs, tfs = [], []
+        if token_id < len(self.offsets) - 1:
+            start, end = self.offsets[token_id], self.offsets[token_id + 1]
+            docs.append(self.docs[start:end])
+            tfs.append(self.tfs[start:end])
+        pending = self._pending.get(token_id)
+        if pending:
+            docs.append(np.array([p for p, _ in pending], dtype=np.int32))
+            tfs.append(np.array([c for _, c in pending], dtype=np.float32))
+        if len(docs) == 1:
+            return docs[0], tfs[0]
+        return np.concatenate(docs), np.concatenate(tfs)
+
+    def compact(self, alive: np.ndarray):
+        """合并增量缓冲，丢弃 alive 为 False 的文档"""
+        token_ids = [np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))]
+        docs, tfs = [self.docs], [self.tfs]
+        for token_id, items in self._pending.items():
+            token_ids.append(np.full(len(items), token_id, dtype=np.int64))
+            docs.append(np.array([p for p, _ in items], dtype=np.int32))
+            tfs.append(np.array([c for _, c in items], dtype=np.float32))
+        token_ids, docs, tfs = np.concatenate(token_ids), np.concatenate(docs), np.concatenate(tfs)
+
+        keep = alive[docs]
+        token_ids, docs, tfs = token_ids[keep], docs[keep], tfs[keep]
+        order = np.argsort(token_ids, kind='stable')
+        self.docs, self.tfs = docs[order], tfs[order]
+        counts = np.bincount(token_ids, minlength=len(self.vocab))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._pending = {}
+        self._pending_count = 0
+
+
+def _join_strings(values: List[str]) -> np.ndarray:
+    """字符串列表 -> uint8 数组（换行分隔，用于快照）"""
+    return np.frombuffer('\n'.join(values).encode('utf-8'), dtype=np.uint8)
+
+
+def _split_strings(data: np.ndarray) -> List[str]:
+    return data.tobytes().decode('utf-8').split('\n') if len(data) else []
+
+
+class SearchIndex:
+    """
+    分析结果检索索引
+
+    - 每份分析按字段拆成文档写入 SQLite（同一视频重新分析时整体替换），
+      向量按模型名分别保存，更换模型后在下一次加载时补算
+    - 内存中保存倒排表、文档长度和每个字段的嵌入矩阵；每次查询前增量加载其他进程新写入的文档
+    - 切分全部文档很慢（10 万条分析约 1 分钟），内存状态定期保存为 .npz 快照，
+      启动时加载快照后只切分快照之后写入的文档
+    - 查询：BM25 和向量余弦相似度各取候选，按 RRF 融合排名，每个视频只保留得分最高的字段
+    """
+
+    # 新加载的文档数超过该值时保存快照
+    SNAPSHOT_MIN_DOCUMENTS = 10_000
+    SNAPSHOT_VERSION = 1
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        embedder: Optional[Embedder] = None,
+        embedded_fields: Iterable[str] = EMBEDDED_FIELDS
+    ):
+        """
+        Args:
+            db_path: SQLite 文件路径（可选，默认存放在本地数据目录）
+            embedder: 向量模型（可选，默认按 SEARCH_EMBEDDER 选择）
+            embedded_fields: 计算向量的字段
+        """
+        self.db_path = str(db_path or get_data_dir('index') / 'search.sqlite3')
+        self.embedder = embedder or get_embedder()
+        self.embedded_fields = tuple(embedded_fields)
+        self.snapshot_path = f"{self.db_path}.{re.sub(r'[^A-Za-z0-9_.-]+', '_', self.embedder.name)}.npz"
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS search_documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_id TEXT NOT NULL,
+                video_url TEXT NOT NULL,
+                field TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (video_id, field)
+            );
+            CREATE TABLE IF NOT EXISTS search_vectors (
+                document_id INTEGER NOT NULL,
+                embedder TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (document_id, embedder)
+            );
+        """)
+        self._conn.commit()
+
+        # 文档位置 -> 属性
+        self._row_ids = _GrowingArray(np.int64)
+        self._fields = _GrowingArray(np.int8)
+        self._lengths = _GrowingArray(np.float32)
+        self._alive = _GrowingArray(np.bool_)
+        self._video_ids: List[str] = []
+        self._positions: Dict[Tuple[str, int], int] = {}
+        self._field_length_sum = np.zeros(len(FIELD_NAMES), dtype=np.float64)
+        self._field_count = np.zeros(len(FIELD_NAMES), dtype=np.int64)
+        # BM25 长度归一化项，文档变化后重新计算
+        self._norms: Optional[np.ndarray] = None
+
+        self._inverted = _InvertedIndex()
+        # 字段 -> (嵌入矩阵, 矩阵行 -> 文档位置)
+        self._matrices: Dict[str, Tuple[_GrowingArray, _GrowingArray]] = {}
+        self._loaded_id = 0
+        self._unsaved = 0
+        self._snapshot_checked = False
+
+        self.queries = 0
+        self.total_query_ms = 0.0
+
+    # ---- 写入 ----
+
+    def add(self, video_url: str, analysis: Dict, transcript: Optional[List[Dict]] = None):
+        """
+        索引一份分析结果（同一视频之前的文档被替换）
+
+        Args:
+            video_url: 视频 URL
+            analysis: 分析结果
+            transcript: 转录片段（可选）
+        """
+        self.add_many([(video_url, analysis, transcript)])
+
+    def add_many(self, records: Iterable[Tuple[str, Dict, Optional[List[Dict]]]]) -> int:
+        """
+        批量索引（一个事务，向量批量计算）
+
+        Args:
+            records: [(video_url, analysis, transcript)]
+
+        Returns:
+            写入的分析数
+        """
+        rows = []
+        for video_url, analysis, transcript in records:
+            video_id = extract_video_id(video_url)
+            for field, text in analysis_documents(analysis, transcript).items():
+                rows.append((video_id, video_url, field, text))
+        if not rows:
+            return 0
+
+        embed_rows = [i for i, row in enumerate(rows) if row[2] in self.embedded_fields and row[3]]
+        vectors = self.embedder.embed([rows[i][3] for i in embed_rows]) if embed_rows else None
+
+        now = time.time()
+        video_ids = sorted({row[0] for row in rows})
+        with self._lock:
+            with self._conn:
+                for video_id in video_ids:
+                    self._conn.execute(
+                        'DELETE FROM search_vectors WHERE document_id IN '
+                        '(SELECT id FROM search_documents WHERE video_id = ?)', (video_id,)
+                    )
+                document_ids = []
+                for video_id, video_url, field, text in rows:
+                    cursor = self._conn.execute(
+                        'INSERT OR REPLACE INTO search_documents (video_id, video_url, field, text, created_at) '
+                        'VALUES (?, ?, ?, ?, ?)', (video_id, video_url, field, text, now)
+                    )
+                    document_ids.append(cursor.lastrowid)
+                if vectors is not None:
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO search_vectors (document_id, embedder, vector) VALUES (?, ?, ?)',
+                        [
+                            (document_ids[i], self.embedder.name, vectors[n].astype('<f4').tobytes())
+                            for n, i in enumerate(embed_rows)
+                        ]
+                    )
+        return len(video_ids)
+
+    # ---- 加载 ----
+
+    def _refresh(self):
+        """加载 _loaded_id 之后写入的文档，补算缺失的向量（调用方持有锁）"""
+        if not self._snapshot_checked:
+            self._snapshot_checked = True
+            self._load_snapshot()
+
+        rows = self._conn.execute(
+            'SELECT d.id, d.video_id, d.field, d.text, v.vector FROM search_documents d '
+            'LEFT JOIN search_vectors v ON v.document_id = d.id AND v.embedder = ? '
+            'WHERE d.id > ? ORDER BY d.id', (self.embedder.name, self._loaded_id)
+        ).fetchall()
+        if not rows:
+            return
+
+        missing = [
+            i for i, row in enumerate(rows)
+            if row[4] is None and row[2] in self.embedded_fields and row[3]
+        ]
+        filled = {}
+        if missing:
+            print(f"🔢 补算 {len(missing)} 个检索向量（{self.embedder.name}）...")
+            vectors = self.embedder.embed([rows[i][3] for i in missing])
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO search_vectors (document_id, embedder, vector) VALUES (?, ?, ?)',
+                    [(rows[i][0], self.embedder.name, vectors[n].astype('<f4').tobytes()) for n, i in enumerate(missing)]
+                )
+            filled = dict(zip(missing, vectors))
+
+        start = self._row_ids.size
+        lengths, fields, embedded = [], [], {}
+        alive = np.ones(len(rows), dtype=np.bool_)
+        for offset, (row_id, video_id, field, text, blob) in enumerate(rows):
+            position = start + offset
+            field_id = FIELD_NAMES.index(field) if field in SEARCH_FIELDS else -1
+            # 同一视频重新索引：旧文档标记为删除（倒排表中的记录在合并时清理）
+            superseded = self._positions.get((video_id, field_id))
+            if superseded is not None and superseded >= start:
+                alive[superseded - start] = False
+            elif superseded is not None and self._alive.view[superseded]:
+                self._alive.view[superseded] = False
+                if field_id >= 0:
+                    self._field_length_sum[field_id] -= self._lengths.view[superseded]
+                    self._field_count[field_id] -= 1
+            self._positions[(video_id, field_id)] = position
+            self._video_ids.append(video_id)
+
+            tokens = tokenize(text)
+            self._inverted.add(position, tokens)
+            lengths.append(len(tokens))
+            fields.append(field_id)
+
+            if field in self.embedded_fields and text:
+                vector = filled.get(offset)
+                if vector is None:
+                    vector = np.frombuffer(blob, dtype='<f4')
+                embedded.setdefault(field, ([], []))
+                embedded[field][0].append(vector)
+                embedded[field][1].append(position)
+
+        self._row_ids.extend(np.array([row[0] for row in rows], dtype=np.int64))
+        self._fields.extend(np.array(fields, dtype=np.int8))
+        self._lengths.extend(np.array(lengths, dtype=np.float32))
+        self._alive.extend(alive)
+        for field_id, length, is_alive in zip(fields, lengths, alive):
+            if field_id >= 0 and is_alive:
+                self._field_length_sum[field_id] += length
+                self._field_count[field_id] += 1
+
+        for field, (vectors, positions) in embedded.items():
+            if field not in self._matrices:
+                self._matrices[field] = (_GrowingArray(np.float32, len(vectors[0])), _GrowingArray(np.int32))
+            matrix, matrix_positions = self._matrices[field]
+            matrix.extend(np.stack(vectors))
+            matrix_positions.extend(np.array(positions, dtype=np.int32))
+
+        self._loaded_id = rows[-1][0]
+        self._norms = None
+        self._unsaved += len(rows)
+        if self._unsaved >= self.SNAPSHOT_MIN_DOCUMENTS:
+            self._save_snapshot()
+        elif self._inverted.needs_compaction():
+            self._inverted.compact(self._alive.view)
+
+    def _save_snapshot(self):
+        """合并倒排表并把内存状态写入快照（先写临时文件再替换，调用方持有锁）"""
+        start = time.perf_counter()
+        self._inverted.compact(self._alive.view)
+        meta = {
+            'version': self.SNAPSHOT_VERSION,
+            'embedder': self.embedder.name,
+            'fields': FIELD_NAMES,
+            'embedded_fields': list(self._matrices),
+            'loaded_id': self._loaded_id,
+        }
+        arrays = {
+            'meta': np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+            'vocab': _join_strings(list(self._inverted.vocab)),
+            'offsets': self._inverted.offsets,
+            'docs': self._inverted.docs,
+            'tfs': self._inverted.tfs,
+            'row_ids': self._row_ids.view,
+            'fields': self._fields.view,
+            'lengths': self._lengths.view,
+            'alive': self._alive.view,
+            'video_ids': _join_strings(self._video_ids),
+            'field_length_sum': self._field_length_sum,
+            'field_count': self._field_count,
+        }
+        for field, (matrix, positions) in self._matrices.items():
+            arrays[f'matrix_{field}'] = matrix.view
+            arrays[f'positions_{field}'] = positions.view
+
+        temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"⚠️ 检索索引快照保存失败: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._unsaved = 0
+        print(f"💾 检索索引快照已保存: {len(self._video_ids)} 个文档（{time.perf_counter() - start:.1f} 秒）")
+
+    def _load_snapshot(self):
+        """加载快照（不存在、版本或字段不匹配时忽略，调用方持有锁）"""
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with np.load(self.snapshot_path) as data:
+                meta = json.loads(data['meta'].tobytes())
+                if (meta['version'] != self.SNAPSHOT_VERSION or meta['embedder'] != self.embedder.name
+                        or meta['fields'] != FIELD_NAMES
+                        or set(meta['embedded_fields']) - set(self.embedded_fields)):
+                    return
+                arrays = {key: data[key] for key in data.files}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ 检索索引快照无法读取，重新加载: {e}")
+            return
+        # 数据库被删除重建后快照已失效
+        max_id = self._conn.execute('SELECT MAX(id) FROM search_documents').fetchone()[0] or 0
+        if max_id < meta['loaded_id']:
+            return
+
+        vocab = _split_strings(arrays['vocab'])
+        self._inverted.vocab = {token: token_id for token_id, token in enumerate(vocab)}
+        self._inverted.offsets = arrays['offsets']
+        self._inverted.docs = arrays['docs']
+        self._inverted.tfs = arrays['tfs']
+        self._row_ids = _GrowingArray(np.int64, initial=arrays['row_ids'])
+        self._fields = _GrowingArray(np.int8, initial=arrays['fields'])
+        self._lengths = _GrowingArray(np.float32, initial=arrays['lengths'])
+        self._alive = _GrowingArray(np.bool_, initial=arrays['alive'])
+        self._video_ids = _split_strings(arrays['video_ids'])
+        self._positions = {
+            (video_id, int(field_id)): position
+            for position, (video_id, field_id, is_alive) in enumerate(
+                zip(self._video_ids, self._fields.view, self._alive.view)
+            ) if is_alive
+        }
+        self._field_length_sum = arrays['field_length_sum']
+        self._field_count = arrays['field_count']
+        self._matrices = {
+            field: (
+                _GrowingArray(np.float32, arrays[f'matrix_{field}'].shape[1], initial=arrays[f'matrix_{field}']),
+                _GrowingArray(np.int32, initial=arrays[f'positions_{field}']),
+            )
+            for field in meta['embedded_fields']
+        }
+        self._loaded_id = meta['loaded_id']
+
+    # ---- 查询 ----
+
+    def _field_mask(self, fields: Optional[List[str]]) -> np.ndarray:
+        alive = self._alive.view
+        if not fields:
+            return alive
+        wanted = np.zeros(len(FIELD_NAMES), dtype=np.bool_)
+        wanted[[FIELD_NAMES.index(field) for field in fields]] = True
+        return alive & wanted[self._fields.view]
+
+    def _keyword_ranking(self, query: str, mask: np.ndarray, limit: int) -> List[int]:
+        """BM25 得分最高的文档位置"""
+        if self._norms is None:
+            average = np.maximum(self._field_length_sum / np.maximum(self._field_count, 1), 1.0)
+            self._norms = (
+                BM25_K1 * (1 - BM25_B + BM25_B * self._lengths.view / average[self._fields.view])
+            ).astype(np.float32)
+
+        live = max(int(self._field_count.sum()), 1)
+        all_docs, all_weights = [], []
+        for token in set(tokenize(query)):
+            docs, tfs = self._inverted.postings(token)
+            if len(docs) == 0:
+                continue
+            idf = np.float32(np.log(1 + (live - len(docs) + 0.5) / (len(docs) + 0.5)))
+            all_docs.append(docs)
+            all_weights.append(idf * tfs * (BM25_K1 + 1) / (tfs + self._norms[docs]))
+        if not all_docs:
+            return []
+        scores = np.bincount(np.concatenate(all_docs), weights=np.concatenate(all_weights), minlength=len(mask))
+        scores[~mask] = 0
+        return _top_positions(scores, limit)
+
+    def _semantic_ranking(self, query: str, fields: List[str], mask: np.ndarray, limit: int) -> List[int]:
+        """向量余弦相似度最高的文档位置"""
+        targets = [field for field in fields if field in self._matrices]
+        if not targets:
+            return []
+        vector = self.embedder.embed([query])[0]
+        if not vector.any():
+            return []
+        candidates: List[Tuple[float, int]] = []
+        for field in targets:
+            matrix, positions = self._matrices[field]
+            scores = matrix.view @ vector
+            scores[~mask[positions.view]] = -np.inf
+            for row in _top_positions(scores, limit):
+                candidates.append((float(scores[row]), int(positions.view[row])))
+        candidates.sort(reverse=True)
+        return [position for _, position in candidates[:limit]]
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        fields: Optional[List[str]] = None,
+        mode: str = 'hybrid',
+        exclude_video_id: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        检索分析结果
+
+        Args:
+            query: 查询文本
+            k: 返回的视频数
+            fields: 限定的字段（可选，默认全部字段），取值见 FIELD_NAMES
+            mode: hybrid（默认）/ keyword / semantic
+            exclude_video_id: 排除的规范视频 ID（可选）
+
+        Returns:
+            [{'video_id', 'video_url', 'field', 'text', 'score', 'keyword_rank', 'semantic_rank'}]，
+            按融合得分降序，每个视频一条
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"未知的检索模式: {mode}（可选 {', '.join(SEARCH_MODES)}）")
+        unknown = [field for field in fields or [] if field not in SEARCH_FIELDS]
+        if unknown:
+            raise ValueError(f"未知的检索字段: {', '.join(unknown)}（可选 {', '.join(FIELD_NAMES)}）")
+
+        start = time.perf_counter()
+        with self._lock:
+            self._refresh()
+            if self._row_ids.size == 0:
+                return []
+            mask = self._field_mask(fields)
+            limit = max(k * 5, 50)
+            keyword = self._keyword_ranking(query, mask, limit) if mode != 'semantic' else []
+            semantic = (
+                self._semantic_ranking(query, fields or list(self.embedded_fields), mask, limit)
+                if mode != 'keyword' else []
+            )
+
+            fused: Dict[int, float] = {}
+            for ranking in (keyword, semantic):
+                for rank, position in enumerate(ranking):
+                    fused[position] = fused.get(position, 0.0) + 1.0 / (RRF_K + rank + 1)
+            keyword_rank = {position: rank + 1 for rank, position in enumerate(keyword)}
+            semantic_rank = {position: rank + 1 for rank, position in enumerate(semantic)}
+
+            best: Dict[str, int] = {}
+            for position in sorted(fused, key=fused.get, reverse=True):
+                video_id = self._video_ids[position]
+                if video_id != exclude_video_id and video_id not in best:
+                    best[video_id] = position
+                if len(best) >= k:
+                    break
+
+            positions = list(best.values())
+            documents = {
+                row[0]: row[1:] for row in self._conn.execute(
+                    f"SELECT id, video_url, text FROM search_documents "
+                    f"WHERE id IN ({','.join('?' * len(positions))})",
+                    [int(self._row_ids.view[position]) for position in positions]
+                ).fetchall()
+            } if positions else {}
+
+            results = []
+            for position in positions:
+                # 查询期间被其他进程替换的文档跳过（下一次查询时加载新文档）
+                document = documents.get(int(self._row_ids.view[position]))
+                if document is None:
+                    continue
+                results.append({
+                    'video_id': self._video_ids[position],
+                    'video_url': document[0],
+                    'field': FIELD_NAMES[self._fields.view[position]],
+                    'text': document[1],
+                    'score': round(fused[position], 6),
+                    'keyword_rank': keyword_rank.get(position),
+                    'semantic_rank': semantic_rank.get(position),
+                })
+
+            self.queries += 1
+            self.total_query_ms += (time.perf_counter() - start) * 1000
+        return results
+
+    def similar(self, video_url: str, field: str = 'hook', k: int = 10, mode: str = 'hybrid') -> List[Dict]:
+        """
+        查找与某个已索引视频的指定字段相似的其他视频（例如「和这个 Hook 相似的 Hook」）
+
+        Raises:
+            KeyError: 该视频未被索引或该字段为空
+        """
+        video_id = extract_video_id(video_url)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT text FROM search_documents WHERE video_id = ? AND field = ?', (video_id, field)
+            ).fetchone()
+        if row is None or not row[0]:
+            raise KeyError(f"未找到已索引的 {field}: {video_url}")
+        return self.search(row[0], k=k, fields=[field], mode=mode, exclude_video_id=video_id)
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'videos', 'documents', 'vocabulary', 'embedder', 'queries', 'avg_query_ms'}
+        """
+        with self._lock:
+            self._refresh()
+            videos = self._conn.execute('SELECT COUNT(DISTINCT video_id) FROM search_documents').fetchone()[0]
+            return {
+                'videos': videos,
+                'documents': int(self._alive.view.sum()),
+                'vocabulary': len(self._inverted.vocab),
+                'embedder': self.embedder.name,
+                'queries': self.queries,
+                'avg_query_ms': round(self.total_query_ms / self.queries, 2) if self.queries else None,
+            }
+
+    def close(self):
+        """保存未写入快照的文档并关闭数据库连接"""
+        with self._lock:
+            if self._unsaved:
+                self._save_snapshot()
+            self._conn.close()
+
+
+def _top_positions(scores: np.ndarray, limit: int) -> List[int]:
+    """得分最高的 limit 个下标（降序，跳过 0 分 / -inf）"""
+    if len(scores) > limit:
+        candidates = np.argpartition(-scores, limit)[:limit]
+    else:
+        candidates = np.arange(len(scores))
+    candidates = candidates[np.isfinite(scores[candidates]) & (scores[candidates] > 0)]
+    return [int(i) for i in candidates[np.argsort(-scores[candidates], kind='stable')]]
+
+
+_default_index: Optional[SearchIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """
+    获取进程内共享的检索索引，SEARCH_INDEX 未开启（默认 off）时返回 None
+    """
+    global _default_index
+    if os.getenv('SEARCH_INDEX', 'off').lower() not in ('1', 'on', 'true'):
+        return None
+    if _default_index is None:
+        with _default_index_lock:
+            if _default_index is None:
+                _default_index = SearchIndex()
+    return _default_index
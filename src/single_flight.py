@@ -0,0 +1,118 @@
+"""
+Single Flight
+并发请求合并：同一键的计算只执行一次，其余调用方等待并共享同一结果
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+
+class _Flight:
+    """一次进行中的计算：任务本身 + 中间事件的订阅者和历史（供后加入的调用方回放）"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: List[Callable] = []
+        self.history: List[tuple] = []
+        # publish 可能在线程池中调用（例如下载进度回调）
+        self._lock = threading.Lock()
+
+    def publish(self, *args):
+        with self._lock:
+            self.history.append(args)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber(*args)
+
+    def subscribe(self, callback: Callable):
+        """订阅后续事件，并先回放已发出的事件"""
+        with self._lock:
+            for args in self.history:
+                callback(*args)
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable):
+        with self._lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+
+class AsyncSingleFlight:
+    """
+    异步 single-flight
+
+    - do(key, factory) 在没有进行中的同键计算时执行 factory(publish)，否则等待已有计算的结果
+    - factory 通过 publish(*args) 发出中间事件（例如流式生成的字段），
+      所有调用方的 on_event 都会收到，后加入的调用方会先回放已发出的事件
+    - 某个调用方被取消不会取消共享的计算；计算结束（成功或失败）后立即移除，不缓存结果
+    """
+
+    def __init__(self, name: str = 'default'):
+        """
+        Args:
+            name: 名称（用于统计输出）
+        """
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.executions = 0
+
+    async def do(
+        self,
+        key: Hashable,
+        factory: Callable[[Callable], Awaitable[Any]],
+        on_event: Optional[Callable] = None
+    ) -> Any:
+        """
+        执行或加入同键的计算
+
+        Args:
+            key: 合并键（例如规范视频 ID）
+            factory: 计算函数，参数为 publish 回调，返回 awaitable
+            on_event: 中间事件回调（可选）
+
+        Returns:
+            计算结果（计算失败时所有调用方收到同一个异常）
+        """
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            self.executions += 1
+            flight.task = asyncio.ensure_future(factory(flight.publish))
+            flight.task.add_done_callback(lambda task: self._finish(key, task))
+        else:
+            print(f"🔗 合并请求 [{self.name}] {key}")
+
+        if on_event:
+            flight.subscribe(on_event)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            if on_event:
+                flight.unsubscribe(on_event)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self._flights.pop(key, None)
+        # 所有调用方都已取消时也要取出异常，避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        """进行中的计算数"""
+        return len(self._flights)
+
+    def stats(self) -> Dict:
+        """
+        合并统计
+
+        Returns:
+            {'calls', 'executions', 'saved', 'in_flight'}，saved 为节省的上游调用次数
+        """
+        return {
+            'calls': self.calls,
+            'executions': self.executions,
+            'saved': self.calls - self.executions,
+            'in_flight': len(self._flights),
+        }
@@ -5,10 +5,14 @@ Sprint 1: Data Pipeline for E-Com Video Insider
 
 import os
 import time
-from typing import Dict, Optional
+from typing import Dict, Optional, List, Iterable, Iterator, Tuple
 from apify_client import ApifyClient
 from dotenv import load_dotenv
 
+from .result_cache import extract_video_id
+from .clients import get_apify_client
+from .rate_limiter import get_upstream_limiter
+
 # Load environment variables
 load_dotenv()
 
@@ -19,18 +23,19 @@ class TikTokFetcher:
     使用 Apify 的 TikTok Scraper Actor 来获取视频元数据和下载链接
     """
     
-    def __init__(self, api_token: Optional[str] = None):
+    def __init__(self, api_token: Optional[str] = None, client: Optional[ApifyClient] = None):
         """
         初始化 TikTok Fetcher
         
         Args:
             api_token: Apify API Token，如果不提供则从环境变量读取
+            client: 注入的 ApifyClient（可选，默认使用 clients 模块按 Token 共享的实例）
         """
         self.api_token = api_token or os.getenv('APIFY_API_TOKEN')
-        if not self.api_token:
+        if not self.api_token and client is None:
             raise ValueError("APIFY_API_TOKEN 未设置！请在 .env 文件中配置或作为参数传入")
         
-        self.client = ApifyClient(self.api_token)
+        self.client = client or get_apify_client(self.api_token)
         
         # 使用 clockworks/tiktok-scraper Actor
         # 这是一个流行的 TikTok 数据抓取 Actor
@@ -75,6 +80,7 @@ class TikTokFetcher:
         try:
             # 运行 Actor
             print("⏳ 正在调用 Apify Actor...")
+            get_upstream_limiter().acquire('apify')
             run = self.client.actor(self.actor_id).call(run_input=run_input)
             
             # 等待运行完成并获取结果
@@ -97,6 +103,115 @@ class TikTokFetcher:
             print(f"❌ 获取视频数据失败: {str(e)}")
             raise
     
+    def fetch_many(
+        self,
+        video_urls: Iterable[str],
+        batch_size: int = 100,
+        page_size: int = 100
+    ) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        批量获取视频数据：多个 URL 合并到一次 Actor 运行中，摊薄冷启动的时间和费用
+        
+        结果以生成器形式逐条返回，数据集分页读取，内存占用与批量大小无关
+        
+        Args:
+            video_urls: 视频 URL 列表
+            batch_size: 每次 Actor 运行包含的 URL 数，默认 100
+            page_size: 每次从数据集读取的条目数，默认 100
+            
+        Yields:
+            (输入 URL, 格式化后的视频数据)；Apify 未返回数据的 URL 对应 None
+        """
+        urls = list(dict.fromkeys(video_urls))
+        
+        for start in range(0, len(urls), batch_size):
+            chunk = urls[start:start + batch_size]
+            print(f"🚀 批量获取 TikTok 视频数据: 第 {start + 1}-{start + len(chunk)} 个（共 {len(urls)} 个）")
+            
+            run_input = {
+                "postURLs": chunk,
+                "resultsPerPage": 1,
+                "shouldDownloadVideos": False,
+                "shouldDownloadCovers": False,
+                "shouldDownloadSubtitles": False,
+            }
+            
+            try:
+                get_upstream_limiter().acquire('apify')
+                run = self.client.actor(self.actor_id).call(run_input=run_input)
+            except Exception as e:
+                print(f"❌ 批量获取视频数据失败: {str(e)}")
+                raise
+            
+            # 输入 URL 按规范视频 ID 建立索引，用于把结果映射回输入
+            pending = {}
+            for url in chunk:
+                pending.setdefault(extract_video_id(url), []).append(url)
+            
+            for raw_data in self._iter_dataset(run["defaultDatasetId"], page_size):
+                matched_urls = self._match_input_urls(raw_data, pending)
+                if not matched_urls:
+                    continue
+                result = self._format_video_data(raw_data)
+                for url in matched_urls:
+                    yield url, result
+                if not pending:
+                    break
+            
+            # 未返回数据的 URL（视频已删除、私密等）
+            for missing_urls in pending.values():
+                for url in missing_urls:
+                    print(f"⚠️ 未获取到视频数据: {url}")
+                    yield url, None
+            
+            print(f"✅ 本批次数据获取完成")
+    
+    def _iter_dataset(self, dataset_id: str, page_size: int) -> Iterator[Dict]:
+        """
+        分页遍历 Apify 数据集
+        
+        Args:
+            dataset_id: 数据集 ID
+            page_size: 每页条目数
+            
+        Yields:
+            原始数据条目
+        """
+        dataset = self.client.dataset(dataset_id)
+        offset = 0
+        while True:
+            page = dataset.list_items(offset=offset, limit=page_size)
+            items = page.items
+            if not items:
+                break
+            yield from items
+            offset += len(items)
+            if offset >= page.total:
+                break
+    
+    def _match_input_urls(self, raw_data: Dict, pending: Dict[str, List[str]]) -> List[str]:
+        """
+        把 Apify 返回的条目映射回输入 URL（匹配后从 pending 中移除）
+        
+        Args:
+            raw_data: Apify 返回的原始数据
+            pending: 规范视频 ID -> 尚未匹配的输入 URL 列表
+            
+        Returns:
+            匹配到的输入 URL 列表
+        """
+        candidates = []
+        if raw_data.get('id'):
+            candidates.append(f"tiktok:{raw_data['id']}")
+        for key in ('submittedVideoUrl', 'inputUrl', 'webVideoUrl'):
+            if raw_data.get(key):
+                candidates.append(extract_video_id(raw_data[key]))
+        
+        for video_id in candidates:
+            if video_id in pending:
+                return pending.pop(video_id)
+        return []
+    
     def _format_video_data(self, raw_data: Dict) -> Dict:
         """
         格式化 Apify 返回的原始数据
@@ -0,0 +1,267 @@
+"""
+Transcribers
+可插拔的转录后端：本地离线 ASR（faster-whisper / CTranslate2，CPU 进程池），
+按静音边界切分长音频、并行转录后拼接为 [{"timestamp", "text"}] 格式
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .audio_stream import AudioChunk, SAMPLE_RATE, iter_pcm_chunks, format_timestamp
+
+
+def _frame_energy(pcm: np.ndarray, frame_size: int) -> np.ndarray:
+    """按帧计算 RMS 能量（dBFS）"""
+    frames = len(pcm) // frame_size
+    if frames == 0:
+        return np.zeros(0)
+    samples = pcm[:frames * frame_size].astype(np.float32).reshape(frames, frame_size) / 32768.0
+    rms = np.sqrt(np.mean(samples ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6))
+
+
+def find_silence_cut(
+    pcm: np.ndarray,
+    sample_rate: int,
+    min_seconds: float,
+    max_seconds: float,
+    frame_seconds: float = 0.03,
+    min_silence_seconds: float = 0.3
+) -> int:
+    """
+    在 [min_seconds, max_seconds] 区间内寻找最安静的位置作为切分点
+
+    取连续 min_silence_seconds 内平均能量最低的窗口中点，避免把一句话切成两半
+
+    Returns:
+        切分点（样本下标）
+    """
+    frame_size = max(int(sample_rate * frame_seconds), 1)
+    start_frame = int(min_seconds * sample_rate) // frame_size
+    end_frame = min(int(max_seconds * sample_rate), len(pcm)) // frame_size
+    energy = _frame_energy(pcm[:end_frame * frame_size], frame_size)
+    if end_frame - start_frame <= 1:
+        return min(int(max_seconds * sample_rate), len(pcm))
+
+    window = max(int(min_silence_seconds / frame_seconds), 1)
+    search = energy[start_frame:end_frame]
+    if len(search) > window:
+        # 滑动平均
+        smoothed = np.convolve(search, np.ones(window) / window, mode='valid')
+        best = int(np.argmin(smoothed)) + window // 2
+    else:
+        best = int(np.argmin(search))
+    return (start_frame + best) * frame_size
+
+
+def rechunk_on_silence(
+    chunks: Iterable[AudioChunk],
+    target_seconds: float = 30,
+    max_seconds: float = 45
+) -> Iterator[AudioChunk]:
+    """
+    把固定长度的 PCM 块重新切分为在静音处断开的块（流式，不需要整段音频）
+
+    Args:
+        chunks: iter_pcm_chunks 产出的 PCM 块（建议使用较小的块，例如 5 秒）
+        target_seconds: 每块的最短时长，在 [target_seconds, max_seconds] 之间寻找静音
+        max_seconds: 每块的最长时长
+
+    Yields:
+        AudioChunk（start_seconds 为在整段音频中的起始时间）
+    """
+    buffer = np.zeros(0, dtype=np.int16)
+    offset_samples = 0
+    index = 0
+    sample_rate = SAMPLE_RATE
+
+    for chunk in chunks:
+        sample_rate = chunk.sample_rate
+        buffer = np.concatenate([buffer, np.frombuffer(chunk.pcm, dtype=np.int16)])
+        while len(buffer) >= max_seconds * sample_rate:
+            cut = find_silence_cut(buffer, sample_rate, target_seconds, max_seconds)
+            yield AudioChunk(index, offset_samples / sample_rate, buffer[:cut].tobytes(), sample_rate)
+            index += 1
+            offset_samples += cut
+            buffer = buffer[cut:]
+
+    if len(buffer):
+        yield AudioChunk(index, offset_samples / sample_rate, buffer.tobytes(), sample_rate)
+
+
+class Transcriber:
+    """转录后端接口"""
+
+    name = 'base'
+
+    def transcribe_chunks(self, chunks: Iterable[AudioChunk]) -> List[Dict]:
+        """
+        转录一组 PCM 块
+
+        Args:
+            chunks: AudioChunk 迭代器（可以是仍在解码中的流）
+
+        Returns:
+            [{"timestamp": "00:00", "text": "..."}]，按时间排序
+        """
+        raise NotImplementedError
+
+    def transcribe_file(self, media_path: str) -> List[Dict]:
+        """
+        转录音频 / 视频文件（ffmpeg 流式解码）
+
+        Args:
+            media_path: 音频或视频文件路径
+
+        Returns:
+            [{"timestamp": "00:00", "text": "..."}]
+        """
+        return self.transcribe_chunks(iter_pcm_chunks(media_path, chunk_seconds=5))
+
+    def close(self, wait: bool = False):
+        """
+        释放资源
+
+        Args:
+            wait: 是否等待工作进程退出（在 multiprocessing 子进程中调用时需要，否则子进程退出时会卡住）
+        """
+
+
+# ---- 本地 ASR 工作进程 ----
+# 每个工作进程加载一次模型，之后复用
+
+_worker_model = None
+_worker_options: Dict = {}
+
+
+def _init_worker(model_size: str, compute_type: str, cpu_threads: int, options: Dict):
+    global _worker_model, _worker_options
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError as e:
+        raise ImportError("本地转录需要安装 faster-whisper: pip install faster-whisper") from e
+
+    _worker_model = WhisperModel(
+        model_size, device='cpu', compute_type=compute_type, cpu_threads=cpu_threads
+    )
+    _worker_options = options
+
+
+def _transcribe_in_worker(pcm: bytes, sample_rate: int, offset_seconds: float) -> List[Dict]:
+    audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    if sample_rate != SAMPLE_RATE:
+        # faster-whisper 要求 16 kHz，简单线性插值重采样
+        target_length = int(len(audio) * SAMPLE_RATE / sample_rate)
+        audio = np.interp(
+            np.linspace(0, len(audio), target_length, endpoint=False),
+            np.arange(len(audio)), audio
+        ).astype(np.float32)
+
+    segments, _ = _worker_model.transcribe(audio, **_worker_options)
+    return [
+        {'start': segment.start + offset_seconds, 'text': segment.text.strip()}
+        for segment in segments if segment.text.strip()
+    ]
+
+
+class LocalWhisperTranscriber(Transcriber):
+    """
+    本地离线转录（faster-whisper，CPU）
+
+    - 每个工作进程加载一份模型，进程池大小 × 每进程线程数约等于可用 CPU 核数
+    - 长音频按静音切分成 target_seconds ~ max_seconds 的块，解码过程中即提交到进程池
+    - 不访问网络（模型需提前下载到本地，或通过 model_size 传入本地模型目录）
+    """
+
+    name = 'local'
+
+    def __init__(
+        self,
+        model_size: Optional[str] = None,
+        workers: Optional[int] = None,
+        cpu_threads: Optional[int] = None,
+        compute_type: str = 'int8',
+        language: Optional[str] = None,
+        target_seconds: float = 30,
+        max_seconds: float = 45
+    ):
+        """
+        初始化本地转录器
+
+        Args:
+            model_size: 模型名称或本地模型目录，默认读取 LOCAL_ASR_MODEL（默认 small）
+            workers: 工作进程数，默认读取 LOCAL_ASR_WORKERS（默认 CPU 核数 / 2）
+            cpu_threads: 每个进程的推理线程数，默认 CPU 核数 / workers
+            compute_type: CTranslate2 计算精度，CPU 上推荐 int8
+            language: 语言代码（可选，默认自动检测）
+            target_seconds: 切块最短时长（秒）
+            max_seconds: 切块最长时长（秒）
+        """
+        cpu_count = os.cpu_count() or 2
+        self.model_size = model_size or os.getenv('LOCAL_ASR_MODEL', 'small')
+        self.workers = workers or int(os.getenv('LOCAL_ASR_WORKERS', str(max(cpu_count // 2, 1))))
+        self.cpu_threads = cpu_threads or max(cpu_count // self.workers, 1)
+        self.compute_type = compute_type
+        self.language = language
+        self.target_seconds = target_seconds
+        self.max_seconds = max_seconds
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                options = {'beam_size': 1, 'vad_filter': False}
+                if self.language:
+                    options['language'] = self.language
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.model_size, self.compute_type, self.cpu_threads, options)
+                )
+                print(f"✅ 本地转录已启用（模型: {self.model_size}，{self.workers} 个进程 × {self.cpu_threads} 线程）")
+            return self._pool
+
+    def transcribe_chunks(self, chunks: Iterable[AudioChunk]) -> List[Dict]:
+        pool = self._get_pool()
+        futures = [
+            pool.submit(_transcribe_in_worker, chunk.pcm, chunk.sample_rate, chunk.start_seconds)
+            for chunk in rechunk_on_silence(chunks, self.target_seconds, self.max_seconds)
+        ]
+
+        segments = [segment for future in futures for segment in future.result()]
+        segments.sort(key=lambda s: s['start'])
+        return [{'timestamp': format_timestamp(s['start']), 'text': s['text']} for s in segments]
+
+    def close(self, wait: bool = False):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=True)
+                self._pool = None
+
+
+_default_transcriber: Optional[Transcriber] = None
+_default_transcriber_lock = threading.Lock()
+
+
+def get_transcriber() -> Optional[Transcriber]:
+    """
+    按环境变量 TRANSCRIBER_BACKEND 获取进程内共享的转录后端
+
+    - api（默认）：返回 None，使用 Whisper API / Gemini
+    - local：本地离线转录（LocalWhisperTranscriber）
+    """
+    global _default_transcriber
+    backend = os.getenv('TRANSCRIBER_BACKEND', 'api').lower()
+    if backend != 'local':
+        return None
+    if _default_transcriber is None:
+        with _default_transcriber_lock:
+            if _default_transcriber is None:
+                _default_transcriber = LocalWhisperTranscriber()
+    return _default_transcriber
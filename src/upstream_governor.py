@@ -0,0 +1,453 @@
+"""
+Upstream Governor
+Gemini 调用的自适应并发控制：AIMD 调整并发上限、遵守 Retry-After 的抖动重试、按端点熔断，
+官方 API 与 GEMINI_API_BASE 代理分别统计
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .rate_limiter import get_upstream_limiter
+
+
+# 可重试的 HTTP 状态码（429 为限流，其余为上游临时故障）
+THROTTLE_STATUS = 429
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Gemini 429 错误信息中的建议等待时间，例如 "Please retry in 27.5s" 或 "retry_delay { seconds: 27 }"
+_RETRY_IN = re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE)
+_RETRY_DELAY = re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)')
+_STATUS_IN_MESSAGE = re.compile(r'^\s*(\d{3})\s')
+
+
+class CircuitOpenError(RuntimeError):
+    """端点处于熔断状态，调用被直接拒绝（retry_after 为距离下次探测的秒数）"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"Gemini 端点 {endpoint} 暂时不可用（熔断中，{retry_after:.0f} 秒后重试）")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """从 google.api_core / requests / httpx 异常中取出 HTTP 状态码"""
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(exc, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if isinstance(status, int):
+        return status
+    # REST 传输下部分错误只有消息，形如 "429 Resource has been exhausted"
+    match = _STATUS_IN_MESSAGE.match(str(exc))
+    return int(match.group(1)) if match else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """限流、5xx 和网络错误可以重试；4xx 请求错误、解析错误等不重试"""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    status = error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # requests / httpx 的连接与超时错误
+    name = type(exc).__name__
+    return name in ('ConnectTimeout', 'ReadTimeout', 'ConnectError', 'RemoteProtocolError', 'ChunkedEncodingError')
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    解析上游建议的等待时间
+
+    依次读取响应头 Retry-After（秒数或 HTTP 日期）和 Gemini 错误信息中的 retry 提示
+
+    Returns:
+        等待秒数，没有建议时返回 None
+    """
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+
+    message = str(exc)
+    match = _RETRY_IN.search(message) or _RETRY_DELAY.search(message)
+    return float(match.group(1)) if match else None
+
+
+class AIMDLimiter:
+    """
+    AIMD 自适应并发上限
+
+    - 满并发时每次成功：上限 += 1 / 上限（约每一轮请求 +1）；未用满时不增加
+    - 被限流：上限减半（decrease_interval 内只减一次，避免同一波 429 连续减半）
+    - 同时支持线程（acquire）和协程（acquire_async）等待
+    """
+
+    def __init__(
+        self,
+        initial: float = 4,
+        min_limit: float = 1,
+        max_limit: float = 16,
+        decrease_interval: float = 1.0
+    ):
+        """
+        Args:
+            initial: 初始并发上限
+            min_limit: 最小并发上限
+            max_limit: 最大并发上限
+            decrease_interval: 两次减半之间的最短间隔（秒）
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = min(max(initial, min_limit), max_limit)
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < max(int(self.limit), 1):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        """占用一个并发名额（阻塞）"""
+        with self._condition:
+            while not self._try_acquire():
+                self._condition.wait()
+
+    async def acquire_async(self):
+        """acquire 的异步版本"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            try:
+                # 兜底超时：即使错过唤醒也会重新检查
+                await asyncio.wait_for(future, timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    if (loop, future) in self._async_waiters:
+                        self._async_waiters.remove((loop, future))
+
+    def release(self):
+        """释放并发名额并唤醒等待者"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def on_success(self):
+        """在释放名额前调用（in_flight 仍包含本次请求）"""
+        with self._condition:
+            if self.limit < self.max_limit and self.in_flight >= int(self.limit):
+                self.limit = min(self.limit + 1.0 / self.limit, self.max_limit)
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_interval:
+                self.limit = max(self.limit / 2, self.min_limit)
+                self._last_decrease = now
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续 failure_threshold 次上游故障（5xx / 网络错误）后打开，reset_timeout 秒后放行一次探测请求，
+    探测成功则关闭，失败则重新打开
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断持续时间（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Tuple[bool, float]:
+        """
+        Returns:
+            (是否放行, 拒绝时距离下次探测的秒数)
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True, 0.0
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True, 0.0
+            return False, max(remaining, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🔌 Gemini 端点熔断 {self.reset_timeout:.0f} 秒（连续失败 {self.failures} 次）")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def on_neutral(self):
+        """请求以非上游故障结束（例如 400 或解析错误）：只释放探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+class UpstreamGovernor:
+    """
+    单个 Gemini 端点的调用管控
+
+    每次尝试依次经过：熔断检查 → 上游 RPM 预算（rate_limiter）→ AIMD 并发名额 → 调用；
+    可重试错误按 max(Retry-After, 全抖动指数退避) 等待后重试
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        budget: str = 'gemini'
+    ):
+        """
+        Args:
+            endpoint: 端点名称（official 或代理地址）
+            max_concurrency: 最大并发数，默认读取 GEMINI_MAX_CONCURRENCY（默认 16）
+            max_retries: 最多重试次数，默认读取 GEMINI_MAX_RETRIES（默认 4）
+            base_delay: 退避基数（秒）
+            max_delay: 单次等待上限（秒）
+            budget: 使用的上游 RPM 预算名称（见 rate_limiter.UPSTREAM_RATE_ENV）
+        """
+        self.endpoint = endpoint
+        max_concurrency = max_concurrency or int(os.getenv('GEMINI_MAX_CONCURRENCY', '16'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('GEMINI_MAX_RETRIES', '4'))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+        self.limiter = AIMDLimiter(initial=min(4, max_concurrency), max_limit=max_concurrency)
+        self.breaker = CircuitBreaker()
+
+        self.calls = 0
+        self.successes = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _check_circuit(self):
+        allowed, retry_after = self.breaker.allow()
+        if not allowed:
+            self.rejected += 1
+            raise CircuitOpenError(self.endpoint, retry_after)
+
+    def _record(self, exc: Optional[BaseException]) -> bool:
+        """记录一次尝试的结果，返回是否应该重试"""
+        if exc is None:
+            self.successes += 1
+            self.limiter.on_success()
+            self.breaker.on_success()
+            return False
+        if not is_retryable(exc):
+            self.breaker.on_neutral()
+            return False
+        if error_status(exc) == THROTTLE_STATUS:
+            # 限流说明端点可用，只降低并发，不计入熔断
+            self.throttled += 1
+            self.limiter.on_throttle()
+            self.breaker.on_neutral()
+        else:
+            self.breaker.on_failure()
+        return True
+
+    def _delay(self, attempt: int, exc: BaseException) -> float:
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after_seconds(exc)
+        if hint is not None:
+            # 上游给出的等待时间加少量抖动，避免所有请求在同一时刻重试
+            return min(hint + random.uniform(0, self.base_delay), self.max_delay)
+        return backoff
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        在管控下调用 func(*args, **kwargs)（阻塞）
+
+        func 应当是完整的一次请求（流式响应需在 func 内消费完），重试时会整体重新调用
+
+        Raises:
+            CircuitOpenError: 端点熔断中
+            其他异常: 不可重试的错误，或重试次数用尽后的最后一个错误
+        """
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            self._check_circuit()
+            recorded = False
+            try:
+                get_upstream_limiter().acquire(self.budget)
+                self.limiter.acquire()
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                else:
+                    recorded = True
+                    self._record(None)
+                    return result
+                finally:
+                    self.limiter.release()
+                recorded = True
+                retry = self._record(error)
+            finally:
+                if not recorded:
+                    # 被取消或以 BaseException 结束（asyncio 取消、Streamlit 中断脚本等）：释放熔断探测名额
+                    self.breaker.on_neutral()
+
+            if not retry or attempt == self.max_retries:
+                self.failures += 1
+                raise error
+            self.retries += 1
+            delay = self._delay(attempt, error)
+            print(f"⏳ Gemini 请求失败（{error_status(error) or type(error).__name__}），{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+
+    async def call_async(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        call 的异步版本
+
+        Args:
+            factory: 每次尝试调用一次，返回 awaitable（例如 lambda: model.generate_content_async(...)）
+        """
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            self._check_circuit()
+            recorded = False
+            try:
+                await get_upstream_limiter().acquire_async(self.budget)
+                await self.limiter.acquire_async()
+                try:
+                    result = await factory()
+                except Exception as e:
+                    error = e
+                else:
+                    recorded = True
+                    self._record(None)
+                    return result
+                finally:
+                    self.limiter.release()
+                recorded = True
+                retry = self._record(error)
+            finally:
+                if not recorded:
+                    # 被取消或以 BaseException 结束（asyncio 取消、Streamlit 中断脚本等）：释放熔断探测名额
+                    self.breaker.on_neutral()
+
+            if not retry or attempt == self.max_retries:
+                self.failures += 1
+                raise error
+            self.retries += 1
+            delay = self._delay(attempt, error)
+            print(f"⏳ Gemini 请求失败（{error_status(error) or type(error).__name__}），{delay:.1f} 秒后重试 ({attempt + 1}/{self.max_retries})")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            当前并发上限、进行中请求数、熔断状态和累计计数
+        """
+        return {
+            'concurrency_limit': round(self.limiter.limit, 2),
+            'in_flight': self.limiter.in_flight,
+            'circuit': self.breaker.state,
+            'calls': self.calls,
+            'successes': self.successes,
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'failures': self.failures,
+            'rejected': self.rejected,
+        }
+
+
+_governors: Dict[str, UpstreamGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def gemini_endpoint(api_base: Optional[str] = None, key_id: Optional[str] = None) -> str:
+    """端点名称：官方 API 为 official，代理为其地址；指定 key_id 时追加 #key_id"""
+    endpoint = api_base.strip().rstrip('/') if api_base and api_base.strip() else 'official'
+    return f"{endpoint}#{key_id}" if key_id else endpoint
+
+
+def get_gemini_governor(api_base: Optional[str] = None, key_id: Optional[str] = None) -> UpstreamGovernor:
+    """
+    获取端点对应的进程内共享管控器
+
+    Args:
+        api_base: 自定义 API Base URL（可选）
+        key_id: API Key 标识（可选，多 Key 时每个 Key 单独限流、熔断，并使用各自的 RPM 预算）
+    """
+    endpoint = gemini_endpoint(api_base, key_id)
+    governor = _governors.get(endpoint)
+    if governor is None:
+        with _governors_lock:
+            governor = _governors.get(endpoint)
+            if governor is None:
+                governor = _governors[endpoint] = UpstreamGovernor(
+                    endpoint, budget=f"gemini#{key_id}" if key_id else 'gemini'
+                )
+    return governor
+
+
+def governor_stats() -> Dict[str, Dict]:
+    """所有端点的管控指标"""
+    return {endpoint: governor.stats() for endpoint, governor in list(_governors.items())}
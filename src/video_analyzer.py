@@ -8,19 +8,65 @@ import json
 import time
 import tempfile
 import subprocess
-import requests
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
 from pathlib import Path
-from typing import Dict, Optional, List
-import google.generativeai as genai
+from typing import Callable, Dict, Optional, List, Tuple
 from openai import OpenAI
 from dotenv import load_dotenv
 
 from .prompts import VIDEO_ANALYSIS_SYSTEM_PROMPT
+from .result_cache import AnalysisCache, extract_video_id, prompt_fingerprint
+from .file_waiter import FileStateWaiter, get_file_waiter
+from .download_cache import DownloadCache, get_download_cache
+from .format_policy import FormatSelector, describe_format, get_format_stats, platform_of, policy_for
+from .clients import get_openai_client
+from .downloader import ChunkedDownloader
+from .audio_stream import AudioChunk, iter_pcm_chunks, format_timestamp, parse_timestamp
+from .transcribers import Transcriber, get_transcriber
+from .rate_limiter import get_upstream_limiter
+from .gemini_pool import GeminiBackend, GeminiClientPool, get_gemini_pool
+from .video_preprocess import VideoPreprocessor, get_video_preprocessor
+from .frame_sampler import KeyframeSet, ANALYSIS_MODES, analysis_mode_from_env, sample_keyframes
+from .video_features import (
+    FeatureExtractor, apply_local_features, format_features_for_prompt, get_feature_extractor
+)
+from .near_duplicate import (
+    DuplicateMatch, NearDuplicateIndex, VideoFingerprint, compute_fingerprint, get_near_duplicate_index
+)
+from .search_index import SearchIndex, get_search_index
+from .json_stream import JSONStreamError, parse_json_response, parse_stream
+from .remote_file_registry import (
+    RemoteFileRegistry, get_remote_file_registry, file_content_hash
+)
 
 # Load environment variables
 load_dotenv()
 
+# 默认使用的 Gemini 模型（同时参与分析结果缓存键的计算）
+GEMINI_MODEL_NAME = 'gemini-1.5-pro-latest'
+
+# Gemini 转录提示词
+TRANSCRIPT_PROMPT = """请听这段音频，并将其中的语音内容转录为文字。
+
+请按照以下 JSON 格式返回：
+```json
+{
+  "transcript": [
+    {"timestamp": "00:00", "text": "第一句话的内容"},
+    {"timestamp": "00:05", "text": "第二句话的内容"}
+  ]
+}
+```
+
+注意：
+1. 时间戳格式为 MM:SS
+2. 每 5-10 秒分一段
+3. 保持原始语言
+4. 如果没有语音，返回空数组
+5. 只返回 JSON，不要其他解释"""
+
+
 
 class VideoAnalyzer:
     """
@@ -28,13 +74,54 @@ class VideoAnalyzer:
     使用 Google Gemini 1.5 Pro API 分析短视频结构并生成翻拍建议
     """
     
-    def __init__(self, api_key: Optional[str] = None, api_base: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_base: Optional[str] = None,
+        cache: Optional[AnalysisCache] = None,
+        file_waiter: Optional[FileStateWaiter] = None,
+        file_registry: Optional[RemoteFileRegistry] = None,
+        download_cache: Optional[DownloadCache] = None,
+        model=None,
+        openai_client: Optional[OpenAI] = None,
+        downloader: Optional[ChunkedDownloader] = None,
+        transcriber: Optional[Transcriber] = None,
+        gemini_pool: Optional[GeminiClientPool] = None,
+        preprocessor: Optional[VideoPreprocessor] = None,
+        analysis_mode: Optional[str] = None,
+        feature_extractor: Optional[FeatureExtractor] = None,
+        duplicate_index: Optional[NearDuplicateIndex] = None,
+        search_index: Optional[SearchIndex] = None
+    ):
         """
         初始化 Video Analyzer
         
         Args:
             api_key: Google Gemini API Key，如果不提供则从环境变量读取
             api_base: 自定义 API Base URL（用于 KIE API 等代理服务）
+            cache: 分析结果缓存（可选），命中时跳过下载、上传和分析
+            file_waiter: Gemini 文件状态等待器（可选，默认使用进程内共享实例）
+            file_registry: 已上传文件登记表（可选，默认使用进程内共享实例），
+                           相同内容的文件在有效期内不再重复上传
+            download_cache: 视频下载缓存（可选，默认使用进程内共享实例；
+                            环境变量 DOWNLOAD_CACHE_MAX_BYTES=0 时禁用）
+            model: 注入的 GenerativeModel（可选，使用全局 genai 配置，默认使用后端池中的模型）
+            openai_client: 注入的 OpenAI 客户端（可选，默认按环境变量获取共享实例）
+            downloader: 直接下载使用的下载器（可选，默认基于共享连接池新建）
+            transcriber: 转录后端（可选，默认按环境变量 TRANSCRIBER_BACKEND 选择；
+                         为 None 时使用 Whisper API / Gemini）
+            gemini_pool: Gemini 后端池（可选，默认按 GEMINI_API_KEY / GEMINI_API_BASE / GEMINI_API_KEYS
+                         使用进程内共享实例；注入 model 时为只包含该模型的单后端池）
+            preprocessor: 上传前的视频预处理器（可选，默认按环境变量 VIDEO_PREPROCESS_PRESET 选择，
+                          未启用时直接上传原文件）
+            analysis_mode: 分析模式（可选，默认读取 ANALYSIS_MODE）：video 上传完整视频；
+                           keyframes 本地检测镜头切换，只发送关键帧 + 转录
+            feature_extractor: 本地信号提取器（可选，默认按环境变量 LOCAL_FEATURES 启用），
+                               结果写入 Prompt 并附加到分析结果的 local_features 字段
+            duplicate_index: 近似重复视频索引（可选，默认按环境变量 NEAR_DUPLICATE_DETECTION 启用），
+                             搬运 / 重新剪辑的视频直接复用已有分析结果
+            search_index: 分析结果检索索引（可选，默认按环境变量 SEARCH_INDEX 启用），
+                          每份分析完成后写入索引
         """
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         self.api_base = api_base or os.getenv('GEMINI_API_BASE')
@@ -47,96 +134,172 @@ class VideoAnalyzer:
         if not self.api_key and self.api_base:
             self.api_key = "dummy_key_for_kie_api"  # KIE API 可能不需要真实的 key
         
-        # 配置 Gemini API
-        if self.api_base:
-            # 使用自定义 API Base URL（KIE API）
-            genai.configure(
-                api_key=self.api_key,
-                transport='rest',
-                client_options={'api_endpoint': self.api_base}
-            )
-            print(f"✅ 使用自定义 API Base: {self.api_base}")
-        else:
-            # 使用默认 Google API
-            genai.configure(api_key=self.api_key)
-            print("✅ 使用 Google 官方 API")
-        
         # 使用 Gemini 1.5 Pro（更强的视频理解能力）
         # Pro 版本在视频分析任务上准确性更高，减少幻觉
         # 注意: 移除 system_instruction 以兼容 Google AI Studio 的稳定版 API (v1)
-        self.model = genai.GenerativeModel(
-            model_name='gemini-1.5-pro-latest',
-            generation_config={
-                'temperature': 0.3,  # 降低温度以提高准确性
-            }
-        )
-        
+        # 后端池按配置在进程内共享：每个 Key / 端点使用独立客户端，不依赖全局 genai.configure；
+        # 所有 Gemini 调用经过对应后端的管控器（自适应并发、429 退避重试、熔断）
+        self.model_name = GEMINI_MODEL_NAME
+        if gemini_pool is not None:
+            self.gemini_pool = gemini_pool
+        elif model is not None:
+            self.gemini_pool = GeminiClientPool([GeminiBackend(self.api_key, self.api_base, model=model)])
+        else:
+            self.gemini_pool = get_gemini_pool(
+                self.api_key,
+                self.api_base,
+                self.model_name,
+                generation_config={
+                    'temperature': 0.3,  # 降低温度以提高准确性
+                }
+            )
+        self.model = self.gemini_pool.primary.model
+
         # 保存系统提示词，稍后与用户提示词组合使用
         self.system_prompt = VIDEO_ANALYSIS_SYSTEM_PROMPT
         
+        # 分析结果缓存
+        self.cache = cache
+        
+        # 等待 Gemini 文件处理完成（共享轮询线程，指数退避）
+        self.file_waiter = file_waiter or get_file_waiter()
+        
+        # 已上传文件登记表（Gemini 文件只对上传它的凭证可见，按各后端的凭证隔离）
+        self.file_registry = file_registry or get_remote_file_registry()
+        
         # 临时文件夹（使用系统临时目录，兼容 Streamlit Cloud）
         self.temp_dir = Path(tempfile.gettempdir()) / 'ecom_video_insider'
         self.temp_dir.mkdir(parents=True, exist_ok=True)
         
-        # 初始化 OpenAI 客户端（用于 Whisper API）
+        # 视频下载缓存（按规范视频 ID，重复分析不再重新下载）
+        self.download_cache = download_cache or get_download_cache()
+        self.downloader = downloader or ChunkedDownloader()
+        
+        # 初始化 OpenAI 客户端（用于 Whisper API），同一配置在进程内共享
         openai_key = os.getenv('OPENAI_API_KEY')
         openai_base = os.getenv('OPENAI_API_BASE')  # 支持第三方代理
         
-        if openai_key:
-            # 如果有自定义 base_url，使用第三方代理
-            if openai_base:
-                self.openai_client = OpenAI(
-                    api_key=openai_key,
-                    base_url=openai_base.strip()  # 去除可能的空格
-                )
-                print(f"✅ OpenAI Whisper API 已启用（使用代理: {openai_base})")
-            else:
-                self.openai_client = OpenAI(api_key=openai_key)
-                print("✅ OpenAI Whisper API 已启用（官方 API）")
+        if openai_client is not None:
+            self.openai_client = openai_client
+        elif openai_key:
+            self.openai_client = get_openai_client(openai_key, openai_base)
         else:
             self.openai_client = None
             print("⚠️ OpenAI API Key 未配置，将使用 Gemini 进行转录")
+        
+        # 本地离线转录后端（配置后优先于 Whisper API / Gemini）
+        self.transcriber = transcriber or get_transcriber()
+        
+        # 上传前降低分辨率 / 帧率 / 码率（按内容哈希缓存）
+        self.preprocessor = preprocessor or get_video_preprocessor()
+        
+        self.analysis_mode = analysis_mode or analysis_mode_from_env()
+        if self.analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"未知的分析模式: {self.analysis_mode}")
+        
+        # 下载后在进程池中计算镜头切换、响度等确定性指标
+        self.feature_extractor = feature_extractor or get_feature_extractor()
+        
+        # 下载后按感知哈希查找已分析过的近似重复视频（只复用相同 Prompt / 模型 / 分析模式的结果）
+        self.duplicate_index = duplicate_index or get_near_duplicate_index()
+        self.analysis_fingerprint = prompt_fingerprint(self.system_prompt, self.model_name, self.analysis_mode)
+        
+        # 分析结果写入本地检索索引（关键词 + 向量）
+        self.search_index = search_index or get_search_index()
     
-    def download_video_with_ytdlp(self, video_url: str) -> str:
+    def download_video_with_ytdlp(
+        self,
+        video_url: str,
+        progress_hook: Optional[Callable[[Dict], None]] = None,
+        audio_only: bool = False
+    ) -> str:
         """
         使用 yt-dlp 从 TikTok/Instagram/YouTube 下载视频
         
         Args:
             video_url: TikTok/Instagram/YouTube 视频 URL
+            progress_hook: yt-dlp 下载进度回调（可选），参数为 yt-dlp 的进度字典；命中下载缓存时不会调用
+            audio_only: 只下载音频流（只需要转录时使用，平台没有纯音频流时下载最小的视频）
+            
+        Returns:
+            本地视频文件路径（启用下载缓存时位于缓存目录中，不要手动删除）
+        """
+        if self.download_cache:
+            return self.download_cache.get_or_download(
+                video_url,
+                lambda staging_dir: self._download_with_ytdlp(
+                    video_url, Path(staging_dir), progress_hook, audio_only=audio_only
+                ),
+                variant='audio' if audio_only else ''
+            )
+        return self._download_with_ytdlp(video_url, self.temp_dir, progress_hook, audio_only=audio_only)
+    
+    def _download_with_ytdlp(
+        self,
+        video_url: str,
+        output_dir: Path,
+        progress_hook: Optional[Callable[[Dict], None]] = None,
+        audio_only: bool = False
+    ) -> str:
+        """
+        使用 yt-dlp 下载视频到指定目录
+        
+        格式按平台策略选择（满足目标分辨率 / 码率的最小流，见 format_policy），
+        设置 YTDLP_FORMAT 时直接使用该 yt-dlp 格式表达式（例如旧的 'best[ext=mp4]/best'）
+        
+        Args:
+            video_url: TikTok/Instagram/YouTube 视频 URL
+            output_dir: 输出目录
+            progress_hook: yt-dlp 下载进度回调（可选）
+            audio_only: 只下载音频流
             
         Returns:
             本地视频文件路径
         """
-        print(f"📥 使用 yt-dlp 下载视频: {video_url}")
+        print(f"📥 使用 yt-dlp 下载{'音频' if audio_only else '视频'}: {video_url}")
         
         # 生成输出文件名
         timestamp = int(time.time())
-        output_template = str(self.temp_dir / f"video_{timestamp}.%(ext)s")
+        output_template = str(output_dir / f"video_{timestamp}.%(ext)s")
+        
+        policy = policy_for(video_url, audio_only=audio_only)
+        selector = FormatSelector(policy)
         
         # yt-dlp 配置
         ydl_opts = {
-            'format': 'best[ext=mp4]/best',  # 优先下载 mp4 格式
+            'format': os.getenv('YTDLP_FORMAT') or selector,
             'outtmpl': output_template,
             'quiet': False,
             'no_warnings': False,
             'extract_flat': False,
             'nocheckcertificate': True,
+            # DASH / HLS 分片并发下载（对单文件直链无影响）
+            'concurrent_fragment_downloads': policy.concurrent_fragments,
             # YouTube 特定配置（绕过 403 错误）
             'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'referer': 'https://www.youtube.com/',
             'extractor_args': {'youtube': {'player_client': ['android', 'web']}},
         }
+        if progress_hook:
+            ydl_opts['progress_hooks'] = [progress_hook]
         
         try:
+            start = time.perf_counter()
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 # 下载视频
                 info = ydl.extract_info(video_url, download=True)
                 
                 # 获取实际下载的文件路径
                 filename = ydl.prepare_filename(info)
-                
-                print(f"✅ 视频下载完成: {filename}")
-                return filename
+            
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(filename) if os.path.exists(filename) else 0
+            selected = selector.selected or info
+            get_format_stats().record(
+                platform_of(video_url), 'audio' if audio_only else 'video', selected, size, elapsed
+            )
+            print(f"✅ 视频下载完成: {filename}（{describe_format(selected)}，{size / 1024 ** 2:.1f} MB，{elapsed:.1f} 秒）")
+            return filename
                 
         except Exception as e:
             print(f"❌ yt-dlp 下载失败: {str(e)}")
@@ -151,28 +314,41 @@ class VideoAnalyzer:
             output_filename: 输出文件名（可选，默认自动生成）
             
         Returns:
-            本地视频文件路径
+            本地视频文件路径（未指定文件名且启用下载缓存时位于缓存目录中，不要手动删除）
         """
-        print(f"📥 开始下载视频: {video_url}")
+        if not output_filename and self.download_cache:
+            return self.download_cache.get_or_download(
+                video_url,
+                lambda staging_dir: self._download_direct(
+                    video_url,
+                    Path(staging_dir) / "video.mp4",
+                    partial_path=self.download_cache.partial_path(video_url)
+                )
+            )
         
         if not output_filename:
             # 使用时间戳生成唯一文件名
             timestamp = int(time.time())
             output_filename = f"video_{timestamp}.mp4"
         
-        output_path = self.temp_dir / output_filename
+        return self._download_direct(video_url, self.temp_dir / output_filename)
+    
+    def _download_direct(self, video_url: str, output_path: Path, partial_path: Optional[Path] = None) -> str:
+        """
+        通过 HTTP 直接下载视频（大块流式写入，支持断点续传和分段并行）
         
-        try:
-            # 下载视频
-            response = requests.get(video_url, stream=True, timeout=60)
-            response.raise_for_status()
-            
-            # 写入文件
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+        Args:
+            video_url: 视频下载链接
+            output_path: 输出文件路径
+            partial_path: 未完成数据的存放路径（可选），固定路径可跨进程续传
             
+        Returns:
+            本地视频文件路径
+        """
+        print(f"📥 开始下载视频: {video_url}")
+        
+        try:
+            self.downloader.download(video_url, str(output_path), partial_path=partial_path)
             print(f"✅ 视频下载完成: {output_path}")
             return str(output_path)
             
@@ -194,25 +370,23 @@ class VideoAnalyzer:
         print(f"☁️  开始上传视频到 Gemini API: {video_path}")
         
         try:
-            # 上传文件
-            video_file = genai.upload_file(path=video_path)
+            video_path = self.prepare_upload(video_path)
+            
+            # 相同内容的视频已上传且仍有效时直接复用
+            video_file, content_hash = self.find_uploaded_file(video_path)
+            if video_file is not None:
+                return video_file
+            
+            # 上传文件（负载最低的后端，之后对该文件的调用固定使用这个后端）
+            video_file, backend = self.gemini_pool.upload(video_path)
             print(f"✅ 视频上传成功，文件名: {video_file.name}")
             print(f"⏳ 等待 Gemini 处理视频...")
             
-            # 关键：等待文件状态变为 ACTIVE
-            start_time = time.time()
-            while video_file.state.name == "PROCESSING":
-                elapsed_time = time.time() - start_time
-                
-                if elapsed_time > max_wait_time:
-                    raise TimeoutError(f"视频处理超时（超过 {max_wait_time} 秒）")
-                
-                print(f"  状态: {video_file.state.name}，已等待 {int(elapsed_time)} 秒...")
-                time.sleep(5)  # 每 5 秒检查一次
-                video_file = genai.get_file(video_file.name)
-            
-            if video_file.state.name == "FAILED":
-                raise ValueError(f"视频处理失败: {video_file.state.name}")
+            # 关键：等待文件状态变为 ACTIVE（FAILED 或超时会抛出异常）
+            video_file = self.file_waiter.wait(
+                video_file, timeout=max_wait_time, kind='video', get_file=backend.get_file
+            )
+            self.file_registry.register(backend.namespace, content_hash, video_file)
             
             print(f"✅ 视频处理完成，状态: {video_file.state.name}")
             return video_file
@@ -221,6 +395,46 @@ class VideoAnalyzer:
             print(f"❌ 视频上传或处理失败: {str(e)}")
             raise
     
+    def prepare_upload(self, video_path: str) -> str:
+        """
+        返回实际上传的文件路径（启用预处理时为转码后的缓存文件，否则为原文件）
+        """
+        if self.preprocessor is None:
+            return video_path
+        return self.preprocessor.process(video_path)
+    
+    def find_uploaded_file(self, file_path: str) -> Tuple[Optional[object], str]:
+        """
+        在登记表中查找内容相同、仍然有效的已上传文件（依次查找后端池中每个凭证）
+        
+        Args:
+            file_path: 本地文件路径
+            
+        Returns:
+            (ACTIVE 状态的 Gemini File 对象或 None, 本地文件内容哈希)
+        """
+        content_hash = file_content_hash(file_path)
+        for backend in self.gemini_pool.backends:
+            entry = self.file_registry.lookup(backend.namespace, content_hash)
+            if entry is None:
+                continue
+            
+            try:
+                remote_file = backend.governor.call(backend.get_file, entry['file_name'])
+            except Exception as e:
+                print(f"⚠️ 已登记的 Gemini 文件不可用: {entry['file_name']} ({e})")
+                remote_file = None
+            
+            if remote_file is None or remote_file.state.name != "ACTIVE":
+                self.file_registry.forget(backend.namespace, content_hash)
+                continue
+            
+            self.gemini_pool.pin(remote_file, backend)
+            print(f"♻️  复用已上传的 Gemini 文件: {remote_file.name}")
+            return remote_file, content_hash
+        
+        return None, content_hash
+    
     def extract_audio(self, video_path: str) -> str:
         """
         从视频中提取音频
@@ -275,6 +489,7 @@ class VideoAnalyzer:
             
             # 调用 Whisper API
             print("📤 正在上传音频到 Whisper API...")
+            get_upstream_limiter().acquire('whisper')
             with open(audio_path, 'rb') as audio_file:
                 response = self.openai_client.audio.transcriptions.create(
                     model="whisper-1",
@@ -286,33 +501,13 @@ class VideoAnalyzer:
             print(f"✅ Whisper API 转录成功")
             
             # 解析 Whisper 响应
-            transcript = []
-            if hasattr(response, 'segments') and response.segments:
-                for segment in response.segments:
-                    # 将秒转换为 MM:SS 格式
-                    start_time = int(segment['start'])
-                    minutes = start_time // 60
-                    seconds = start_time % 60
-                    timestamp = f"{minutes:02d}:{seconds:02d}"
-                    
-                    transcript.append({
-                        "timestamp": timestamp,
-                        "text": segment['text'].strip()
-                    })
-                
+            transcript = self._parse_whisper_response(response)
+            if transcript:
                 print(f"✅ 转录完成，共 {len(transcript)} 条记录")
                 for item in transcript[:3]:  # 打印前3条
                     print(f"  [{item['timestamp']}] {item['text'][:50]}...")
             else:
-                # 如果没有 segments，使用整体文本
-                if hasattr(response, 'text') and response.text:
-                    transcript.append({
-                        "timestamp": "00:00",
-                        "text": response.text.strip()
-                    })
-                    print(f"✅ 转录完成（无时间戳分段）")
-                else:
-                    print("⚠️ 未检测到语音内容")
+                print("⚠️ 未检测到语音内容")
             
             return transcript
             
@@ -326,7 +521,7 @@ class VideoAnalyzer:
         """
         音频转录（自动选择最佳方法）
         
-        优先使用 OpenAI Whisper API（更准确），如果不可用则使用 Gemini
+        配置了本地转录后端时优先使用；否则优先使用 OpenAI Whisper API（更准确），如果不可用则使用 Gemini
         
         Args:
             audio_path: 音频文件路径
@@ -334,6 +529,13 @@ class VideoAnalyzer:
         Returns:
             转录结果列表，格式: [{"timestamp": "00:00", "text": "..."}]
         """
+        # 配置了本地转录后端时优先使用（离线、无上传）
+        if self.transcriber:
+            try:
+                return self.transcriber.transcribe_file(audio_path)
+            except Exception as e:
+                print(f"⚠️ 本地转录失败: {e}，尝试使用在线 API...")
+        
         # 优先使用 Whisper API
         if self.openai_client:
             transcript = self.transcribe_audio_with_whisper(audio_path)
@@ -362,81 +564,28 @@ class VideoAnalyzer:
                 print(f"❌ 音频文件不存在: {audio_path}")
                 return []
             
-            # 上传音频到 Gemini
-            print(f"📤 正在上传音频...")
-            audio_file = genai.upload_file(path=audio_path)
-            print(f"✅ 音频上传成功: {audio_file.name}")
-            
-            # 等待处理
-            max_wait = 30  # 最多等待 30 秒
-            wait_count = 0
-            while audio_file.state.name == "PROCESSING" and wait_count < max_wait:
-                time.sleep(1)
-                audio_file = genai.get_file(audio_file.name)
-                wait_count += 1
-            
-            if audio_file.state.name == "PROCESSING":
-                print("❌ 音频处理超时")
-                return []
+            # 上传音频到 Gemini（相同内容已上传且有效时直接复用）
+            audio_file, content_hash = self.find_uploaded_file(audio_path)
+            if audio_file is None:
+                print(f"📤 正在上传音频...")
+                audio_file, backend = self.gemini_pool.upload(audio_path)
+                print(f"✅ 音频上传成功: {audio_file.name}")
+                
+                # 等待处理（最多 30 秒）
+                try:
+                    audio_file = self.file_waiter.wait(
+                        audio_file, timeout=30, kind='audio', get_file=backend.get_file
+                    )
+                except TimeoutError:
+                    print("❌ 音频处理超时")
+                    return []
+                self.file_registry.register(backend.namespace, content_hash, audio_file)
             
             print(f"✅ 音频处理完成，状态: {audio_file.state.name}")
             
-            # 调用 Gemini 进行转录
-            prompt = """请听这段音频，并将其中的语音内容转录为文字。
-
-请按照以下 JSON 格式返回：
-```json
-{
-  "transcript": [
-    {"timestamp": "00:00", "text": "第一句话的内容"},
-    {"timestamp": "00:05", "text": "第二句话的内容"}
-  ]
-}
-```
-
-注意：
-1. 时间戳格式为 MM:SS
-2. 每 5-10 秒分一段
-3. 保持原始语言
-4. 如果没有语音，返回空数组
-5. 只返回 JSON，不要其他解释"""
-            
             print("🤖 正在调用 Gemini API 进行转录...")
-            response = self.model.generate_content([audio_file, prompt])
-            response_text = response.text.strip()
-            
-            print(f"📝 Gemini 响应: {response_text[:200]}...")  # 打印前 200 字符
-            
-            # 解析 JSON
-            transcript = []
-            try:
-                # 尝试直接解析
-                result = json.loads(response_text)
-                transcript = result.get('transcript', [])
-                print(f"✅ JSON 解析成功，共 {len(transcript)} 条记录")
-            except json.JSONDecodeError as e:
-                print(f"⚠️ JSON 解析失败: {str(e)}，尝试提取...")
-                # 提取 JSON 代码块
-                import re
-                json_match = re.search(r'```(?:json)?\s*({.*?})\s*```', response_text, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group(1))
-                    transcript = result.get('transcript', [])
-                    print(f"✅ 从代码块提取成功，共 {len(transcript)} 条记录")
-                else:
-                    # 查找第一个 { 和最后一个 }
-                    start_idx = response_text.find('{')
-                    end_idx = response_text.rfind('}')
-                    if start_idx != -1 and end_idx != -1:
-                        json_str = response_text[start_idx:end_idx+1]
-                        try:
-                            result = json.loads(json_str)
-                            transcript = result.get('transcript', [])
-                            print(f"✅ 手动提取成功，共 {len(transcript)} 条记录")
-                        except:
-                            print("❌ 无法解析提取的 JSON")
-                    else:
-                        print("❌ 响应中未找到 JSON 格式")
+            response = self.gemini_pool.generate([audio_file, TRANSCRIPT_PROMPT], file=audio_file)
+            transcript = self._parse_gemini_transcript(response.text.strip())
             
             # 验证转录结果
             if transcript and len(transcript) > 0:
@@ -455,13 +604,319 @@ class VideoAnalyzer:
             traceback.print_exc()
             return []
     
-    def analyze_video_structure(self, video_url: str, cleanup: bool = True) -> Dict:
+    def _parse_whisper_response(self, response, offset_seconds: float = 0) -> List[Dict]:
+        """
+        解析 Whisper verbose_json 响应
+        
+        Args:
+            response: Whisper API 响应
+            offset_seconds: 时间戳偏移（分块转录时为该块的起始时间）
+            
+        Returns:
+            [{"timestamp": "00:00", "text": "..."}]
+        """
+        transcript = []
+        segments = getattr(response, 'segments', None)
+        if segments:
+            for segment in segments:
+                start = segment['start'] if isinstance(segment, dict) else segment.start
+                text = segment['text'] if isinstance(segment, dict) else segment.text
+                transcript.append({
+                    "timestamp": format_timestamp(start + offset_seconds),
+                    "text": text.strip()
+                })
+        elif getattr(response, 'text', None):
+            # 如果没有 segments，使用整体文本
+            transcript.append({
+                "timestamp": format_timestamp(offset_seconds),
+                "text": response.text.strip()
+            })
+        return transcript
+    
+    def _parse_gemini_transcript(self, response_text: str) -> List[Dict]:
+        """
+        从 Gemini 转录响应中解析 transcript 数组
+        
+        Args:
+            response_text: Gemini 响应文本
+            
+        Returns:
+            [{"timestamp": "00:00", "text": "..."}]，解析失败返回空列表
+        """
+        print(f"📝 Gemini 响应: {response_text[:200]}...")  # 打印前 200 字符
+        
+        try:
+            transcript = parse_json_response(response_text).get('transcript', [])
+            print(f"✅ JSON 解析成功，共 {len(transcript)} 条记录")
+        except JSONStreamError as e:
+            print(f"❌ 无法解析转录结果: {e}")
+            transcript = []
+        return transcript
+    
+    def transcribe_video(
+        self,
+        video_path: str,
+        chunk_seconds: float = 30,
+        keep_audio_path: Optional[str] = None,
+        max_workers: int = 4,
+        on_segments: Optional[Callable[[List[Dict]], None]] = None
+    ) -> List[Dict]:
+        """
+        流式转录：ffmpeg 管道输出 PCM，每凑满一块立即提交转录，解码与上传并行进行
+        
+        与 extract_audio + transcribe_audio 相比不写中间 MP3 文件，也不必等整段音频解码完成
+        
+        Args:
+            video_path: 视频文件路径
+            chunk_seconds: 每块音频时长（秒），默认 30
+            keep_audio_path: 同时保留一份 MP3 的路径（可选，默认不落盘）
+            max_workers: 同时转录的块数
+            on_segments: 每个音频块转录完成时的回调（可选），参数为该块的转录结果；
+                         块之间按完成顺序回调，不保证时间顺序
+            
+        Returns:
+            转录结果列表，格式: [{"timestamp": "00:00", "text": "..."}]
+        """
+        print(f"🎵 流式提取音频并转录: {video_path}")
+        
+        if self.transcriber:
+            try:
+                # 小块解码，由本地转录器按静音边界重新切分
+                transcript = self.transcriber.transcribe_chunks(
+                    iter_pcm_chunks(video_path, chunk_seconds=5, keep_audio_path=keep_audio_path)
+                )
+                if on_segments and transcript:
+                    on_segments(transcript)
+                return transcript
+            except Exception as e:
+                print(f"⚠️ 本地转录失败: {e}，尝试使用在线 API...")
+        
+        def notify(future):
+            segments = self._valid_segments(future.result())
+            if segments:
+                on_segments(segments)
+        
+        futures = []
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='transcribe-chunk') as pool:
+            for chunk in iter_pcm_chunks(video_path, chunk_seconds, keep_audio_path=keep_audio_path):
+                future = pool.submit(self._transcribe_chunk, chunk)
+                if on_segments:
+                    future.add_done_callback(notify)
+                futures.append(future)
+            chunk_results = [future.result() for future in futures]
+        
+        transcript = self._valid_segments([item for items in chunk_results for item in items])
+        if transcript:
+            print(f"✅ 转录完成，共 {len(futures)} 个音频块，{len(transcript)} 条记录")
+        else:
+            print("⚠️ 未检测到语音内容")
+        return transcript
+    
+    @staticmethod
+    def _valid_segments(segments: List[Dict]) -> List[Dict]:
+        """过滤空文本和错误信息"""
+        return [t for t in segments if t.get('text') and '转录失败' not in t['text']]
+    
+    def _transcribe_chunk(self, chunk: AudioChunk) -> List[Dict]:
+        """
+        转录单个音频块（优先 Whisper，出错时改用 Gemini 内联音频），时间戳加上块的起始偏移
+        """
+        wav = chunk.to_wav()
+        
+        if self.openai_client:
+            try:
+                get_upstream_limiter().acquire('whisper')
+                response = self.openai_client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=(f"chunk_{chunk.index}.wav", wav, 'audio/wav'),
+                    response_format="verbose_json",
+                    timestamp_granularities=["segment"]
+                )
+                return self._parse_whisper_response(response, chunk.start_seconds)
+            except Exception as e:
+                print(f"⚠️ 第 {chunk.index + 1} 块 Whisper 转录失败: {e}，尝试使用 Gemini...")
+        
+        try:
+            # 小块音频直接内联发送，省去 upload_file 和状态轮询
+            response = self.gemini_pool.generate([
+                {'mime_type': 'audio/wav', 'data': wav},
+                TRANSCRIPT_PROMPT
+            ])
+            items = self._parse_gemini_transcript(response.text.strip())
+        except Exception as e:
+            print(f"❌ 第 {chunk.index + 1} 块转录失败: {e}")
+            return []
+        
+        return [
+            {
+                "timestamp": format_timestamp(parse_timestamp(item.get('timestamp', '00:00')) + chunk.start_seconds),
+                "text": str(item.get('text', '')).strip()
+            }
+            for item in items if isinstance(item, dict)
+        ]
+    
+    def build_analysis_prompt(self, features: Optional[Dict] = None) -> str:
+        """
+        组合系统提示词和用户提示词
+        
+        因为 Google AI Studio API (v1) 不支持 system_instruction，系统提示词需要拼接在用户提示词前面
+        
+        Args:
+            features: 本地信号（可选），提供时作为实测数据写入 Prompt
+        
+        Returns:
+            完整的分析 Prompt
+        """
+        measured = f"{format_features_for_prompt(features)}\n\n" if features else ""
+        return f"""{self.system_prompt}
+
+---
+
+{measured}Now, please analyze the following video according to the framework above.
+Return your analysis in valid JSON format.
+"""
+    
+    def build_keyframe_prompt(self) -> str:
+        """
+        关键帧模式的 Prompt：说明输入是带时间戳的关键帧、镜头切换时间和转录，而不是视频文件
+        
+        Returns:
+            完整的分析 Prompt
+        """
+        return f"""{self.system_prompt}
+
+---
+
+You will NOT receive the video file. Instead you receive, in order:
+1. Keyframes sampled locally from the video, each preceded by its timestamp in seconds:
+   one frame every 0.5 seconds for the first 10 seconds (the hook and retention window),
+   then one frame per detected scene cut plus periodic frames for long shots.
+2. The list of scene-cut timestamps detected locally (use it to judge editing pace).
+3. The speech transcript with timestamps.
+
+Now, please analyze the video according to the framework above using only these inputs.
+Return your analysis in valid JSON format.
+"""
+    
+    def build_keyframe_contents(
+        self,
+        keyframes: KeyframeSet,
+        transcript: Optional[List[Dict]] = None,
+        prompt: Optional[str] = None
+    ) -> List:
+        """
+        组合关键帧模式一次 generate_content 调用的全部内容
+        
+        Args:
+            keyframes: 关键帧采样结果
+            transcript: 转录结果（可选）
+            prompt: 分析 Prompt（可选，默认使用 build_keyframe_prompt）
+            
+        Returns:
+            contents 列表（文本与 JPEG 图片交替）
+        """
+        contents: List = [prompt or self.build_keyframe_prompt()]
+        for frame in keyframes.keyframes:
+            label = 'scene cut' if frame.reason == 'cut' else frame.reason
+            contents.append(f"[{frame.timestamp:.1f}s] ({label})")
+            contents.append({'mime_type': 'image/jpeg', 'data': frame.jpeg})
+        
+        cuts = ', '.join(f"{t:.1f}s" for t in keyframes.cut_times) or 'none detected'
+        contents.append(f"Video duration: {keyframes.duration:.1f}s. Scene cuts: {cuts}.")
+        
+        lines = [f"[{item.get('timestamp', '00:00')}] {item.get('text', '')}" for item in transcript or []]
+        contents.append("Transcript:\n" + ("\n".join(lines) if lines else "(no speech detected)"))
+        return contents
+    
+    def generate_keyframe_analysis(
+        self,
+        keyframes: KeyframeSet,
+        transcript: Optional[List[Dict]] = None,
+        on_section: Optional[Callable[[str, object], None]] = None
+    ) -> Dict:
+        """
+        关键帧模式：关键帧 + 转录在一次流式 generate_content 调用中发送（不上传视频文件）
+        
+        Args:
+            keyframes: 关键帧采样结果
+            transcript: 转录结果（可选）
+            on_section: 字段回调 (key, value)（可选）
+            
+        Returns:
+            完整的分析结果
+        """
+        contents = self.build_keyframe_contents(keyframes, transcript)
+        
+        def stream_and_parse(backend):
+            response = backend.generate(contents, stream=True)
+            return parse_stream(response, on_section)
+        
+        try:
+            # 不涉及已上传文件，可路由到任意健康后端
+            return self.gemini_pool.call(stream_and_parse)
+        except JSONStreamError as e:
+            print(f"⚠️  JSON 解析失败，原始响应: {e.text[:200]}")
+            raise
+    
+    def generate_analysis(
+        self,
+        video_file,
+        prompt: Optional[str] = None,
+        on_section: Optional[Callable[[str, object], None]] = None
+    ) -> Dict:
+        """
+        流式调用 Gemini 分析视频，每个顶层字段（structure_breakdown 等）生成完毕即回调 on_section
+        
+        Args:
+            video_file: 已处理完成的 Gemini File 对象
+            prompt: 分析 Prompt（可选，默认使用 build_analysis_prompt）
+            on_section: 字段回调 (key, value)（可选），用于在生成结束前展示部分结果
+            
+        Returns:
+            完整的分析结果
+            
+        Raises:
+            ValueError: Gemini 返回的不是有效的 JSON（JSONStreamError，text 属性为原始响应）
+        """
+        prompt = prompt or self.build_analysis_prompt()
+        
+        def stream_and_parse(backend):
+            # 流式响应在同一次尝试内消费完，中途断开时整体重试（已产出的字段会再次回调）
+            response = backend.generate([video_file, prompt], stream=True)
+            return parse_stream(response, on_section)
+        
+        try:
+            return self.gemini_pool.call(stream_and_parse, file=video_file)
+        except JSONStreamError as e:
+            print(f"⚠️  JSON 解析失败，原始响应: {e.text[:200]}")
+            raise
+    
+    def cleanup_temp_file(self, file_path: Optional[str]):
+        """
+        删除临时文件（忽略不存在的文件和下载缓存中的文件）
+        
+        Args:
+            file_path: 文件路径
+        """
+        if self.download_cache and self.download_cache.owns(file_path):
+            # 下载缓存中的文件由缓存按字节预算统一淘汰
+            return
+        
+        if file_path and os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+                print(f"🧹 已清理临时文件: {file_path}")
+            except Exception as e:
+                print(f"⚠️  清理临时文件失败: {e}")
+    
+    def analyze_video_structure(self, video_url: str, cleanup: bool = True, use_cache: bool = True) -> Dict:
         """
         完整的视频分析流程
         
         Args:
             video_url: 视频下载链接（来自 Sprint 1 的 TikTokFetcher）
             cleanup: 是否在分析后删除临时文件，默认 True
+            use_cache: 是否读写分析结果缓存（需在初始化时传入 cache），默认 True
             
         Returns:
             包含视频分析结果的字典，格式如下：
@@ -476,44 +931,65 @@ class VideoAnalyzer:
         print("🎬 开始视频结构分析")
         print("=" * 60)
         
+        if use_cache and self.cache:
+            cached_result = self.cache.get(video_url)
+            if cached_result is not None:
+                self._print_analysis_summary(cached_result)
+                return cached_result
+        
         local_video_path = None
         
         try:
             # 步骤 1: 下载视频
             local_video_path = self.download_video(video_url)
             
-            # 步骤 2: 上传到 Gemini 并等待处理
-            video_file = self.upload_to_gemini(local_video_path)
-            
-            # 步骤 3: 调用 Gemini API 进行分析
-            print("🤖 开始 AI 分析...")
-            
-            # 组合系统提示词和用户提示词
-            # 因为 Google AI Studio API (v1) 不支持 system_instruction
-            combined_prompt = f"""{self.system_prompt}
-
----
-
-Now, please analyze the following video according to the framework above.
-Return your analysis in valid JSON format.
-"""
+            # 近似重复视频直接复用已有分析结果
+            fingerprint, match = self.find_near_duplicate(video_url, local_video_path, lookup=use_cache)
+            if match is not None:
+                analysis_result = match.annotated_analysis()
+                self._print_analysis_summary(analysis_result)
+                if use_cache and self.cache:
+                    self.cache.set(video_url, analysis_result)
+                self.index_analysis(video_url, analysis_result)
+                return analysis_result
             
-            response = self.model.generate_content([video_file, combined_prompt])
+            # 本地信号与上传 / 采样并行计算
+            features_future = self.feature_extractor.submit(local_video_path) if self.feature_extractor else None
             
-            # 步骤 4: 解析 JSON 响应
-            try:
-                analysis_result = json.loads(response.text)
-                print("✅ 分析完成！")
+            if self.analysis_mode == 'keyframes':
+                # 步骤 2: 本地采样关键帧并转录（不上传视频）
+                keyframes = sample_keyframes(local_video_path)
+                try:
+                    transcript = self.transcribe_video(local_video_path)
+                except Exception as e:
+                    print(f"⚠️ 转录失败: {e}")
+                    transcript = []
                 
-                # 打印关键信息
-                self._print_analysis_summary(analysis_result)
+                # 步骤 3: 关键帧 + 转录一次发送给 Gemini
+                print("🤖 开始 AI 分析（关键帧模式）...")
+                analysis_result = self.generate_keyframe_analysis(keyframes, transcript)
+                features = self._feature_result(features_future)
+            else:
+                # 步骤 2: 上传到 Gemini 并等待处理
+                video_file = self.upload_to_gemini(local_video_path)
                 
-                return analysis_result
+                # 步骤 3: 流式调用 Gemini API 进行分析（边生成边解析 JSON）
+                print("🤖 开始 AI 分析...")
                 
-            except json.JSONDecodeError as e:
-                print(f"⚠️  JSON 解析失败，返回原始文本")
-                print(f"原始响应: {response.text}")
-                raise ValueError(f"Gemini 返回的不是有效的 JSON: {e}")
+                features = self._feature_result(features_future)
+                analysis_result = self.generate_analysis(video_file, prompt=self.build_analysis_prompt(features))
+            apply_local_features(analysis_result, features)
+            print("✅ 分析完成！")
+            
+            # 打印关键信息
+            self._print_analysis_summary(analysis_result)
+            
+            if use_cache and self.cache:
+                self.cache.set(video_url, analysis_result)
+            self.remember_analysis(video_url, fingerprint, analysis_result)
+            self.index_analysis(video_url, analysis_result)
+            
+            return analysis_result
             
         except Exception as e:
             print(f"❌ 视频分析失败: {str(e)}")
@@ -521,12 +997,72 @@ Return your analysis in valid JSON format.
         
         finally:
             # 清理临时文件
-            if cleanup and local_video_path and os.path.exists(local_video_path):
-                try:
-                    os.remove(local_video_path)
-                    print(f"🧹 已清理临时文件: {local_video_path}")
-                except Exception as e:
-                    print(f"⚠️  清理临时文件失败: {e}")
+            if cleanup:
+                self.cleanup_temp_file(local_video_path)
+    
+    @staticmethod
+    def _feature_result(future) -> Optional[Dict]:
+        """等待本地信号，失败时返回 None（本地信号是可选的，不影响分析）"""
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"⚠️ 本地信号提取失败: {e}")
+            return None
+    
+    def find_near_duplicate(
+        self,
+        video_url: str,
+        video_path: str,
+        lookup: bool = True
+    ) -> Tuple[Optional[VideoFingerprint], Optional[DuplicateMatch]]:
+        """
+        计算视频指纹并查找近似重复的已分析视频（未启用索引或指纹计算失败时返回 (None, None)）
+        
+        Args:
+            video_url: 视频 URL（同一视频 ID 的旧记录不算重复，由分析结果缓存负责）
+            video_path: 本地视频文件路径
+            lookup: 是否查找匹配（False 时只计算指纹，用于强制重新分析后登记）
+        
+        Returns:
+            (指纹, 匹配)
+        """
+        if self.duplicate_index is None:
+            return None, None
+        try:
+            fingerprint = compute_fingerprint(video_path)
+        except Exception as e:
+            print(f"⚠️ 视频指纹计算失败: {e}")
+            return None, None
+        if not lookup:
+            return fingerprint, None
+        try:
+            match = self.duplicate_index.find(
+                fingerprint, self.analysis_fingerprint, exclude_video_id=extract_video_id(video_url)
+            )
+        except Exception as e:
+            print(f"⚠️ 近似重复索引查询失败: {e}")
+            match = None
+        return fingerprint, match
+    
+    def remember_analysis(self, video_url: str, fingerprint: Optional[VideoFingerprint], analysis: Dict):
+        """把分析结果登记到近似重复索引（失败不影响分析）"""
+        if self.duplicate_index is None or fingerprint is None:
+            return
+        try:
+            self.duplicate_index.add(video_url, fingerprint, analysis, self.analysis_fingerprint)
+        except Exception as e:
+            print(f"⚠️ 近似重复索引写入失败: {e}")
+    
+    def index_analysis(self, video_url: str, analysis: Dict, transcript: Optional[List[Dict]] = None):
+        """把分析结果（和转录）写入检索索引（未启用时跳过，失败不影响分析）"""
+        if self.search_index is None:
+            return
+        try:
+            self.search_index.add(video_url, analysis, transcript)
+        except Exception as e:
+            print(f"⚠️ 检索索引写入失败: {e}")
     
     def _print_analysis_summary(self, analysis: Dict):
         """打印分析结果摘要"""
@@ -0,0 +1,280 @@
+"""
+Video Features
+本地预分析：在 CPU 进程池中计算镜头切换时间、每秒切换数、画面运动量、响度包络、开口说话时间和首帧直方图，
+结果附加到分析报告并可写入 Prompt；剪辑节奏等可计算字段不再依赖 Gemini 推断
+"""
+
+import os
+import time
+import threading
+import subprocess
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .audio_stream import SAMPLE_RATE, build_ffmpeg_command
+from .frame_sampler import ANALYSIS_FPS, decode_frames, detect_cuts, frame_histograms, histogram_distances
+from .transcribers import _frame_energy
+
+
+# 响度包络的窗口长度（毫秒）
+LOUDNESS_WINDOW_MS = 100
+
+# 剪辑节奏阈值：平均镜头时长 ≤ 2 秒为 Fast，≤ 5 秒为 Medium，其余为 Slow
+FAST_PACE_CUTS_PER_SECOND = 0.5
+MEDIUM_PACE_CUTS_PER_SECOND = 0.2
+
+# Hook 窗口（秒）
+HOOK_SECONDS = 3
+
+
+def editing_pace(cuts_per_second: float) -> str:
+    """按每秒切换数划分剪辑节奏（Fast / Medium / Slow，与分析结果的 editing_pace 取值一致）"""
+    if cuts_per_second >= FAST_PACE_CUTS_PER_SECOND:
+        return 'Fast'
+    if cuts_per_second >= MEDIUM_PACE_CUTS_PER_SECOND:
+        return 'Medium'
+    return 'Slow'
+
+
+def motion_energy(frames: np.ndarray, cuts: List[int]) -> np.ndarray:
+    """
+    相邻帧灰度平均绝对差（0-1），镜头切换帧记为 0（切换不算运动）
+
+    Returns:
+        float32 数组 (N,)，第一帧为 0
+    """
+    if len(frames) < 2:
+        return np.zeros(len(frames), dtype=np.float32)
+    gray = frames.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    diff = np.abs(np.diff(gray, axis=0)).mean(axis=(1, 2)) / 255.0
+    energy = np.concatenate([[0.0], diff]).astype(np.float32)
+    energy[cuts] = 0.0
+    return energy
+
+
+def per_second(values: np.ndarray, fps: float = ANALYSIS_FPS) -> List[float]:
+    """按秒取平均（末尾不足一秒的部分单独一项）"""
+    step = max(1, int(round(fps)))
+    return [round(float(values[i:i + step].mean()), 4) for i in range(0, len(values), step)]
+
+
+def decode_pcm(video_path: str, timeout: float = 300) -> np.ndarray:
+    """
+    解码音轨为 16 kHz 单声道 int16；没有音轨时返回空数组
+
+    Raises:
+        ValueError: ffmpeg 解码失败（音轨缺失以外的错误）
+    """
+    completed = subprocess.run(
+        build_ffmpeg_command(video_path), capture_output=True, timeout=timeout, stdin=subprocess.DEVNULL
+    )
+    if completed.returncode != 0:
+        message = completed.stderr.decode(errors='replace').strip()
+        if 'does not contain any stream' in message or 'matches no streams' in message:
+            return np.zeros(0, dtype=np.int16)
+        raise ValueError(f"音频解码失败: {message[-200:] or completed.returncode}")
+    usable = len(completed.stdout) - len(completed.stdout) % 2
+    return np.frombuffer(completed.stdout[:usable], dtype=np.int16)
+
+
+def speech_onset(loudness_db: np.ndarray, window_ms: int = LOUDNESS_WINDOW_MS, min_ms: int = 300) -> Optional[int]:
+    """
+    开口说话时间：响度持续 min_ms 以上高于（底噪 + 12 dB，且不低于 -45 dBFS）的第一个窗口
+
+    Returns:
+        毫秒，未检测到时返回 None
+    """
+    if len(loudness_db) == 0:
+        return None
+    threshold = max(float(np.percentile(loudness_db, 10)) + 12, -45.0)
+    run = max(1, min_ms // window_ms)
+    loud = (loudness_db > threshold).astype(np.int32)
+    if len(loud) < run:
+        return None
+    # 长度为 run 的滑动窗口全部超过阈值
+    sustained = np.convolve(loud, np.ones(run, dtype=np.int32), mode='valid') == run
+    hits = np.flatnonzero(sustained)
+    return int(hits[0] * window_ms) if len(hits) else None
+
+
+def extract_features(video_path: str) -> Dict:
+    """
+    计算视频的本地信号（在工作进程中执行）
+
+    Args:
+        video_path: 本地视频文件路径
+
+    Returns:
+        {'duration_ms', 'cut_times_ms', 'cut_count', 'cuts_per_second', 'average_shot_ms', 'editing_pace',
+         'motion_mean', 'motion_per_second', 'hook', 'loudness_window_ms', 'loudness_db', 'loudness_mean_db',
+         'speech_onset_ms', 'first_frame_histogram', 'extraction_ms'}
+    """
+    start = time.perf_counter()
+
+    frames = decode_frames(video_path)
+    duration = len(frames) / ANALYSIS_FPS
+    histograms = frame_histograms(frames)
+    cuts = detect_cuts(histogram_distances(histograms))
+    motion = motion_energy(frames, cuts)
+    cuts_per_second = len(cuts) / duration if duration else 0.0
+    hook_frames = int(HOOK_SECONDS * ANALYSIS_FPS)
+
+    pcm = decode_pcm(video_path)
+    window = SAMPLE_RATE * LOUDNESS_WINDOW_MS // 1000
+    loudness = _frame_energy(pcm, window)
+
+    return {
+        'duration_ms': int(duration * 1000),
+        'cut_times_ms': [int(index * 1000 / ANALYSIS_FPS) for index in cuts],
+        'cut_count': len(cuts),
+        'cuts_per_second': round(cuts_per_second, 3),
+        'average_shot_ms': int(duration * 1000 / (len(cuts) + 1)) if duration else 0,
+        'editing_pace': editing_pace(cuts_per_second),
+        'motion_mean': round(float(motion.mean()), 4) if len(motion) else 0.0,
+        'motion_per_second': per_second(motion),
+        'hook': {
+            'cuts': sum(1 for index in cuts if index < hook_frames),
+            'motion_mean': round(float(motion[:hook_frames].mean()), 4) if len(motion) else 0.0,
+        },
+        'loudness_window_ms': LOUDNESS_WINDOW_MS,
+        'loudness_db': [round(float(value), 1) for value in loudness],
+        'loudness_mean_db': round(float(loudness.mean()), 1) if len(loudness) else None,
+        'speech_onset_ms': speech_onset(loudness),
+        'first_frame_histogram': [round(float(value), 4) for value in histograms[0]] if len(histograms) else [],
+        'extraction_ms': int((time.perf_counter() - start) * 1000),
+    }
+
+
+def format_features_for_prompt(features: Dict) -> str:
+    """把本地信号整理为 Prompt 片段（剪辑节奏要求 Gemini 原样使用）"""
+    cut_times = ', '.join(f"{ms / 1000:.1f}s" for ms in features['cut_times_ms'][:40]) or 'none'
+    onset = features.get('speech_onset_ms')
+    lines = [
+        "Locally measured signals (deterministic measurements, treat them as ground truth):",
+        f"- Duration: {features['duration_ms'] / 1000:.1f}s",
+        f"- Scene cuts: {features['cut_count']} ({features['cuts_per_second']:.2f} per second, "
+        f"average shot {features['average_shot_ms'] / 1000:.1f}s) at {cut_times}",
+        f"- Hook window (0-{HOOK_SECONDS}s): {features['hook']['cuts']} cuts, "
+        f"motion {features['hook']['motion_mean']:.3f} (video average {features['motion_mean']:.3f})",
+        f"- Speech starts at: {f'{onset / 1000:.1f}s' if onset is not None else 'no speech detected'}",
+        f"- Editing pace (computed): {features['editing_pace']} "
+        "-- use exactly this value for creative_insight.editing_pace",
+    ]
+    return '\n'.join(lines)
+
+
+def apply_local_features(analysis: Dict, features: Optional[Dict]) -> Dict:
+    """
+    把本地信号写入分析结果：附加 local_features，editing_pace 使用本地计算值
+
+    Args:
+        analysis: Gemini 分析结果（原地修改）
+        features: extract_features 的结果（可选，None 时不做修改）
+    """
+    if not features or not isinstance(analysis, dict):
+        return analysis
+    analysis['local_features'] = features
+    insight = analysis.get('creative_insight')
+    if isinstance(insight, dict):
+        insight['editing_pace'] = features['editing_pace']
+    return analysis
+
+
+class FeatureExtractor:
+    """
+    本地信号提取器
+
+    - 每个视频在进程池中独立计算（解码和 NumPy 运算不受 GIL 限制，与上传 / 转录并行）
+    - 进程池在第一次提交时创建
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        """
+        Args:
+            workers: 工作进程数，默认读取 FEATURE_WORKERS（默认 CPU 核数 / 2）
+        """
+        cpu_count = os.cpu_count() or 2
+        self.workers = workers or int(os.getenv('FEATURE_WORKERS', str(max(cpu_count // 2, 1))))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+        self.completed = 0
+        self.failures = 0
+        self.total_ms = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                print(f"✅ 本地信号提取已启用（{self.workers} 个进程）")
+            return self._pool
+
+    def submit(self, video_path: str) -> Future:
+        """
+        提交一个视频
+
+        Returns:
+            concurrent.futures.Future，结果为 extract_features 的返回值
+        """
+        future = self._get_pool().submit(extract_features, video_path)
+        future.add_done_callback(self._record)
+        return future
+
+    def _record(self, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            self.failures += 1
+            return
+        self.completed += 1
+        self.total_ms += future.result()['extraction_ms']
+
+    def extract(self, video_path: str) -> Optional[Dict]:
+        """同步提取，失败时返回 None（本地信号是可选的，不影响分析）"""
+        try:
+            return self.submit(video_path).result()
+        except Exception as e:
+            print(f"⚠️ 本地信号提取失败: {e}")
+            return None
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'workers', 'completed', 'failures', 'avg_ms'}
+        """
+        return {
+            'workers': self.workers,
+            'completed': self.completed,
+            'failures': self.failures,
+            'avg_ms': int(self.total_ms / self.completed) if self.completed else None,
+        }
+
+    def close(self, wait: bool = False):
+        """
+        关闭进程池
+
+        Args:
+            wait: 是否等待工作进程退出（在 multiprocessing 子进程中调用时需要，否则子进程退出时会卡住）
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait, cancel_futures=True)
+                self._pool = None
+
+
+_default_extractor: Optional[FeatureExtractor] = None
+_default_extractor_lock = threading.Lock()
+
+
+def get_feature_extractor() -> Optional[FeatureExtractor]:
+    """
+    获取进程内共享的本地信号提取器，LOCAL_FEATURES 未开启（默认 off）时返回 None
+    """
+    global _default_extractor
+    if os.getenv('LOCAL_FEATURES', 'off').lower() not in ('1', 'on', 'true'):
+        return None
+    if _default_extractor is None:
+        with _default_extractor_lock:
+            if _default_extractor is None:
+                _default_extractor = FeatureExtractor()
+    return _default_extractor
@@ -0,0 +1,302 @@
+"""
+Video Preprocess
+上传前的视频预处理：用 ffmpeg 按预设降低分辨率、帧率和码率（可选截断时长），
+结果按源文件内容哈希缓存，缩小上传体积并缩短 Gemini 处理时间
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import subprocess
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .paths import get_data_dir
+from .remote_file_registry import file_content_hash
+
+
+@dataclass(frozen=True)
+class TranscodePreset:
+    """转码预设"""
+
+    name: str
+    max_height: int
+    fps: int
+    video_bitrate: str
+    audio_bitrate: str = '64k'
+    x264_preset: str = 'veryfast'
+    max_seconds: Optional[float] = None
+
+    def signature(self) -> str:
+        """参数摘要（参与缓存文件名，修改预设后旧缓存自动失效）"""
+        payload = json.dumps(asdict(self), sort_keys=True).encode('utf-8')
+        return hashlib.sha256(payload).hexdigest()[:12]
+
+
+# 内置预设：fast 只用 CPU、ultrafast 编码，适合绝大多数短视频分析
+PRESETS: Dict[str, TranscodePreset] = {
+    'fast': TranscodePreset('fast', max_height=480, fps=15, video_bitrate='400k',
+                            audio_bitrate='48k', x264_preset='ultrafast'),
+    'balanced': TranscodePreset('balanced', max_height=720, fps=24, video_bitrate='1200k',
+                                audio_bitrate='96k', x264_preset='veryfast'),
+    'quality': TranscodePreset('quality', max_height=1080, fps=30, video_bitrate='3000k',
+                               audio_bitrate='128k', x264_preset='faster'),
+}
+
+
+def build_transcode_command(
+    source_path: str,
+    output_path: str,
+    preset: TranscodePreset,
+    ffmpeg: str = 'ffmpeg'
+) -> List[str]:
+    """
+    构造 ffmpeg 转码命令
+
+    - 只缩小不放大（高度取 min(max_height, 原高度)，宽度按比例取偶数）
+    - 码率封顶（-maxrate / -bufsize），音频单声道 AAC
+    - +faststart 把 moov 放到文件头，便于服务端尽早开始处理
+    """
+    scale = f"scale=-2:'min({preset.max_height},ih)',fps={preset.fps}"
+    command = [
+        ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', source_path,
+        '-vf', scale,
+        '-c:v', 'libx264', '-preset', preset.x264_preset,
+        '-b:v', preset.video_bitrate, '-maxrate', preset.video_bitrate,
+        '-bufsize', preset.video_bitrate,
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', preset.audio_bitrate, '-ac', '1',
+        '-movflags', '+faststart',
+    ]
+    if preset.max_seconds:
+        command += ['-t', str(preset.max_seconds)]
+    command.append(output_path)
+    return command
+
+
+class VideoPreprocessor:
+    """
+    视频预处理器
+
+    - 缓存文件名为 <源文件内容哈希>-<预设摘要>.mp4，同一视频同一预设只转码一次
+    - 转码结果不比原文件小时记录 .skip 标记，之后直接使用原文件
+    - ffmpeg 不可用或转码失败时返回原文件（不缓存失败结果）
+    - 总大小超出预算时按最近访问时间淘汰；最近 protect_seconds 内访问过的文件不淘汰，
+      避免其他请求正在上传的文件被删除
+    """
+
+    def __init__(
+        self,
+        preset: TranscodePreset,
+        cache_dir: Optional[str] = None,
+        max_bytes: int = 1024 ** 3,
+        ffmpeg: str = 'ffmpeg',
+        timeout: float = 600,
+        protect_seconds: float = 600
+    ):
+        """
+        Args:
+            preset: 转码预设
+            cache_dir: 缓存目录（可选，默认存放在本地数据目录）
+            max_bytes: 缓存字节预算，默认 1 GB
+            ffmpeg: ffmpeg 可执行文件
+            timeout: 单次转码超时（秒）
+            protect_seconds: 最近访问保护时间（秒），默认 600
+        """
+        self.preset = preset
+        self.cache_dir = Path(cache_dir) if cache_dir else get_data_dir('preprocessed')
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ffmpeg = ffmpeg
+        self.timeout = timeout
+        self.protect_seconds = protect_seconds
+
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.transcode_seconds = 0.0
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def owns(self, file_path: Optional[str]) -> bool:
+        """判断文件是否位于预处理缓存中（缓存文件不应被调用方删除）"""
+        if not file_path:
+            return False
+        try:
+            Path(file_path).resolve().relative_to(self.cache_dir.resolve())
+            return True
+        except ValueError:
+            return False
+
+    def process(self, video_path: str) -> str:
+        """
+        返回用于上传的文件路径（命中缓存或转码成功时为缓存文件，否则为原文件）
+
+        Args:
+            video_path: 本地视频文件路径
+        """
+        key = f"{file_content_hash(video_path)[:32]}-{self.preset.signature()}"
+        target = self.cache_dir / f"{key}.mp4"
+        skip_marker = self.cache_dir / f"{key}.skip"
+
+        with self._key_lock(key):
+            try:
+                # 刷新访问时间（用于 LRU 和淘汰保护）；文件刚被淘汰时按未命中重新转码
+                os.utime(target)
+            except FileNotFoundError:
+                pass
+            else:
+                self.hits += 1
+                print(f"⚡ 命中预处理缓存: {target}")
+                return str(target)
+            if skip_marker.exists():
+                self.hits += 1
+                return video_path
+
+            self.misses += 1
+            source_size = os.path.getsize(video_path)
+            part_path = self.cache_dir / f"{key}.{uuid.uuid4().hex}.part.mp4"
+            command = build_transcode_command(video_path, str(part_path), self.preset, self.ffmpeg)
+
+            print(f"🎞️  预处理视频（{self.preset.name}: ≤{self.preset.max_height}p / {self.preset.fps}fps / {self.preset.video_bitrate}）...")
+            start = time.perf_counter()
+            try:
+                subprocess.run(command, check=True, capture_output=True, timeout=self.timeout)
+            except (OSError, subprocess.SubprocessError) as e:
+                self.failures += 1
+                part_path.unlink(missing_ok=True)
+                stderr = getattr(e, 'stderr', None)
+                detail = stderr.decode(errors='replace').strip()[-200:] if stderr else str(e)
+                print(f"⚠️ 视频预处理失败，使用原文件上传: {detail}")
+                return video_path
+            elapsed = time.perf_counter() - start
+            self.transcode_seconds += elapsed
+
+            output_size = part_path.stat().st_size
+            if output_size >= source_size:
+                self.skipped += 1
+                part_path.unlink(missing_ok=True)
+                skip_marker.touch()
+                print("ℹ️  原视频已足够小，跳过预处理")
+                return video_path
+
+            os.replace(part_path, target)
+            os.utime(target)
+            self.bytes_in += source_size
+            self.bytes_out += output_size
+            print(f"✅ 预处理完成: {source_size / 1024 ** 2:.1f} MB → {output_size / 1024 ** 2:.1f} MB（{elapsed:.1f} 秒）")
+
+        self.evict(keep=target)
+        return str(target)
+
+    def evict(self, keep: Optional[Path] = None) -> int:
+        """
+        按最近访问时间淘汰缓存文件直到总大小不超过预算
+
+        最近 protect_seconds 内访问过的文件（正在被其他请求上传）和 keep 不淘汰
+
+        Args:
+            keep: 本次刚写入、即将返回给调用方的文件（可选）
+
+        Returns:
+            淘汰的文件数
+        """
+        with self._evict_lock:
+            entries = []
+            for path in self.cache_dir.glob('*.mp4'):
+                if path.name.endswith('.part.mp4'):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+
+            total = sum(size for _, _, size in entries)
+            removed = 0
+            now = time.time()
+            for mtime, path, size in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                if path == keep or now - mtime < self.protect_seconds:
+                    continue
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            return removed
+
+    def stats(self) -> Dict:
+        """
+        Returns:
+            {'preset', 'hits', 'misses', 'skipped', 'failures', 'bytes_in', 'bytes_out', 'transcode_seconds'}
+        """
+        return {
+            'preset': self.preset.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'failures': self.failures,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'transcode_seconds': round(self.transcode_seconds, 2),
+        }
+
+
+def preset_from_env() -> Optional[TranscodePreset]:
+    """
+    按环境变量选择预设
+
+    - VIDEO_PREPROCESS_PRESET: off（默认，不预处理）/ fast / balanced / quality
+    - VIDEO_PREPROCESS_MAX_SECONDS: 截断时长（秒，可选）
+    """
+    name = os.getenv('VIDEO_PREPROCESS_PRESET', 'off').lower()
+    if name in ('', 'off', 'none'):
+        return None
+    if name not in PRESETS:
+        raise ValueError(f"未知的预处理预设: {name}（可选 {', '.join(PRESETS)}）")
+    preset = PRESETS[name]
+    max_seconds = float(os.getenv('VIDEO_PREPROCESS_MAX_SECONDS', '0') or 0)
+    if max_seconds > 0:
+        preset = TranscodePreset(**{**asdict(preset), 'max_seconds': max_seconds})
+    return preset
+
+
+_default_preprocessor: Optional[VideoPreprocessor] = None
+_default_preprocessor_lock = threading.Lock()
+
+
+def get_video_preprocessor() -> Optional[VideoPreprocessor]:
+    """
+    获取进程内共享的预处理器，未启用（VIDEO_PREPROCESS_PRESET=off）时返回 None
+
+    缓存字节预算读取 PREPROCESS_CACHE_MAX_BYTES（默认 1 GB）
+    """
+    global _default_preprocessor
+    preset = preset_from_env()
+    if preset is None:
+        return None
+    if _default_preprocessor is None:
+        with _default_preprocessor_lock:
+            if _default_preprocessor is None:
+                _default_preprocessor = VideoPreprocessor(
+                    preset,
+                    max_bytes=int(os.getenv('PREPROCESS_CACHE_MAX_BYTES', str(1024 ** 3)))
+                )
+    return _default_preprocessor
@@ -0,0 +1,78 @@
+"""
+BatchRunner 回归测试：传入共享流水线时，各阶段并发限制仍然生效
+"""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.batch_runner import BatchRunner
+from src.pipeline import AsyncVideoPipeline
+
+
+class ConcurrencyProbe:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, video_url, progress_hook=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        raise RuntimeError('download failed')
+
+
+class FakeStore:
+    def append(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        return 0
+
+
+def make_pipeline(probe, stage_limits):
+    fetcher = SimpleNamespace(fetch_video_data=lambda url: {'video_url': url})
+    analyzer = SimpleNamespace(
+        file_waiter=None, download_video_with_ytdlp=probe, cleanup_temp_file=lambda path: None
+    )
+    return AsyncVideoPipeline(fetcher, analyzer, stage_limits=stage_limits, store=FakeStore())
+
+
+def test_shared_pipeline_stage_limits_apply_across_jobs(tmp_path):
+    probe = ConcurrencyProbe()
+    pipeline = make_pipeline(probe, {'download': 2})
+    urls = [f'https://www.tiktok.com/@a/video/{i}' for i in range(12)]
+
+    def runner(name, batch):
+        return BatchRunner(
+            fetcher=pipeline.fetcher, analyzer=pipeline.analyzer, output_path=tmp_path / name,
+            prefetch_metadata=False, pipeline=pipeline
+        ), batch
+
+    jobs = [runner('a.jsonl', urls[:6]), runner('b.jsonl', urls[6:])]
+    assert jobs[0][0].stage_limits == {'download': 2}
+
+    async def run_all():
+        return await asyncio.gather(*(job.run(batch) for job, batch in jobs))
+
+    stats = asyncio.run(run_all())
+    assert [s['error'] for s in stats] == [6, 6]
+    assert probe.peak == 2
+    pipeline.close()
+
+
+def test_stage_limits_with_shared_pipeline_is_rejected(tmp_path):
+    pipeline = make_pipeline(ConcurrencyProbe(), {'download': 2})
+    with pytest.raises(ValueError):
+        BatchRunner(
+            fetcher=pipeline.fetcher, analyzer=pipeline.analyzer, output_path=tmp_path / 'x.jsonl',
+            stage_limits={'download': 8}, pipeline=pipeline
+        )
+    pipeline.close()
@@ -0,0 +1,54 @@
+"""
+FileStateWaiter 回归测试：查询期间调用方取消等待，不能影响其他文件
+"""
+
+import threading
+from types import SimpleNamespace
+
+from src.file_waiter import FileStateWaiter
+
+
+def make_file(name: str, state: str):
+    return SimpleNamespace(name=name, state=SimpleNamespace(name=state))
+
+
+def test_cancel_during_get_file_keeps_waiter_alive():
+    entered = threading.Event()
+    release = threading.Event()
+
+    def get_file(name):
+        if name == 'f1':
+            entered.set()
+            release.wait(5)
+        return make_file(name, 'ACTIVE')
+
+    waiter = FileStateWaiter(get_file=get_file, initial_interval=0.05, jitter=0)
+    f1 = waiter.submit(make_file('f1', 'PROCESSING'), timeout=10)
+    f2 = waiter.submit(make_file('f2', 'PROCESSING'), timeout=10)
+
+    # f1 的查询进行中时调用方取消（SSE 客户端断开 / 任务取消）
+    assert entered.wait(5)
+    assert f1.cancel()
+    release.set()
+
+    assert f2.result(timeout=5).name == 'f2'
+    assert waiter._thread.is_alive()
+
+    # 之后提交的文件仍能正常完成
+    f3 = waiter.submit(make_file('f3', 'PROCESSING'), timeout=10)
+    assert f3.result(timeout=5).name == 'f3'
+
+
+def test_poll_error_fails_only_that_file():
+    def get_file(name):
+        if name == 'bad':
+            return SimpleNamespace(name=name, state=None)  # state.name 抛出 AttributeError
+        return make_file(name, 'ACTIVE')
+
+    waiter = FileStateWaiter(get_file=get_file, initial_interval=0.05, jitter=0)
+    bad = waiter.submit(make_file('bad', 'PROCESSING'), timeout=10)
+    good = waiter.submit(make_file('good', 'PROCESSING'), timeout=10)
+
+    assert good.result(timeout=5).name == 'good'
+    assert isinstance(bad.exception(timeout=5), AttributeError)
+    assert waiter._thread.is_alive()
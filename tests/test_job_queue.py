@@ -0,0 +1,84 @@
+"""
+JobQueue 回归测试：失败、取消、命中缓存的任务各退还一次配额；报告写入存储后任务才标记为成功
+"""
+
+import asyncio
+
+from src.job_queue import JobQueue, _execute_job
+
+
+class FailingPipeline:
+    store = None
+
+    async def run(self, video_url):
+        raise RuntimeError('boom')
+
+
+class RecordingStore:
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.status_at_flush = None
+
+    def flush(self):
+        self.status_at_flush = self.queue.get(self.job_id)['status']
+        return 1
+
+
+class StoringPipeline:
+    def __init__(self, store):
+        self.store = store
+
+    async def run(self, video_url):
+        return {'metadata': {}, 'analysis': {}}
+
+
+class FakeCache:
+    def __init__(self, hit=None):
+        self.hit = hit
+
+    def get(self, *args, **kwargs):
+        return self.hit
+
+    def set(self, *args, **kwargs):
+        pass
+
+
+def test_claim_refunds_for_failed_cancelled_and_cached_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+
+    failed = queue.submit('https://www.tiktok.com/@a/video/1', username='alice', max_attempts=1)
+    job = queue.claim('w1')
+    asyncio.run(_execute_job(queue, FailingPipeline(), FakeCache(), job, 'w1', 1))
+    assert queue.get(failed['job_id'])['status'] == 'failed'
+
+    cancelled = queue.submit('https://www.tiktok.com/@a/video/2', username='bob')
+    queue.cancel(cancelled['job_id'])
+
+    queue.submit('https://www.tiktok.com/@a/video/3', username='alice')
+    job = queue.claim('w1')
+    hit = {'metadata': {}, 'analysis': {}}
+    asyncio.run(_execute_job(queue, FailingPipeline(), FakeCache(hit), job, 'w1', 1))
+    assert queue.get(job['job_id'])['status'] == 'succeeded'
+
+    assert sorted(queue.claim_refunds()) == ['alice', 'alice', 'bob']
+    assert queue.claim_refunds() == []
+
+    # 重新提交已取消的任务后，再次取消会再退还一次
+    queue.submit('https://www.tiktok.com/@a/video/2', username='bob')
+    queue.cancel(cancelled['job_id'])
+    assert queue.claim_refunds() == ['bob']
+    queue.close()
+
+
+def test_store_is_flushed_before_job_succeeds(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.submit('https://www.tiktok.com/@a/video/1', username='alice')
+    job = queue.claim('w1')
+    store = RecordingStore(queue, job['job_id'])
+
+    asyncio.run(_execute_job(queue, StoringPipeline(store), FakeCache(), job, 'w1', 1))
+
+    assert store.status_at_flush == 'running'
+    assert queue.get(job['job_id'])['status'] == 'succeeded'
+    queue.close()
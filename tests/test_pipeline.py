@@ -0,0 +1,70 @@
+"""
+AsyncVideoPipeline 回归测试：合并下载的本地文件在所有调用方结束后才删除
+"""
+
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from src.pipeline import AsyncVideoPipeline
+
+
+class FakeStore:
+    def append(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        return 0
+
+
+def make_pipeline(tmp_path):
+    downloads = []
+
+    def download(video_url, progress_hook=None):
+        time.sleep(0.05)
+        path = tmp_path / 'video.mp4'
+        path.write_bytes(b'video')
+        downloads.append(path)
+        return str(path)
+
+    analyzer = SimpleNamespace(
+        file_waiter=None, duplicate_index=None, feature_extractor=None, search_index=None,
+        analysis_mode='video', download_video_with_ytdlp=download,
+        build_analysis_prompt=lambda features: 'prompt', cleanup_temp_file=os.remove,
+    )
+    fetcher = SimpleNamespace(fetch_video_data=lambda url: {'video_url': url})
+    pipeline = AsyncVideoPipeline(fetcher, analyzer, store=FakeStore())
+
+    async def upload(video_path, on_state=None):
+        with open(video_path, 'rb') as f:
+            return f.read()
+
+    async def generate(video_file, prompt, on_section=None):
+        return {'bytes': len(video_file)}
+
+    pipeline.upload = upload
+    pipeline.generate = generate
+    return pipeline, downloads
+
+
+def test_coalesced_runs_share_the_download_until_the_last_one_finishes(tmp_path):
+    pipeline, downloads = make_pipeline(tmp_path)
+    url = 'https://www.tiktok.com/@a/video/1'
+
+    async def scenario():
+        late_metadata = asyncio.get_running_loop().create_future()
+        first = asyncio.ensure_future(pipeline.run(url, metadata={'video_url': url}))
+        # 第二个调用方加入同一次下载，但元数据晚到：第一个调用方结束时它还没用到文件
+        second = asyncio.ensure_future(pipeline.run(url, metadata=late_metadata))
+        first_result = await first
+        assert os.path.exists(downloads[0])
+        late_metadata.set_result({'video_url': url})
+        return first_result, await second
+
+    first, second = asyncio.run(scenario())
+    assert len(downloads) == 1
+    assert first['analysis'] == second['analysis'] == {'bytes': 5}
+    assert not os.path.exists(downloads[0])
+    assert pipeline._video_refs == {}
+    pipeline.close()
@@ -0,0 +1,36 @@
+"""
+多进程共用配额 / 上游预算的回归测试（用同一数据库文件上的多个实例模拟多个进程）
+"""
+
+from src.rate_limiter import QuotaStore, UpstreamLimiter
+
+
+def test_quota_stores_sharing_a_database_add_up(tmp_path):
+    db_path = str(tmp_path / 'quota.sqlite3')
+    first = QuotaStore(db_path, flush_interval=60)
+    second = QuotaStore(db_path, flush_interval=60)
+
+    first.consume('alice', 3)
+    second.consume('alice', 2)
+    second.refund('alice')
+    first.flush()
+    second.flush()
+    first.flush()
+
+    assert first.used('alice') == 4
+    assert second.used('alice') == 4
+    first.close()
+    second.close()
+    assert QuotaStore(db_path).used('alice') == 4
+
+
+def test_upstream_limiters_share_one_budget(tmp_path):
+    db_path = str(tmp_path / 'upstream.sqlite3')
+    first = UpstreamLimiter({'gemini': 60}, db_path=db_path)
+    second = UpstreamLimiter({'gemini': 60}, db_path=db_path)
+
+    # 桶容量为 1：一个进程取走令牌后，另一个进程需要等待补充
+    assert first._bucket('gemini').try_acquire()[0]
+    ok, wait = second._bucket('gemini').try_acquire()
+    assert not ok
+    assert 0 < wait <= 1
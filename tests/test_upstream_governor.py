@@ -0,0 +1,54 @@
+"""
+UpstreamGovernor 回归测试：半开状态的探测请求被取消或以 BaseException 结束时，必须释放探测名额
+"""
+
+import asyncio
+
+import pytest
+
+from src.upstream_governor import CircuitBreaker, UpstreamGovernor
+
+
+class ScriptInterrupted(BaseException):
+    """模拟 Streamlit 的 ScriptControlException（BaseException 子类）"""
+
+
+def half_open_governor() -> UpstreamGovernor:
+    governor = UpstreamGovernor('test', max_concurrency=4, max_retries=0)
+    governor.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    governor.breaker.on_failure()
+    return governor
+
+
+def test_cancelled_probe_releases_half_open_circuit():
+    governor = half_open_governor()
+
+    async def scenario():
+        probe = asyncio.ensure_future(governor.call_async(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.05)
+        assert governor.breaker._probing
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok():
+            return 'ok'
+        return await governor.call_async(ok)
+
+    assert asyncio.run(scenario()) == 'ok'
+    assert governor.breaker.state == CircuitBreaker.CLOSED
+    assert governor.limiter.in_flight == 0
+
+
+def test_base_exception_in_probe_releases_half_open_circuit():
+    governor = half_open_governor()
+
+    def interrupted():
+        raise ScriptInterrupted()
+
+    with pytest.raises(ScriptInterrupted):
+        governor.call(interrupted)
+    assert not governor.breaker._probing
+
+    assert governor.call(lambda: 'ok') == 'ok'
+    assert governor.breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,42 @@
+"""
+VideoPreprocessor 回归测试：超出预算时不淘汰最近访问过（可能正在上传）的预处理文件
+"""
+
+import os
+import time
+
+from src.remote_file_registry import file_content_hash
+from src.video_preprocess import PRESETS, VideoPreprocessor
+
+
+def write(path, size, age):
+    path.write_bytes(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evict_spares_recently_accessed_files(tmp_path):
+    preprocessor = VideoPreprocessor(PRESETS['fast'], cache_dir=str(tmp_path), max_bytes=100, protect_seconds=60)
+    old = write(tmp_path / 'old.mp4', 100, age=3600)
+    uploading = write(tmp_path / 'uploading.mp4', 100, age=5)
+    newest = write(tmp_path / 'newest.mp4', 100, age=1)
+
+    assert preprocessor.evict(keep=newest) == 1
+    assert not old.exists()
+    assert uploading.exists() and newest.exists()
+
+
+def test_cache_hit_refreshes_access_time_before_eviction(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    preprocessor = VideoPreprocessor(PRESETS['fast'], cache_dir=str(cache_dir), max_bytes=100, protect_seconds=60)
+    source = tmp_path / 'source.mp4'
+    source.write_bytes(b'source video')
+    key = f"{file_content_hash(str(source))[:32]}-{preprocessor.preset.signature()}"
+    cached = write(cache_dir / f'{key}.mp4', 100, age=3600)
+    other = write(cache_dir / 'other.mp4', 100, age=1800)
+
+    assert preprocessor.process(str(source)) == str(cached)
+    assert preprocessor.evict() == 1
+    assert cached.exists()
+    assert not other.exists()